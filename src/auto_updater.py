@@ -6,6 +6,8 @@ import threading
 import time
 from pathlib import Path
 
+from core import metrics
+
 
 class AutoUpdater:
     def __init__(
@@ -105,7 +107,11 @@ class AutoUpdater:
                 time.sleep(1)
             if self._stop.is_set():
                 return
-            self._update_once()
+            started = time.perf_counter()
+            try:
+                self._update_once()
+            finally:
+                metrics.UPDATER_RUN.observe(time.perf_counter() - started, "hub")
 
     def start(self):
         if not self._check_env():
@@ -0,0 +1,196 @@
+from __future__ import annotations
+
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+_BATCH_MAX = 512
+_FLUSH_INTERVAL = 0.5
+
+
+class RotatingFile:
+    # Arquivo em append (bytes) com rotacao por tamanho e/ou idade e numero limitado de
+    # arquivos antigos: nome.log -> nome.log.1 -> nome.log.2 ...
+    def __init__(self, path: Path, max_bytes: int = 10 * 1024 * 1024, max_age_seconds: float = 0.0, backups: int = 5):
+        self.path = Path(path)
+        self.max_bytes = max(0, int(max_bytes))
+        self.max_age_seconds = max(0.0, float(max_age_seconds))
+        self.backups = max(0, int(backups))
+        self.rotations = 0
+        self._file = None
+        self._size = 0
+        self._opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def write(self, data: bytes) -> None:
+        with self._lock:
+            self._rotate_if_needed(len(data))
+            if self._file is None:
+                self._open()
+            try:
+                self._file.write(data)
+                self._file.flush()
+            except Exception:
+                # Disco cheio/arquivo travado: reabre na proxima escrita.
+                self._close()
+                raise
+            self._size += len(data)
+
+    def close(self) -> None:
+        with self._lock:
+            self._close()
+
+    def _open(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        now = time.time()
+        try:
+            st = self.path.stat()
+        except OSError:
+            st = None
+        # Arquivo de uma execucao anterior ja vencido: comeca um novo.
+        if st is not None and st.st_size and self.max_age_seconds and now - st.st_mtime > self.max_age_seconds:
+            self._shift_backups()
+            st = None
+        self._file = self.path.open("ab")
+        self._size = st.st_size if st is not None else 0
+        self._opened_at = now
+
+    def _close(self) -> None:
+        f, self._file = self._file, None
+        if f is not None:
+            try:
+                f.close()
+            except Exception:
+                pass
+
+    def _rotate_if_needed(self, incoming: int) -> None:
+        if self._file is None or not self._size:
+            return
+        too_big = self.max_bytes and self._size + incoming > self.max_bytes
+        too_old = self.max_age_seconds and time.time() - self._opened_at >= self.max_age_seconds
+        if not (too_big or too_old):
+            return
+        self._close()
+        self._shift_backups()
+
+    def _shift_backups(self) -> None:
+        # O que passar de `backups` e apagado.
+        self.rotations += 1
+        if self.backups <= 0:
+            try:
+                self.path.unlink()
+            except OSError:
+                pass
+            return
+        for i in range(self.backups, 0, -1):
+            src = self.path if i == 1 else self.path.with_name(f"{self.path.name}.{i - 1}")
+            dst = self.path.with_name(f"{self.path.name}.{i}")
+            try:
+                if src.exists():
+                    os.replace(src, dst)
+            except OSError:
+                pass
+
+
+class DiagLogger:
+    # Log de diagnostico fora do caminho das requisicoes: log() so enfileira (nunca bloqueia);
+    # uma thread escreve em lotes com o arquivo sempre aberto e faz a rotacao.
+    # Fila cheia: a mensagem e descartada e contada em vez de segurar a thread que chamou.
+    def __init__(
+        self,
+        path: Path,
+        max_bytes: int = 10 * 1024 * 1024,
+        max_age_seconds: float = 86400.0,
+        backups: int = 5,
+        echo: bool = True,
+        queue_size: int = 10000,
+        name: str = "hub-diaglog",
+    ):
+        self.path = Path(path)
+        self.echo = bool(echo)
+        self._out = RotatingFile(self.path, max_bytes, max_age_seconds, backups)
+        self._queue: queue.Queue[tuple[float, str] | None] = queue.Queue(maxsize=max(1, int(queue_size)))
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._name = name
+        self._lock = threading.Lock()
+        self._counters = {"written": 0, "dropped": 0, "write_errors": 0}
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True, name=self._name)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        # Esvazia a fila antes de fechar o arquivo.
+        self._stop.set()
+        try:
+            # Acorda a thread na hora; com a fila cheia ela ve o stop ao esvazia-la.
+            self._queue.put_nowait(None)
+        except queue.Full:
+            pass
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        self._out.close()
+
+    def log(self, message: str) -> bool:
+        try:
+            self._queue.put_nowait((time.time(), str(message)))
+            return True
+        except queue.Full:
+            with self._lock:
+                self._counters["dropped"] += 1
+            return False
+
+    def stats(self) -> dict:
+        with self._lock:
+            out = dict(self._counters)
+        out["rotations"] = self._out.rotations
+        out["queued"] = self._queue.qsize()
+        return out
+
+    def _count(self, name: str, amount: int = 1) -> None:
+        with self._lock:
+            self._counters[name] += amount
+
+    def _run(self) -> None:
+        while True:
+            try:
+                batch = [self._queue.get(timeout=_FLUSH_INTERVAL)]
+            except queue.Empty:
+                if self._stop.is_set():
+                    return
+                continue
+            while len(batch) < _BATCH_MAX:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            batch = [item for item in batch if item is not None]
+            if batch:
+                self._write_batch(batch)
+            if self._stop.is_set() and self._queue.empty():
+                return
+
+    def _write_batch(self, batch: list[tuple[float, str]]) -> None:
+        lines = [f"[{datetime.fromtimestamp(ts).strftime('%Y-%m-%d %H:%M:%S')}] {message}" for ts, message in batch]
+        if self.echo:
+            for line in lines:
+                try:
+                    print(line)
+                except Exception:
+                    pass
+        data = ("\n".join(lines) + "\n").encode("utf-8")
+        try:
+            self._out.write(data)
+        except Exception:
+            # Perde o lote; o arquivo e reaberto no proximo.
+            self._count("write_errors")
+            return
+        self._count("written", len(lines))
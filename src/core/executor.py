@@ -0,0 +1,279 @@
+from __future__ import annotations
+
+import importlib
+import itertools
+import multiprocessing
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Callable
+
+from core.scheduler import DeadlineScheduler
+
+# Funcao de ciclo por tipo de instancia, como "modulo:funcao". No modo processo o filho
+# importa pelo nome, entao tem que ser funcao de modulo (nada de lambda/closure).
+CYCLE_TARGETS = {
+    "financeiro": "core.executor:placeholder_cycle",
+    "botana": "core.executor:placeholder_cycle",
+}
+
+
+def placeholder_cycle(config: dict, manual: bool) -> str:
+    # Placeholder da Fase 1: aqui sera acoplado adapter financeiro/botana.
+    time.sleep(1)
+    return "Ciclo finalizado com sucesso"
+
+
+def resolve_target(target: str) -> Callable[[dict, bool], str]:
+    module, _, name = target.partition(":")
+    return getattr(importlib.import_module(module), name)
+
+
+def _process_main(conn, target: str, config: dict, manual: bool) -> None:
+    try:
+        detail = resolve_target(target)(config, manual)
+        conn.send(("ok", str(detail or "")))
+    except BaseException as exc:
+        conn.send(("error", str(exc) or type(exc).__name__))
+    finally:
+        conn.close()
+
+
+@dataclass
+class CycleResult:
+    # outcome: ok | error | timeout | cancelled
+    outcome: str
+    detail: str
+    duration: float
+
+
+class _Job:
+    __slots__ = ("token", "key", "instance_type", "config", "manual", "on_start", "on_done", "started", "proc", "finished", "lock")
+
+    def __init__(self, token, key, instance_type, config, manual, on_start, on_done):
+        self.token = token
+        self.key = key
+        self.instance_type = instance_type
+        self.config = config
+        self.manual = manual
+        self.on_start = on_start
+        self.on_done = on_done
+        self.started = 0.0
+        self.proc = None
+        self.finished = False
+        self.lock = threading.Lock()
+
+    def claim(self) -> bool:
+        # Quem chegar primeiro (fim normal, timeout ou cancelamento) entrega o resultado.
+        with self.lock:
+            if self.finished:
+                return False
+            self.finished = True
+            return True
+
+
+def run_inline(instance_type: str, config: dict, manual: bool) -> CycleResult:
+    started = time.monotonic()
+    try:
+        detail = resolve_target(CYCLE_TARGETS.get(instance_type, CYCLE_TARGETS["financeiro"]))(config, manual)
+        return CycleResult("ok", str(detail or ""), time.monotonic() - started)
+    except Exception as exc:
+        return CycleResult("error", str(exc) or type(exc).__name__, time.monotonic() - started)
+
+
+class CycleExecutor:
+    # Executa os ciclos das instancias fora da thread do scheduler, com teto global
+    # (max_workers) e teto por instance_type. Modo "thread": roda no pool, dividindo o GIL
+    # com o proxy. Modo "process": um processo (spawn) por ciclo, em outro nucleo; timeout e
+    # cancelamento matam o processo.
+    # No modo thread nao da para matar: o resultado sai na hora como timeout/cancelado, mas a
+    # vaga so e liberada quando a funcao de fato retorna, e o proximo ciclo da mesma instancia
+    # espera na fila ate la (nunca dois ciclos da mesma instancia ao mesmo tempo).
+    def __init__(
+        self,
+        mode: str = "thread",
+        max_workers: int = 8,
+        type_limits: dict[str, int] | None = None,
+        timeout: float = 0.0,
+    ):
+        self.mode = "process" if mode == "process" else "thread"
+        self.max_workers = max(1, int(max_workers))
+        self.type_limits = {str(k): max(1, int(v)) for k, v in (type_limits or {}).items()}
+        self.timeout = max(0.0, float(timeout))
+        self._runners = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="inst-cycle")
+        self._ctx = multiprocessing.get_context("spawn")
+        self._watchdog = DeadlineScheduler(self._on_timeout, name="hub-cycle-watchdog")
+        self._watchdog.start()
+        self._lock = threading.Lock()
+        self._seq = itertools.count(1)
+        self._pending: deque[_Job] = deque()
+        self._active: dict[str, _Job] = {}
+        self._jobs: dict[str, _Job] = {}
+        self._busy = 0
+        self._busy_by_type: dict[str, int] = {}
+        self._closed = False
+        self._counters = {"submitted": 0, "ok": 0, "error": 0, "timeout": 0, "cancelled": 0, "killed": 0}
+
+    def submit(
+        self,
+        key: str,
+        instance_type: str,
+        config: dict,
+        manual: bool,
+        on_start: Callable[[], None],
+        on_done: Callable[[CycleResult], None],
+    ) -> bool:
+        with self._lock:
+            if self._closed:
+                return False
+            job = _Job(f"{key}#{next(self._seq)}", key, instance_type, config, manual, on_start, on_done)
+            self._pending.append(job)
+            self._counters["submitted"] += 1
+            ready = self._take_ready_locked()
+        self._launch(ready)
+        return True
+
+    def cancel(self, key: str) -> bool:
+        with self._lock:
+            job = next((j for j in self._pending if j.key == key), None)
+            if job is not None:
+                self._pending.remove(job)
+            else:
+                job = self._active.get(key)
+        if job is None:
+            return False
+        return self._abort(job, "cancelled", "Ciclo cancelado")
+
+    def shutdown(self) -> None:
+        with self._lock:
+            self._closed = True
+            jobs = list(self._pending) + list(self._active.values())
+            self._pending.clear()
+        for job in jobs:
+            self._abort(job, "cancelled", "Ciclo cancelado")
+        self._watchdog.stop()
+        self._runners.shutdown(wait=False)
+
+    def stats(self) -> dict:
+        with self._lock:
+            out = dict(self._counters)
+            out["mode"] = self.mode
+            out["running"] = self._busy
+            out["pending"] = len(self._pending)
+            out["running_by_type"] = {k: v for k, v in self._busy_by_type.items() if v}
+            # Ja entregues (timeout/cancelado) mas com a funcao ainda rodando (modo thread).
+            out["overrunning"] = sum(1 for job in self._active.values() if job.finished)
+        return out
+
+    def _take_ready_locked(self) -> list[_Job]:
+        # FIFO, pulando tipos que ja estao no teto: um tipo lotado nao segura os outros.
+        ready: list[_Job] = []
+        waiting: deque[_Job] = deque()
+        while self._pending:
+            job = self._pending.popleft()
+            limit = self.type_limits.get(job.instance_type, self.max_workers)
+            if (
+                self._busy >= self.max_workers
+                or self._busy_by_type.get(job.instance_type, 0) >= limit
+                or job.key in self._active
+            ):
+                waiting.append(job)
+                continue
+            self._busy += 1
+            self._busy_by_type[job.instance_type] = self._busy_by_type.get(job.instance_type, 0) + 1
+            self._active[job.key] = job
+            self._jobs[job.token] = job
+            ready.append(job)
+        self._pending = waiting
+        return ready
+
+    def _launch(self, jobs: list[_Job]) -> None:
+        for job in jobs:
+            self._runners.submit(self._run, job)
+
+    def _run(self, job: _Job) -> None:
+        outcome, detail = "cancelled", "Ciclo cancelado"
+        try:
+            if job.finished:
+                return
+            job.started = time.monotonic()
+            if self.timeout:
+                self._watchdog.schedule(job.token, self.timeout)
+            job.on_start()
+            target = CYCLE_TARGETS.get(job.instance_type, CYCLE_TARGETS["financeiro"])
+            if self.mode == "process":
+                outcome, detail = self._run_process(job, target)
+            else:
+                outcome, detail = "ok", str(resolve_target(target)(job.config, job.manual) or "")
+        except Exception as exc:
+            outcome, detail = "error", str(exc) or type(exc).__name__
+        finally:
+            self._watchdog.cancel(job.token)
+            self._deliver(job, outcome, detail)
+            self._release(job)
+
+    def _run_process(self, job: _Job, target: str) -> tuple[str, str]:
+        reader, writer = self._ctx.Pipe(duplex=False)
+        proc = self._ctx.Process(
+            target=_process_main,
+            args=(writer, target, job.config, job.manual),
+            daemon=True,
+            name=f"hub-cycle-{job.key}",
+        )
+        with job.lock:
+            if job.finished:
+                reader.close()
+                writer.close()
+                return "cancelled", "Ciclo cancelado"
+            job.proc = proc
+            proc.start()
+        writer.close()
+        try:
+            # EOF quando o processo sai sem responder (terminate/crash).
+            return reader.recv()
+        except EOFError:
+            proc.join(5)
+            return "error", f"Processo do ciclo terminou sem resultado (codigo {proc.exitcode})"
+        finally:
+            reader.close()
+            proc.join(5)
+
+    def _on_timeout(self, token: str) -> None:
+        with self._lock:
+            job = self._jobs.get(token)
+        if job is not None:
+            self._abort(job, "timeout", f"Tempo limite do ciclo excedido ({self.timeout:g}s)")
+
+    def _abort(self, job: _Job, outcome: str, detail: str) -> bool:
+        if not self._deliver(job, outcome, detail):
+            return False
+        with job.lock:
+            proc = job.proc
+        if proc is not None and proc.is_alive():
+            proc.terminate()
+            self._count("killed")
+        return True
+
+    def _deliver(self, job: _Job, outcome: str, detail: str) -> bool:
+        if not job.claim():
+            return False
+        self._count(outcome)
+        duration = time.monotonic() - job.started if job.started else 0.0
+        job.on_done(CycleResult(outcome, detail, duration))
+        return True
+
+    def _release(self, job: _Job) -> None:
+        with self._lock:
+            self._busy -= 1
+            self._busy_by_type[job.instance_type] -= 1
+            self._jobs.pop(job.token, None)
+            if self._active.get(job.key) is job:
+                del self._active[job.key]
+            ready = [] if self._closed else self._take_ready_locked()
+        self._launch(ready)
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._counters[name] += 1
@@ -0,0 +1,67 @@
+from __future__ import annotations
+
+import os
+import signal
+import subprocess
+from pathlib import Path
+
+# Codigo devolvido quando o git estoura o tempo (mesmo do `timeout` do coreutils).
+TIMEOUT_CODE = 124
+
+
+def _kill_tree(proc: subprocess.Popen) -> None:
+    # fetch/ls-remote abrem git-remote-https/ssh como filhos: matar so o git deixa o filho
+    # segurando o pipe e o communicate() nao retorna.
+    try:
+        if os.name == "nt":
+            subprocess.run(
+                ["taskkill", "/F", "/T", "/PID", str(proc.pid)],
+                capture_output=True,
+                check=False,
+                timeout=10,
+            )
+        else:
+            os.killpg(proc.pid, signal.SIGKILL)
+    except Exception:
+        pass
+    try:
+        proc.kill()
+    except Exception:
+        pass
+
+
+def run_git(repo_dir: Path, *args: str, timeout: float = 0.0) -> tuple[int, str]:
+    env = os.environ.copy()
+    env["GIT_TERMINAL_PROMPT"] = "0"
+    kwargs: dict = {}
+    if os.name == "nt":
+        kwargs["creationflags"] = subprocess.CREATE_NEW_PROCESS_GROUP
+    else:
+        kwargs["start_new_session"] = True
+    try:
+        proc = subprocess.Popen(
+            ["git", *args],
+            cwd=str(repo_dir),
+            text=True,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            env=env,
+            **kwargs,
+        )
+    except Exception as exc:
+        return 1, str(exc)
+    try:
+        stdout, stderr = proc.communicate(timeout=timeout if timeout > 0 else None)
+    except subprocess.TimeoutExpired:
+        _kill_tree(proc)
+        try:
+            proc.communicate(timeout=5)
+        except Exception:
+            pass
+        return TIMEOUT_CODE, f"git {args[0] if args else ''} excedeu {timeout:g}s e foi encerrado"
+    except Exception as exc:
+        _kill_tree(proc)
+        return 1, str(exc)
+    out = (stdout or stderr or "").strip()
+    return proc.returncode, out
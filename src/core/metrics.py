@@ -0,0 +1,291 @@
+from __future__ import annotations
+
+import bisect
+import itertools
+import threading
+from typing import Callable
+
+
+# Contadores/histogramas com lock por faixa: cada thread escreve sempre na mesma faixa,
+# entao threads diferentes quase nunca disputam o mesmo lock. A leitura (scrape) soma as faixas.
+_STRIPES = 16
+_stripe_ids = itertools.count()
+_local = threading.local()
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _stripe_index() -> int:
+    idx = getattr(_local, "stripe", None)
+    if idx is None:
+        idx = _local.stripe = next(_stripe_ids) % _STRIPES
+    return idx
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: tuple[str, ...], values: tuple, extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _number(value: float) -> str:
+    if value == int(value):
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+
+    def _header(self) -> list[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+    def render(self) -> list[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labelnames: tuple[str, ...] = ()):
+        super().__init__(name, help_text, labelnames)
+        self._stripes = [(threading.Lock(), {}) for _ in range(_STRIPES)]
+
+    def inc(self, *labels, amount: float = 1.0) -> None:
+        lock, values = self._stripes[_stripe_index()]
+        with lock:
+            values[labels] = values.get(labels, 0.0) + amount
+
+    def collect(self) -> dict[tuple, float]:
+        out: dict[tuple, float] = {}
+        for lock, values in self._stripes:
+            with lock:
+                for labels, value in values.items():
+                    out[labels] = out.get(labels, 0.0) + value
+        return out
+
+    def render(self) -> list[str]:
+        lines = self._header()
+        for labels, value in sorted(self.collect().items()):
+            lines.append(f"{self.name}{_labels(self.labelnames, labels)} {_number(value)}")
+        return lines
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labelnames: tuple[str, ...] = (), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(float(b) for b in buckets))
+        self._stripes = [(threading.Lock(), {}) for _ in range(_STRIPES)]
+
+    def observe(self, value: float, *labels) -> None:
+        # Contagem por faixa nao cumulativa ([..., +Inf, soma]); acumulada so no scrape.
+        idx = bisect.bisect_left(self.buckets, value)
+        lock, series = self._stripes[_stripe_index()]
+        with lock:
+            row = series.get(labels)
+            if row is None:
+                row = series[labels] = [0.0] * (len(self.buckets) + 2)
+            row[idx] += 1
+            row[-1] += value
+
+    def collect(self) -> dict[tuple, list[float]]:
+        out: dict[tuple, list[float]] = {}
+        for lock, series in self._stripes:
+            with lock:
+                for labels, row in series.items():
+                    acc = out.setdefault(labels, [0.0] * len(row))
+                    for i, v in enumerate(row):
+                        acc[i] += v
+        return out
+
+    def render(self) -> list[str]:
+        lines = self._header()
+        bounds = [_number(b) for b in self.buckets] + ["+Inf"]
+        for labels, row in sorted(self.collect().items()):
+            cumulative = 0.0
+            for bound, count in zip(bounds, row):
+                cumulative += count
+                le = _labels(self.labelnames, labels, 'le="' + bound + '"')
+                lines.append(f"{self.name}_bucket{le} {_number(cumulative)}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {_number(row[-1])}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {_number(cumulative)}")
+        return lines
+
+
+class Gauge(_Metric):
+    # Valor lido no scrape por uma funcao: sem custo no caminho das requisicoes.
+    # A funcao retorna um numero (sem labels) ou {labels: valor}.
+    kind = "gauge"
+
+    def __init__(self, name: str, help_text: str, labelnames: tuple[str, ...] = ()):
+        super().__init__(name, help_text, labelnames)
+        self._fn: Callable[[], float | dict[tuple, float]] | None = None
+
+    def set_function(self, fn: Callable[[], float | dict[tuple, float]] | None) -> None:
+        self._fn = fn
+
+    def render(self) -> list[str]:
+        if self._fn is None:
+            return []
+        try:
+            value = self._fn()
+        except Exception:
+            return []
+        lines = self._header()
+        series = value if isinstance(value, dict) else {(): value}
+        for labels, v in sorted(series.items()):
+            lines.append(f"{self.name}{_labels(self.labelnames, labels)} {_number(float(v))}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            # Mesmo nome registrado de novo (reimport/testes) devolve a metrica existente.
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name: str, help_text: str, labelnames: tuple[str, ...] = ()) -> Counter:
+        return self._register(Counter(name, help_text, labelnames))
+
+    def histogram(self, name: str, help_text: str, labelnames: tuple[str, ...] = (), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help_text, labelnames, buckets))
+
+    def gauge(self, name: str, help_text: str, labelnames: tuple[str, ...] = ()) -> Gauge:
+        return self._register(Gauge(name, help_text, labelnames))
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines: list[str] = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+class CountingReader:
+    # Envolve rfile/wfile do handler contando bytes; o resto e repassado ao objeto original.
+    __slots__ = ("_raw", "count")
+
+    def __init__(self, raw):
+        self._raw = raw
+        self.count = 0
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
+    def read(self, *args):
+        data = self._raw.read(*args)
+        self.count += len(data)
+        return data
+
+    def readline(self, *args):
+        data = self._raw.readline(*args)
+        self.count += len(data)
+        return data
+
+    def read1(self, *args):
+        data = self._raw.read1(*args)
+        self.count += len(data)
+        return data
+
+
+class CountingWriter:
+    __slots__ = ("_raw", "count")
+
+    def __init__(self, raw):
+        self._raw = raw
+        self.count = 0
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
+    def write(self, data):
+        self.count += len(data)
+        return self._raw.write(data)
+
+
+class AsyncCountingReader:
+    __slots__ = ("_raw", "count")
+
+    def __init__(self, raw):
+        self._raw = raw
+        self.count = 0
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
+    async def read(self, *args):
+        data = await self._raw.read(*args)
+        self.count += len(data)
+        return data
+
+    async def readline(self):
+        data = await self._raw.readline()
+        self.count += len(data)
+        return data
+
+    async def readexactly(self, n):
+        data = await self._raw.readexactly(n)
+        self.count += len(data)
+        return data
+
+    async def readuntil(self, *args):
+        data = await self._raw.readuntil(*args)
+        self.count += len(data)
+        return data
+
+
+REGISTRY = MetricsRegistry()
+
+HTTP_REQUESTS = REGISTRY.counter("hub_http_requests_total", "Requisicoes atendidas pelo hub", ("route", "status"))
+HTTP_DURATION = REGISTRY.histogram(
+    "hub_http_request_duration_seconds", "Tempo total de cada requisicao no hub", ("route", "status")
+)
+HTTP_BYTES_IN = REGISTRY.counter("hub_http_received_bytes_total", "Bytes lidos dos clientes (cabecalho + corpo)", ("route",))
+HTTP_BYTES_OUT = REGISTRY.counter("hub_http_sent_bytes_total", "Bytes enviados aos clientes (cabecalho + corpo)", ("route",))
+UPSTREAM_CONNECT = REGISTRY.histogram("hub_upstream_connect_seconds", "Tempo para abrir conexao com o backend", ("backend",))
+UPSTREAM_TTFB = REGISTRY.histogram(
+    "hub_upstream_ttfb_seconds", "Do envio da requisicao ao cabecalho da resposta do backend", ("backend",)
+)
+UPSTREAM_TOTAL = REGISTRY.histogram(
+    "hub_upstream_total_seconds", "Do envio da requisicao ao fim do corpo da resposta do backend", ("backend",)
+)
+REWRITE_DURATION = REGISTRY.histogram(
+    "hub_rewrite_duration_seconds",
+    "Tempo do rewrite de prefixo em corpos bufferizados (falta no cache)",
+    ("prefix",),
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0),
+)
+REWRITE_BYTES = REGISTRY.counter("hub_rewrite_bytes_total", "Bytes processados pelo rewrite", ("prefix", "direction"))
+ACTIVE_HANDLERS = REGISTRY.gauge("hub_active_handlers", "Workers ocupados (threaded) ou conexoes abertas (asyncio)")
+BACKEND_UP = REGISTRY.gauge("hub_backend_up", "Backend respondendo segundo o monitor de saude (1/0)", ("instance",))
+BACKEND_PROCESS = REGISTRY.gauge("hub_backend_process_running", "Processo do backend iniciado pelo hub vivo (1/0)", ("instance",))
+UPDATER_RUN = REGISTRY.histogram(
+    "hub_updater_run_seconds",
+    "Duracao de cada verificacao/atualizacao via git",
+    ("target",),
+    buckets=(0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0),
+)
+UPDATER_OUTCOME = REGISTRY.counter(
+    "hub_updater_outcomes_total",
+    "Resultado de cada verificacao de repo de instancia (current, updated, failed, timeout...)",
+    ("target", "outcome"),
+)
@@ -0,0 +1,127 @@
+from __future__ import annotations
+
+import threading
+from collections import deque
+from pathlib import Path
+from typing import Callable
+
+from core.diaglog import RotatingFile
+
+# Linha sem \n (barra de progresso, binario) e cortada neste tamanho.
+_MAX_LINE = 64 * 1024
+
+
+class LogTail:
+    # Ultimas linhas de saida de um backend, em memoria e numeradas: `version` e o numero da
+    # ultima linha, entao "o que chegou depois de N" funciona como no StatusFeed.
+    def __init__(self, max_lines: int = 1000):
+        self._lines: deque[tuple[int, str, str]] = deque(maxlen=max(1, int(max_lines)))
+        self._version = 0
+        self._cond = threading.Condition()
+        self._listeners: list[Callable[[int], None]] = []
+
+    @property
+    def version(self) -> int:
+        return self._version
+
+    def append(self, stream: str, text: str) -> None:
+        with self._cond:
+            self._version += 1
+            self._lines.append((self._version, stream, text))
+            version = self._version
+            listeners = list(self._listeners)
+            self._cond.notify_all()
+        for listener in listeners:
+            listener(version)
+
+    def lines(self, since: int = 0, limit: int = 0) -> list[tuple[int, str, str]]:
+        with self._cond:
+            if since >= self._version:
+                return []
+            out = [item for item in self._lines if item[0] > since] if since > 0 else list(self._lines)
+        return out[-limit:] if limit > 0 else out
+
+    def wait(self, since: int, timeout: float) -> int:
+        with self._cond:
+            self._cond.wait_for(lambda: self._version > since, timeout)
+            return self._version
+
+    def add_listener(self, listener: Callable[[int], None]) -> None:
+        with self._cond:
+            self._listeners.append(listener)
+
+    def remove_listener(self, listener: Callable[[int], None]) -> None:
+        with self._cond:
+            try:
+                self._listeners.remove(listener)
+            except ValueError:
+                pass
+
+
+class BackendOutput:
+    # stdout/stderr dos backends iniciados pelo hub chegam por pipe; uma thread por pipe grava
+    # cada linha no arquivo rotativo da instancia e no LogTail em memoria. O LogTail e os
+    # arquivos continuam os mesmos quando o processo e reiniciado.
+    def __init__(self, max_bytes: int = 10 * 1024 * 1024, backups: int = 3, tail_lines: int = 1000):
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.tail_lines = tail_lines
+        self._tails: dict[str, LogTail] = {}
+        self._sinks: dict[Path, RotatingFile] = {}
+        self._lock = threading.Lock()
+        self._counters = {"lines": 0, "bytes": 0, "write_errors": 0}
+
+    def tail(self, key: str) -> LogTail:
+        with self._lock:
+            tail = self._tails.get(key)
+            if tail is None:
+                tail = self._tails[key] = LogTail(self.tail_lines)
+            return tail
+
+    def _sink(self, path: Path) -> RotatingFile:
+        with self._lock:
+            sink = self._sinks.get(path)
+            if sink is None:
+                sink = self._sinks[path] = RotatingFile(path, self.max_bytes, backups=self.backups)
+            return sink
+
+    def attach(self, key: str, proc, out_path: Path, err_path: Path) -> None:
+        tail = self.tail(key)
+        for stream, pipe, path in (("stdout", proc.stdout, out_path), ("stderr", proc.stderr, err_path)):
+            if pipe is None:
+                continue
+            threading.Thread(
+                target=self._pump,
+                args=(pipe, stream, self._sink(path), tail),
+                daemon=True,
+                name=f"hub-output-{key}-{stream}",
+            ).start()
+
+    def _pump(self, pipe, stream: str, sink: RotatingFile, tail: LogTail) -> None:
+        # Termina sozinha no EOF, quando o processo sai.
+        with pipe:
+            for raw in iter(lambda: pipe.readline(_MAX_LINE), b""):
+                try:
+                    sink.write(raw)
+                except Exception:
+                    self._count("write_errors")
+                tail.append(stream, raw.decode("utf-8", "replace").rstrip("\r\n"))
+                with self._lock:
+                    self._counters["lines"] += 1
+                    self._counters["bytes"] += len(raw)
+
+    def _count(self, name: str, amount: int = 1) -> None:
+        with self._lock:
+            self._counters[name] += amount
+
+    def stats(self) -> dict:
+        with self._lock:
+            out = dict(self._counters)
+            out["rotations"] = sum(sink.rotations for sink in self._sinks.values())
+        return out
+
+    def close(self) -> None:
+        with self._lock:
+            sinks = list(self._sinks.values())
+        for sink in sinks:
+            sink.close()
@@ -1,40 +1,207 @@
 from __future__ import annotations
 
+import random
 import threading
 import time
+from dataclasses import asdict
 from datetime import datetime
+from typing import Callable
 
+from core.executor import CycleExecutor, CycleResult, run_inline
+from core.scheduler import DeadlineScheduler
 from instances.models import InstanceConfig, RuntimeState
 
+# Teto (segundos) do espalhamento do primeiro ciclo quando o hub sobe.
+_FIRST_RUN_SPREAD = 5.0
+
+
+class StatusFeed:
+    # Versao global monotona do estado das instancias. Cada mudanca publicada gera uma
+    # versao nova; paineis pedem "o que mudou desde N" em vez de reler tudo.
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._version = 0
+        self._changed: dict[str, int] = {}
+        self._listeners: list[Callable[[int], None]] = []
+
+    @property
+    def version(self) -> int:
+        return self._version
+
+    def bump(self, instance_id: str) -> int:
+        with self._cond:
+            self._version += 1
+            self._changed[instance_id] = self._version
+            version = self._version
+            listeners = list(self._listeners)
+            self._cond.notify_all()
+        for listener in listeners:
+            listener(version)
+        return version
+
+    def changed_since(self, since: int) -> tuple[int, list[str]]:
+        with self._cond:
+            return self._version, [iid for iid, v in self._changed.items() if v > since]
+
+    def wait(self, since: int, timeout: float) -> int:
+        with self._cond:
+            self._cond.wait_for(lambda: self._version > since, timeout)
+            return self._version
+
+    def add_listener(self, listener: Callable[[int], None]) -> None:
+        # Para quem nao pode bloquear em wait() (event loop): chamado fora do lock a cada versao.
+        with self._cond:
+            self._listeners.append(listener)
+
+    def remove_listener(self, listener: Callable[[int], None]) -> None:
+        with self._cond:
+            try:
+                self._listeners.remove(listener)
+            except ValueError:
+                pass
+
 
 class InstanceWorker:
-    def __init__(self, config: InstanceConfig):
+    # Sem thread propria: o DeadlineScheduler do manager dispara fire() no prazo e o ciclo
+    # roda no CycleExecutor (thread ou processo). Um ciclo por vez por instancia.
+    def __init__(
+        self,
+        config: InstanceConfig,
+        feed: StatusFeed | None = None,
+        scheduler: DeadlineScheduler | None = None,
+        executor: CycleExecutor | None = None,
+        jitter: float = 0.0,
+    ):
         self.config = config.sanitize()
         self.state = RuntimeState()
+        self._feed = feed or StatusFeed()
+        self._scheduler = scheduler
+        self._executor = executor
+        # Copia simples da config: vai por pickle para o processo do ciclo.
+        self._payload = asdict(self.config)
+        self._jitter = max(0.0, min(0.5, float(jitter)))
+        self._snapshot: dict | None = None
         self._lock = threading.Lock()
-        self._stop_event = threading.Event()
-        self._wake_event = threading.Event()
-        self._thread = threading.Thread(target=self._loop, daemon=True, name=f"inst-{self.config.instance_id}")
+        self._active = False
+        self._running = False
+        self._manual_pending = False
 
     def start(self) -> None:
         with self._lock:
-            if not self._thread.is_alive():
-                self._thread = threading.Thread(target=self._loop, daemon=True, name=f"inst-{self.config.instance_id}")
-                self._stop_event.clear()
-                self._wake_event.clear()
-                self._thread.start()
-            self.state.set_status("idle", "Aguardando proximo ciclo")
+            self._active = True
+            self.state.stop_requested = False
+            if not self.config.enabled:
+                # Desativada: nada agendado, nenhum custo ate ser reativada.
+                self.state.next_run_at = None
+                self.state.set_status("stopped", "Instancia desativada")
+            else:
+                self.state.set_status("idle", "Aguardando proximo ciclo")
+                if not self._running:
+                    # Primeiro ciclo logo apos subir, espalhado para nao disparar todas juntas.
+                    interval = self.config.interval_seconds
+                    self._schedule_locked(random.uniform(0.0, min(_FIRST_RUN_SPREAD, self._jitter * interval)))
+        self._publish()
 
     def stop(self) -> None:
-        self._stop_event.set()
-        self._wake_event.set()
-        self.state.stop_requested = True
-        self.state.set_status("stopped", "Parada solicitada")
+        with self._lock:
+            self._active = False
+            self._manual_pending = False
+            if self._scheduler is not None:
+                self._scheduler.cancel(self.config.instance_id)
+            self.state.stop_requested = True
+            self.state.next_run_at = None
+            self.state.set_status("stopped", "Parada solicitada")
+        if self._executor is not None:
+            # Ciclo em andamento/na fila e cancelado (no modo processo, o processo e encerrado).
+            self._executor.cancel(self.config.instance_id)
+        self._publish()
 
     def run_now(self) -> None:
-        self._wake_event.set()
+        with self._lock:
+            if not self._active or not self.config.enabled:
+                return
+            self._manual_pending = True
+            if not self._running:
+                self._schedule_locked(0.0)
+        # Ciclo em andamento: roda de novo assim que terminar.
+
+    def fire(self) -> None:
+        with self._lock:
+            if not self._active or self._running:
+                return
+            self._running = True
+            manual, self._manual_pending = self._manual_pending, False
+        if self._executor is None:
+            self._cycle_started(manual)
+            self._cycle_finished(run_inline(self.config.instance_type, self._payload, manual))
+        elif not self._executor.submit(
+            self.config.instance_id,
+            self.config.instance_type,
+            self._payload,
+            manual,
+            lambda: self._cycle_started(manual),
+            self._cycle_finished,
+        ):
+            with self._lock:
+                self._running = False
+
+    def _jittered(self, interval: float) -> float:
+        if not self._jitter:
+            return interval
+        return interval * (1.0 + random.uniform(-self._jitter, self._jitter))
+
+    def _schedule_locked(self, delay: float) -> None:
+        if self._scheduler is None:
+            return
+        deadline = self._scheduler.schedule(self.config.instance_id, delay)
+        # Prazo publicado em epoch; o heap usa relogio monotono.
+        self.state.next_run_at = round(time.time() + (deadline - time.monotonic()), 3)
+
+    def _cycle_started(self, manual: bool) -> None:
+        with self._lock:
+            self.state.current_run_manual = manual
+            self.state.last_started_at = datetime.now().isoformat(timespec="seconds")
+            self.state.next_run_at = None
+            if self._active:
+                self.state.set_status("running", "Executando ciclo")
+        self._publish()
+
+    def _cycle_finished(self, result: CycleResult) -> None:
+        # Chamado pelo executor: fim normal, erro, timeout ou cancelamento.
+        with self._lock:
+            self.state.last_outcome = result.outcome
+            self.state.last_duration_seconds = round(result.duration, 3)
+            self.state.current_run_manual = False
+            self.state.last_finished_at = datetime.now().isoformat(timespec="seconds")
+            if result.outcome == "ok":
+                self.state.runs_ok += 1
+                self.state.set_status("idle", result.detail or "Ciclo finalizado com sucesso")
+            elif result.outcome != "cancelled":
+                self.state.runs_error += 1
+                message = result.detail if result.outcome == "timeout" else f"Falha no ciclo: {result.detail}"
+                self.state.set_status("error", message)
+            self._running = False
+            if self._active:
+                delay = 0.0 if self._manual_pending else self._jittered(self.config.interval_seconds)
+                self._schedule_locked(delay)
+            else:
+                # stop() chegou durante o ciclo: o fim do ciclo nao desfaz a parada.
+                self.state.next_run_at = None
+                self.state.set_status("stopped", "Parada solicitada")
+        self._publish()
+
+    def _publish(self) -> None:
+        # Snapshot montado so quando o estado muda; leituras reaproveitam o mesmo dict.
+        self._snapshot = self._build_snapshot()
+        self._feed.bump(self.config.instance_id)
 
     def snapshot(self) -> dict:
+        snap = self._snapshot
+        if snap is None:
+            snap = self._snapshot = self._build_snapshot()
+        return snap
+
+    def _build_snapshot(self) -> dict:
         return {
             "instance_id": self.config.instance_id,
             "display_name": self.config.display_name,
@@ -52,63 +219,57 @@ class InstanceWorker:
                 "detail": self.state.detail,
                 "last_started_at": self.state.last_started_at,
                 "last_finished_at": self.state.last_finished_at,
-                "next_run_in_seconds": self.state.next_run_in_seconds,
+                "next_run_at": self.state.next_run_at,
                 "runs_ok": self.state.runs_ok,
                 "runs_error": self.state.runs_error,
+                "last_outcome": self.state.last_outcome,
+                "last_duration_seconds": self.state.last_duration_seconds,
                 "current_run_manual": self.state.current_run_manual,
                 "stop_requested": self.state.stop_requested,
                 "updated_at": self.state.updated_at,
             },
         }
 
-    def _execute_cycle(self, manual: bool) -> None:
-        self.state.current_run_manual = manual
-        self.state.last_started_at = datetime.now().isoformat(timespec="seconds")
-        self.state.set_status("running", "Executando ciclo")
-        try:
-            # Placeholder da Fase 1: aqui sera acoplado adapter financeiro/botana.
-            time.sleep(1)
-            self.state.runs_ok += 1
-            self.state.set_status("idle", "Ciclo finalizado com sucesso")
-        except Exception as exc:
-            self.state.runs_error += 1
-            self.state.set_status("error", f"Falha no ciclo: {exc}")
-        finally:
-            self.state.current_run_manual = False
-            self.state.last_finished_at = datetime.now().isoformat(timespec="seconds")
-
-    def _loop(self) -> None:
-        while not self._stop_event.is_set():
-            if not self.config.enabled:
-                self.state.next_run_in_seconds = None
-                self.state.set_status("stopped", "Instancia desativada")
-                time.sleep(1)
-                continue
-
-            manual = self._wake_event.is_set()
-            if manual:
-                self._wake_event.clear()
-            self._execute_cycle(manual=manual)
-
-            remaining = self.config.interval_seconds
-            while remaining > 0 and not self._stop_event.is_set():
-                if self._wake_event.is_set():
-                    break
-                self.state.next_run_in_seconds = remaining
-                time.sleep(1)
-                remaining -= 1
-            self.state.next_run_in_seconds = 0
-
 
 class InstanceRuntimeManager:
-    def __init__(self, instances: list[InstanceConfig]):
-        self._workers = {cfg.instance_id: InstanceWorker(cfg) for cfg in instances}
+    def __init__(
+        self,
+        instances: list[InstanceConfig],
+        jitter: float = 0.1,
+        max_concurrent_cycles: int = 8,
+        executor_mode: str = "thread",
+        cycle_timeout: float = 0.0,
+        type_limits: dict[str, int] | None = None,
+    ):
+        self.feed = StatusFeed()
+        self.scheduler = DeadlineScheduler(self._on_due)
+        # Ciclos fora da thread do scheduler: um ciclo lento nao atrasa os prazos das outras.
+        self.executor = CycleExecutor(executor_mode, max_concurrent_cycles, type_limits, cycle_timeout)
+        self._workers = {
+            cfg.instance_id: InstanceWorker(cfg, self.feed, self.scheduler, self.executor, jitter)
+            for cfg in instances
+        }
+        self.scheduler.start()
         for worker in self._workers.values():
             worker.start()
 
+    def _on_due(self, instance_id: str) -> None:
+        worker = self._workers.get(instance_id)
+        if worker is not None:
+            worker.fire()
+
     def list(self) -> list[dict]:
         return [w.snapshot() for w in self._workers.values()]
 
+    def snapshot(self, instance_id: str) -> dict | None:
+        worker = self._workers.get(instance_id)
+        return worker.snapshot() if worker else None
+
+    def touch(self, instance_id: str) -> None:
+        # Mudanca externa ao worker (saude/disjuntor) que os paineis tambem precisam ver.
+        if instance_id in self._workers:
+            self.feed.bump(instance_id)
+
     def run_now(self, instance_id: str) -> bool:
         worker = self._workers.get(instance_id)
         if not worker:
@@ -126,3 +287,5 @@ class InstanceRuntimeManager:
     def stop_all(self) -> None:
         for worker in self._workers.values():
             worker.stop()
+        self.scheduler.stop()
+        self.executor.shutdown()
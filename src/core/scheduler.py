@@ -0,0 +1,106 @@
+from __future__ import annotations
+
+import heapq
+import itertools
+import threading
+import time
+from typing import Callable
+
+
+class DeadlineScheduler:
+    # Uma thread e um heap (prazo, seq, chave) para todas as instancias: a thread dorme ate o
+    # prazo mais proximo e so acorda quando ele vence ou quando alguem agenda algo mais cedo.
+    # Reagendar/cancelar nao mexe no heap: a entrada antiga fica "morta" e e descartada ao sair.
+    def __init__(self, on_due: Callable[[str], None], name: str = "hub-scheduler"):
+        self._on_due = on_due
+        self._name = name
+        self._heap: list[tuple[float, int, str]] = []
+        self._live: dict[str, tuple[float, int]] = {}
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._thread: threading.Thread | None = None
+        self._stopping = False
+        self._counters = {"fired": 0, "wakeups": 0, "errors": 0}
+
+    def start(self) -> None:
+        with self._cond:
+            if self._thread is not None:
+                return
+            self._stopping = False
+            self._thread = threading.Thread(target=self._run, daemon=True, name=self._name)
+            self._thread.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        with self._cond:
+            self._stopping = True
+            thread, self._thread = self._thread, None
+            self._cond.notify_all()
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout)
+
+    def schedule(self, key: str, delay: float) -> float:
+        # Substitui o prazo anterior da chave; devolve o novo prazo (time.monotonic()).
+        with self._cond:
+            deadline = time.monotonic() + max(0.0, float(delay))
+            seq = next(self._seq)
+            self._live[key] = (deadline, seq)
+            heapq.heappush(self._heap, (deadline, seq, key))
+            if len(self._heap) > 2 * len(self._live) + 64:
+                self._compact()
+            if self._heap[0][1] == seq:
+                # Novo prazo e o mais proximo: a thread estava dormindo ate um prazo mais longe.
+                self._cond.notify()
+            return deadline
+
+    def cancel(self, key: str) -> bool:
+        with self._cond:
+            return self._live.pop(key, None) is not None
+
+    def deadline(self, key: str) -> float | None:
+        with self._cond:
+            entry = self._live.get(key)
+            return entry[0] if entry else None
+
+    def stats(self) -> dict:
+        with self._cond:
+            out = dict(self._counters)
+            out["scheduled"] = len(self._live)
+            out["heap_size"] = len(self._heap)
+        return out
+
+    def _compact(self) -> None:
+        self._heap = [(d, s, k) for k, (d, s) in self._live.items()]
+        heapq.heapify(self._heap)
+
+    def _drop_dead(self) -> None:
+        heap = self._heap
+        while heap:
+            deadline, seq, key = heap[0]
+            if self._live.get(key) == (deadline, seq):
+                return
+            heapq.heappop(heap)
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while True:
+                    if self._stopping:
+                        return
+                    self._drop_dead()
+                    if not self._heap:
+                        self._cond.wait()
+                    else:
+                        delay = self._heap[0][0] - time.monotonic()
+                        if delay <= 0:
+                            break
+                        self._cond.wait(delay)
+                    self._counters["wakeups"] += 1
+                _, _, key = heapq.heappop(self._heap)
+                del self._live[key]
+                self._counters["fired"] += 1
+            # Fora do lock: on_due pode reagendar a propria chave.
+            try:
+                self._on_due(key)
+            except Exception:
+                with self._cond:
+                    self._counters["errors"] += 1
@@ -6,6 +6,8 @@ from datetime import datetime
 
 VALID_INSTANCE_TYPES = {"financeiro", "botana"}
 VALID_STATUS = {"idle", "running", "stopped", "error"}
+SERVER_MODES = {"threaded", "asyncio"}
+CYCLE_EXECUTORS = {"thread", "process"}
 
 
 @dataclass
@@ -24,6 +26,11 @@ class InstanceConfig:
     auto_clone_missing: bool = False
     credentials_key: str = ""
     notes: str = ""
+    # Trechos literais reescritos com o prefixo da instancia; vazio = regras padrao do hub.
+    rewrite_rules: list[str] = field(default_factory=list)
+    # Prefixos de path do backend (ex.: "/api/history") cujos GETs simultaneos identicos
+    # compartilham uma unica chamada ao backend; vazio = desligado.
+    coalesce_paths: list[str] = field(default_factory=list)
 
     def sanitize(self) -> "InstanceConfig":
         if not self.instance_id:
@@ -49,6 +56,8 @@ class InstanceConfig:
         self.auto_clone_missing = bool(self.auto_clone_missing)
         self.credentials_key = str(self.credentials_key or "").strip()
         self.notes = str(self.notes or "").strip()
+        self.rewrite_rules = [str(x) for x in (self.rewrite_rules or []) if "/" in str(x)]
+        self.coalesce_paths = [str(x).strip() for x in (self.coalesce_paths or []) if str(x).strip().startswith("/")]
         return self
 
 
@@ -58,9 +67,13 @@ class RuntimeState:
     detail: str = "Aguardando"
     last_started_at: str = ""
     last_finished_at: str = ""
-    next_run_in_seconds: int | None = None
+    # Prazo absoluto (epoch, segundos) do proximo ciclo; o cliente calcula a contagem.
+    next_run_at: float | None = None
     runs_ok: int = 0
     runs_error: int = 0
+    # Resultado do ultimo ciclo: ok | error | timeout | cancelled.
+    last_outcome: str = ""
+    last_duration_seconds: float | None = None
     current_run_manual: bool = False
     stop_requested: bool = False
     updated_at: str = field(default_factory=lambda: datetime.now().isoformat(timespec="seconds"))
@@ -81,4 +94,33 @@ class AppConfig:
     auto_update_interval_minutes: int = 5
     auto_update_remote: str = "origin"
     auto_update_branch: str = "main"
+    max_request_body_mb: int = 200
+    rewrite_cache_mb: int = 64
+    http_keepalive_timeout_seconds: int = 15
+    http_max_requests_per_connection: int = 100
+    http_worker_threads: int = 64
+    http_accept_queue: int = 128
+    breaker_failure_threshold: int = 5
+    breaker_cooldown_seconds: int = 30
+    asset_cache_memory_mb: int = 32
+    asset_cache_disk_mb: int = 256
+    asset_cache_default_ttl_seconds: int = 300
+    server_mode: str = "threaded"
+    home_font_css_url: str = ""
+    server_timing_enabled: bool = False
+    slow_request_ms: int = 2000
+    diag_log_max_mb: int = 10
+    diag_log_backups: int = 5
+    diag_log_rotate_hours: int = 24
+    diag_console_echo: bool = True
+    backend_log_max_mb: int = 10
+    backend_log_backups: int = 3
+    backend_log_tail_lines: int = 1000
+    cycle_jitter_percent: int = 10
+    max_concurrent_cycles: int = 8
+    cycle_executor: str = "thread"
+    cycle_timeout_seconds: int = 900
+    cycle_type_limits: dict[str, int] = field(default_factory=dict)
+    instance_update_workers: int = 4
+    instance_update_git_timeout_seconds: int = 120
     instances: list[InstanceConfig] = field(default_factory=list)
@@ -39,6 +39,15 @@ def _restart_process(base_dir: Path):
     os._exit(0)
 
 
+def _server_class(config):
+    if str(config.server_mode) == "asyncio":
+        # Import tardio: o modo threaded continua sem depender do gateway asyncio.
+        from web.async_server import AsyncHubHttpServer
+
+        return AsyncHubHttpServer
+    return HubHttpServer
+
+
 def _check_sync(config) -> None:
     for inst in config.instances:
         app_dir = Path(str(inst.app_dir or ""))
@@ -56,7 +65,7 @@ def main() -> None:
     except Exception:
         pass
     settings = AppSettingsStore(base_dir=base_dir)
-    config = settings.load()
+    config = settings.snapshot().config
     try:
         update_count = int(os.environ.get("HUB_UPDATE_COUNT", "0"))
     except Exception:
@@ -70,8 +79,15 @@ def main() -> None:
     )
     _check_sync(config)
 
-    runtime = InstanceRuntimeManager(instances=config.instances)
-    server = HubHttpServer(
+    runtime = InstanceRuntimeManager(
+        instances=config.instances,
+        jitter=int(config.cycle_jitter_percent) / 100.0,
+        max_concurrent_cycles=int(config.max_concurrent_cycles),
+        executor_mode=str(config.cycle_executor),
+        cycle_timeout=int(config.cycle_timeout_seconds),
+        type_limits=dict(config.cycle_type_limits or {}),
+    )
+    server = _server_class(config)(
         host=config.panel_host,
         port=config.panel_port,
         runtime=runtime,
@@ -91,7 +107,7 @@ def main() -> None:
         interval_minutes=int(config.auto_update_interval_minutes),
     )
     server.warm_up_enabled_backends()
-    print(f"FinanceAnaHub online em http://{config.panel_host}:{config.panel_port}")
+    print(f"FinanceAnaHub online em http://{config.panel_host}:{config.panel_port} ({config.server_mode})")
     print("Ctrl+C para encerrar")
     try:
         while True:
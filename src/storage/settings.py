@@ -1,9 +1,22 @@
 from __future__ import annotations
 
+import copy
 import json
+import threading
+from dataclasses import dataclass
 from pathlib import Path
 
-from instances.models import AppConfig, InstanceConfig
+from instances.models import CYCLE_EXECUTORS, SERVER_MODES, VALID_INSTANCE_TYPES, AppConfig, InstanceConfig
+
+
+@dataclass(frozen=True)
+class ConfigSnapshot:
+    # Copia somente-leitura da config; trocada por inteiro quando o arquivo muda.
+    version: int
+    config: AppConfig
+    instances: tuple[InstanceConfig, ...]
+    file_mtime_ns: int
+    file_size: int
 
 
 class AppSettingsStore:
@@ -12,6 +25,8 @@ class AppSettingsStore:
         self.data_dir = base_dir / "data"
         self.data_dir.mkdir(parents=True, exist_ok=True)
         self.path = self.data_dir / "instances.json"
+        self._snapshot: ConfigSnapshot | None = None
+        self._snapshot_lock = threading.Lock()
 
     def _default(self) -> AppConfig:
         return AppConfig(
@@ -170,6 +185,12 @@ class AppSettingsStore:
         enabled = bool(item.get("enabled", True))
         if legacy_anabot:
             enabled = True
+        rewrite_rules = item.get("rewrite_rules")
+        if not isinstance(rewrite_rules, list):
+            rewrite_rules = []
+        coalesce_paths = item.get("coalesce_paths")
+        if not isinstance(coalesce_paths, list):
+            coalesce_paths = []
 
         cfg = InstanceConfig(
             instance_id=instance_id,
@@ -186,6 +207,8 @@ class AppSettingsStore:
             auto_clone_missing=auto_clone_missing,
             credentials_key=str(item.get("credentials_key", "")).strip(),
             notes=str(item.get("notes", "")).strip(),
+            rewrite_rules=[str(x) for x in rewrite_rules],
+            coalesce_paths=[str(x) for x in coalesce_paths],
         ).sanitize()
         return cfg
 
@@ -215,6 +238,122 @@ class AppSettingsStore:
             auto_update_interval_minutes = 5
         auto_update_remote = str(raw.get("auto_update_remote", "origin")).strip() or "origin"
         auto_update_branch = str(raw.get("auto_update_branch", "main")).strip() or "main"
+        try:
+            max_request_body_mb = max(1, min(4096, int(raw.get("max_request_body_mb", 200))))
+        except Exception:
+            max_request_body_mb = 200
+        try:
+            rewrite_cache_mb = max(0, min(2048, int(raw.get("rewrite_cache_mb", 64))))
+        except Exception:
+            rewrite_cache_mb = 64
+        try:
+            http_keepalive_timeout_seconds = max(1, min(600, int(raw.get("http_keepalive_timeout_seconds", 15))))
+        except Exception:
+            http_keepalive_timeout_seconds = 15
+        try:
+            http_max_requests_per_connection = max(0, min(100000, int(raw.get("http_max_requests_per_connection", 100))))
+        except Exception:
+            http_max_requests_per_connection = 100
+        try:
+            http_worker_threads = max(4, min(1024, int(raw.get("http_worker_threads", 64))))
+        except Exception:
+            http_worker_threads = 64
+        try:
+            http_accept_queue = max(1, min(10000, int(raw.get("http_accept_queue", 128))))
+        except Exception:
+            http_accept_queue = 128
+        try:
+            breaker_failure_threshold = max(1, min(100, int(raw.get("breaker_failure_threshold", 5))))
+        except Exception:
+            breaker_failure_threshold = 5
+        try:
+            breaker_cooldown_seconds = max(1, min(3600, int(raw.get("breaker_cooldown_seconds", 30))))
+        except Exception:
+            breaker_cooldown_seconds = 30
+        try:
+            asset_cache_memory_mb = max(0, min(2048, int(raw.get("asset_cache_memory_mb", 32))))
+        except Exception:
+            asset_cache_memory_mb = 32
+        try:
+            asset_cache_disk_mb = max(0, min(100000, int(raw.get("asset_cache_disk_mb", 256))))
+        except Exception:
+            asset_cache_disk_mb = 256
+        try:
+            asset_cache_default_ttl_seconds = max(0, min(86400, int(raw.get("asset_cache_default_ttl_seconds", 300))))
+        except Exception:
+            asset_cache_default_ttl_seconds = 300
+        server_mode = str(raw.get("server_mode", "threaded")).strip().lower()
+        if server_mode not in SERVER_MODES:
+            server_mode = "threaded"
+        # Vazio: pagina inicial so com fontes locais (servidor offline nao trava no @import).
+        home_font_css_url = str(raw.get("home_font_css_url", "") or "").strip()
+        server_timing_enabled = bool(raw.get("server_timing_enabled", False))
+        try:
+            slow_request_ms = max(0, min(600000, int(raw.get("slow_request_ms", 2000))))
+        except Exception:
+            slow_request_ms = 2000
+        try:
+            diag_log_max_mb = max(1, min(1024, int(raw.get("diag_log_max_mb", 10))))
+        except Exception:
+            diag_log_max_mb = 10
+        try:
+            diag_log_backups = max(0, min(100, int(raw.get("diag_log_backups", 5))))
+        except Exception:
+            diag_log_backups = 5
+        try:
+            diag_log_rotate_hours = max(0, min(24 * 365, int(raw.get("diag_log_rotate_hours", 24))))
+        except Exception:
+            diag_log_rotate_hours = 24
+        diag_console_echo = bool(raw.get("diag_console_echo", True))
+        try:
+            backend_log_max_mb = max(1, min(1024, int(raw.get("backend_log_max_mb", 10))))
+        except Exception:
+            backend_log_max_mb = 10
+        try:
+            backend_log_backups = max(0, min(100, int(raw.get("backend_log_backups", 3))))
+        except Exception:
+            backend_log_backups = 3
+        try:
+            backend_log_tail_lines = max(10, min(100000, int(raw.get("backend_log_tail_lines", 1000))))
+        except Exception:
+            backend_log_tail_lines = 1000
+        try:
+            cycle_jitter_percent = max(0, min(50, int(raw.get("cycle_jitter_percent", 10))))
+        except Exception:
+            cycle_jitter_percent = 10
+        try:
+            max_concurrent_cycles = max(1, min(256, int(raw.get("max_concurrent_cycles", 8))))
+        except Exception:
+            max_concurrent_cycles = 8
+        cycle_executor = str(raw.get("cycle_executor", "thread")).strip().lower()
+        if cycle_executor not in CYCLE_EXECUTORS:
+            cycle_executor = "thread"
+        try:
+            cycle_timeout_seconds = max(0, min(86400, int(raw.get("cycle_timeout_seconds", 900))))
+        except Exception:
+            cycle_timeout_seconds = 900
+        # {"financeiro": 2}: tipos ausentes ficam limitados so por max_concurrent_cycles.
+        cycle_type_limits: dict[str, int] = {}
+        raw_limits = raw.get("cycle_type_limits")
+        if isinstance(raw_limits, dict):
+            for key, value in raw_limits.items():
+                kind = str(key).strip().lower()
+                if kind == "anabot":
+                    kind = "botana"
+                if kind not in VALID_INSTANCE_TYPES:
+                    continue
+                try:
+                    cycle_type_limits[kind] = max(1, min(256, int(value)))
+                except Exception:
+                    continue
+        try:
+            instance_update_workers = max(1, min(32, int(raw.get("instance_update_workers", 4))))
+        except Exception:
+            instance_update_workers = 4
+        try:
+            instance_update_git_timeout_seconds = max(5, min(3600, int(raw.get("instance_update_git_timeout_seconds", 120))))
+        except Exception:
+            instance_update_git_timeout_seconds = 120
 
         legacy = self._legacy_defaults(raw)
         if legacy["botana_url"].endswith("/anabot"):
@@ -241,12 +380,73 @@ class AppSettingsStore:
             auto_update_interval_minutes=auto_update_interval_minutes,
             auto_update_remote=auto_update_remote,
             auto_update_branch=auto_update_branch,
+            max_request_body_mb=max_request_body_mb,
+            rewrite_cache_mb=rewrite_cache_mb,
+            http_keepalive_timeout_seconds=http_keepalive_timeout_seconds,
+            http_max_requests_per_connection=http_max_requests_per_connection,
+            http_worker_threads=http_worker_threads,
+            http_accept_queue=http_accept_queue,
+            breaker_failure_threshold=breaker_failure_threshold,
+            breaker_cooldown_seconds=breaker_cooldown_seconds,
+            asset_cache_memory_mb=asset_cache_memory_mb,
+            asset_cache_disk_mb=asset_cache_disk_mb,
+            asset_cache_default_ttl_seconds=asset_cache_default_ttl_seconds,
+            server_mode=server_mode,
+            home_font_css_url=home_font_css_url,
+            server_timing_enabled=server_timing_enabled,
+            slow_request_ms=slow_request_ms,
+            diag_log_max_mb=diag_log_max_mb,
+            diag_log_backups=diag_log_backups,
+            diag_log_rotate_hours=diag_log_rotate_hours,
+            diag_console_echo=diag_console_echo,
+            backend_log_max_mb=backend_log_max_mb,
+            backend_log_backups=backend_log_backups,
+            backend_log_tail_lines=backend_log_tail_lines,
+            cycle_jitter_percent=cycle_jitter_percent,
+            max_concurrent_cycles=max_concurrent_cycles,
+            cycle_executor=cycle_executor,
+            cycle_timeout_seconds=cycle_timeout_seconds,
+            cycle_type_limits=cycle_type_limits,
+            instance_update_workers=instance_update_workers,
+            instance_update_git_timeout_seconds=instance_update_git_timeout_seconds,
             instances=instances,
         )
         self.save(cfg)
         return cfg
 
-    def save(self, config: AppConfig) -> None:
+    def _file_signature(self) -> tuple[int, int] | None:
+        try:
+            st = self.path.stat()
+        except OSError:
+            return None
+        return st.st_mtime_ns, st.st_size
+
+    def snapshot(self) -> ConfigSnapshot:
+        # Caminho quente das requisicoes: apenas um stat() enquanto o arquivo nao muda.
+        current = self._snapshot
+        sig = self._file_signature()
+        if current is not None and sig == (current.file_mtime_ns, current.file_size):
+            return current
+        with self._snapshot_lock:
+            current = self._snapshot
+            sig = self._file_signature()
+            if current is not None and sig == (current.file_mtime_ns, current.file_size):
+                return current
+            cfg = copy.deepcopy(self.load())
+            # load() pode ter normalizado e regravado o arquivo; usa a assinatura final.
+            sig = self._file_signature() or (0, 0)
+            snap = ConfigSnapshot(
+                version=(current.version + 1) if current else 1,
+                config=cfg,
+                instances=tuple(cfg.instances),
+                file_mtime_ns=sig[0],
+                file_size=sig[1],
+            )
+            self._snapshot = snap
+            return snap
+
+    @staticmethod
+    def _serialize(config: AppConfig) -> str:
         out = {
             "panel_host": config.panel_host,
             "panel_port": int(config.panel_port),
@@ -254,6 +454,35 @@ class AppSettingsStore:
             "auto_update_interval_minutes": int(config.auto_update_interval_minutes),
             "auto_update_remote": str(config.auto_update_remote or "").strip(),
             "auto_update_branch": str(config.auto_update_branch or "").strip(),
+            "max_request_body_mb": int(config.max_request_body_mb),
+            "rewrite_cache_mb": int(config.rewrite_cache_mb),
+            "http_keepalive_timeout_seconds": int(config.http_keepalive_timeout_seconds),
+            "http_max_requests_per_connection": int(config.http_max_requests_per_connection),
+            "http_worker_threads": int(config.http_worker_threads),
+            "http_accept_queue": int(config.http_accept_queue),
+            "breaker_failure_threshold": int(config.breaker_failure_threshold),
+            "breaker_cooldown_seconds": int(config.breaker_cooldown_seconds),
+            "asset_cache_memory_mb": int(config.asset_cache_memory_mb),
+            "asset_cache_disk_mb": int(config.asset_cache_disk_mb),
+            "asset_cache_default_ttl_seconds": int(config.asset_cache_default_ttl_seconds),
+            "server_mode": str(config.server_mode or "threaded"),
+            "home_font_css_url": str(config.home_font_css_url or "").strip(),
+            "server_timing_enabled": bool(config.server_timing_enabled),
+            "slow_request_ms": int(config.slow_request_ms),
+            "diag_log_max_mb": int(config.diag_log_max_mb),
+            "diag_log_backups": int(config.diag_log_backups),
+            "diag_log_rotate_hours": int(config.diag_log_rotate_hours),
+            "diag_console_echo": bool(config.diag_console_echo),
+            "backend_log_max_mb": int(config.backend_log_max_mb),
+            "backend_log_backups": int(config.backend_log_backups),
+            "backend_log_tail_lines": int(config.backend_log_tail_lines),
+            "cycle_jitter_percent": int(config.cycle_jitter_percent),
+            "max_concurrent_cycles": int(config.max_concurrent_cycles),
+            "cycle_executor": str(config.cycle_executor or "thread"),
+            "cycle_timeout_seconds": int(config.cycle_timeout_seconds),
+            "cycle_type_limits": {str(k): int(v) for k, v in (config.cycle_type_limits or {}).items()},
+            "instance_update_workers": int(config.instance_update_workers),
+            "instance_update_git_timeout_seconds": int(config.instance_update_git_timeout_seconds),
             "instances": [
                 {
                     "instance_id": i.instance_id,
@@ -270,8 +499,19 @@ class AppSettingsStore:
                     "auto_clone_missing": bool(i.auto_clone_missing),
                     "credentials_key": i.credentials_key,
                     "notes": i.notes,
+                    "rewrite_rules": list(i.rewrite_rules or []),
+                    "coalesce_paths": list(i.coalesce_paths or []),
                 }
                 for i in config.instances
             ],
         }
-        self.path.write_text(json.dumps(out, ensure_ascii=False, indent=2), encoding="utf-8")
+        return json.dumps(out, ensure_ascii=False, indent=2)
+
+    def save(self, config: AppConfig) -> None:
+        text = self._serialize(config)
+        try:
+            if self.path.read_text(encoding="utf-8") == text:
+                return
+        except Exception:
+            pass
+        self.path.write_text(text, encoding="utf-8")
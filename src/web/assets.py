@@ -0,0 +1,309 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from http.client import HTTPMessage
+from pathlib import Path
+
+from web.cache import ByteLRUCache
+from web.rewriter import DEFAULT_STATIC_ROOTS
+from web.upstream import HOP_BY_HOP
+
+
+# Acima disso o asset segue em streaming, sem cache (evita bufferizar downloads grandes).
+MAX_ASSET_BYTES = 8 * 1024 * 1024
+
+# Cabecalhos de resposta que nao fazem sentido guardar junto do corpo.
+_SKIP_STORED = HOP_BY_HOP | {"content-length", "date", "server", "set-cookie", "age"}
+
+
+def is_static_path(path: str) -> bool:
+    return any(path.startswith(root) for root in DEFAULT_STATIC_ROOTS)
+
+
+def parse_cache_control(value: str) -> dict[str, str]:
+    out: dict[str, str] = {}
+    for part in str(value or "").split(","):
+        name, _, arg = part.strip().partition("=")
+        name = name.strip().lower()
+        if name:
+            out[name] = arg.strip().strip('"')
+    return out
+
+
+@dataclass
+class AssetEntry:
+    status: int
+    headers: list[tuple[str, str]]
+    body: bytes
+    stored_at: float
+    expires_at: float
+    # no-cache: pode guardar, mas todo uso revalida com o backend (If-None-Match/If-Modified-Since).
+    must_revalidate: bool
+
+    def fresh(self, now: float | None = None) -> bool:
+        return not self.must_revalidate and (now or time.time()) < self.expires_at
+
+    def header(self, name: str) -> str:
+        lname = name.lower()
+        for k, v in self.headers:
+            if k.lower() == lname:
+                return v
+        return ""
+
+    def message(self) -> HTTPMessage:
+        msg = HTTPMessage()
+        for k, v in self.headers:
+            msg[k] = v
+        return msg
+
+    def merged(self, headers) -> HTTPMessage:
+        # Cabecalhos guardados atualizados pelos de um 304.
+        msg = self.message()
+        for k, v in headers.items():
+            if k.lower() not in _SKIP_STORED:
+                del msg[k]
+                msg[k] = v
+        return msg
+
+    def shared(self) -> bool:
+        return explicitly_public(parse_cache_control(self.header("Cache-Control")))
+
+    def validators(self) -> dict[str, str]:
+        out = {}
+        if self.header("ETag"):
+            out["If-None-Match"] = self.header("ETag")
+        if self.header("Last-Modified"):
+            out["If-Modified-Since"] = self.header("Last-Modified")
+        return out
+
+
+def explicitly_public(cc: dict[str, str]) -> bool:
+    return "public" in cc and ("s-maxage" in cc or "max-age" in cc)
+
+
+def cache_policy(status: int, headers, default_ttl: float, credentialed: bool = False) -> tuple[float, bool] | None:
+    # (ttl, revalidar sempre) ou None se a resposta nao pode ser guardada.
+    # credentialed: a requisicao levava Cookie; a resposta pode depender da sessao, entao so
+    # entra no cache compartilhado se o backend declarar public com max-age/s-maxage.
+    if status != 200 or headers.get("Set-Cookie"):
+        return None
+    vary = {v.strip().lower() for v in str(headers.get("Vary", "")).split(",") if v.strip()}
+    if vary - {"accept-encoding"}:
+        return None
+    cc = parse_cache_control(headers.get("Cache-Control", ""))
+    if "no-store" in cc or "private" in cc:
+        return None
+    if credentialed and not explicitly_public(cc):
+        return None
+    for directive in ("s-maxage", "max-age"):
+        if directive in cc:
+            try:
+                ttl = max(0.0, float(cc[directive]))
+            except ValueError:
+                return None
+            return ttl, "no-cache" in cc or ttl == 0
+    has_validator = bool(headers.get("ETag") or headers.get("Last-Modified"))
+    if "no-cache" in cc:
+        return (0.0, True) if has_validator else None
+    return float(default_ttl), False
+
+
+def refresh_policy(entry: AssetEntry, headers, default_ttl: float, credentialed: bool = False) -> tuple[float, bool] | None:
+    # O 304 costuma vir sem Cache-Control: a validade sai dos cabecalhos guardados + os do
+    # 304, e um asset que ja exigia revalidacao continua exigindo.
+    policy = cache_policy(200, entry.merged(headers), default_ttl, credentialed)
+    if policy is None:
+        return None
+    ttl, must_revalidate = policy
+    return ttl, must_revalidate or entry.must_revalidate
+
+
+class AssetCache:
+    # Dois niveis: memoria (ByteLRUCache) na frente de um LRU em disco por bytes.
+    # Chaves: (instance_id, target, accept-encoding pedido ao backend).
+    def __init__(self, root: Path, memory_bytes: int, disk_bytes: int):
+        self.memory = ByteLRUCache(memory_bytes)
+        self.root = Path(root)
+        self.disk_bytes = max(0, int(disk_bytes))
+        self._disk: OrderedDict[str, int] = OrderedDict()
+        self._disk_size = 0
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "misses": 0, "revalidated": 0, "stored": 0, "disk_hits": 0, "invalidated": 0}
+        if self.disk_bytes:
+            self._load_disk_index()
+
+    @property
+    def enabled(self) -> bool:
+        return self.memory.max_bytes > 0 or self.disk_bytes > 0
+
+    @staticmethod
+    def _instance_dir(instance_id: str) -> str:
+        # instance_id vira nome de pasta: so alfanumericos, "-" e "_" (como os logs), mais um
+        # hash do id original para "a/b" e "a_b" nao cairem na mesma pasta.
+        safe = "".join(ch if ch.isalnum() or ch in {"-", "_"} else "_" for ch in str(instance_id)[:40])
+        digest = hashlib.blake2b(str(instance_id).encode("utf-8"), digest_size=4).hexdigest()
+        return f"{safe or 'instance'}-{digest}"
+
+    @classmethod
+    def _file_id(cls, key: tuple) -> str:
+        # Prefixo por instancia permite invalidar uma instancia sem ler os arquivos.
+        digest = hashlib.blake2b(repr(key[1:]).encode("utf-8"), digest_size=16).hexdigest()
+        return f"{cls._instance_dir(key[0])}/{digest}"
+
+    def _load_disk_index(self) -> None:
+        files = []
+        for meta in self.root.glob("*/*.json"):
+            body = meta.with_suffix(".bin")
+            try:
+                size = meta.stat().st_size + body.stat().st_size
+                files.append((meta.stat().st_mtime, f"{meta.parent.name}/{meta.stem}", size))
+            except OSError:
+                continue
+        for _, file_id, size in sorted(files):
+            self._disk[file_id] = size
+            self._disk_size += size
+        self._evict_disk()
+
+    def _evict_disk(self) -> None:
+        while self._disk_size > self.disk_bytes and self._disk:
+            file_id, size = self._disk.popitem(last=False)
+            self._disk_size -= size
+            self._remove_files(file_id)
+
+    def _remove_files(self, file_id: str) -> None:
+        for suffix in (".json", ".bin"):
+            try:
+                (self.root / f"{file_id}{suffix}").unlink()
+            except OSError:
+                pass
+
+    def _read_disk(self, file_id: str) -> AssetEntry | None:
+        try:
+            meta = json.loads((self.root / f"{file_id}.json").read_text(encoding="utf-8"))
+            body = (self.root / f"{file_id}.bin").read_bytes()
+        except (OSError, ValueError):
+            return None
+        return AssetEntry(
+            status=int(meta["status"]),
+            headers=[(str(k), str(v)) for k, v in meta["headers"]],
+            body=body,
+            stored_at=float(meta["stored_at"]),
+            expires_at=float(meta["expires_at"]),
+            must_revalidate=bool(meta["must_revalidate"]),
+        )
+
+    def _write_disk(self, file_id: str, entry: AssetEntry) -> int:
+        base = self.root / file_id
+        base.parent.mkdir(parents=True, exist_ok=True)
+        meta = json.dumps(
+            {
+                "status": entry.status,
+                "headers": entry.headers,
+                "stored_at": entry.stored_at,
+                "expires_at": entry.expires_at,
+                "must_revalidate": entry.must_revalidate,
+            }
+        ).encode("utf-8")
+        # Escrita atomica: leitores nunca veem corpo pela metade.
+        for suffix, data in ((".bin", entry.body), (".json", meta)):
+            tmp = base.with_name(f"{base.name}{suffix}.{threading.get_ident()}.tmp")
+            tmp.write_bytes(data)
+            os.replace(tmp, base.with_name(base.name + suffix))
+        return len(meta) + len(entry.body)
+
+    def _get_disk(self, key: tuple) -> AssetEntry | None:
+        file_id = self._file_id(key)
+        with self._lock:
+            if file_id not in self._disk:
+                return None
+            self._disk.move_to_end(file_id)
+        entry = self._read_disk(file_id)
+        if entry is not None:
+            self.memory.put(key, entry, len(entry.body))
+            with self._lock:
+                self._counters["disk_hits"] += 1
+        return entry
+
+    def get(self, key: tuple, disk: bool = True) -> AssetEntry | None:
+        # disk=False: so memoria (para o event loop); falta nao e contada, o chamador
+        # segue com get_disk() fora do loop.
+        entry = self.memory.get(key)
+        if entry is None and not disk:
+            return None
+        if entry is None and self.disk_bytes:
+            entry = self._get_disk(key)
+        with self._lock:
+            self._counters["hits" if entry is not None else "misses"] += 1
+        return entry
+
+    def get_disk(self, key: tuple) -> AssetEntry | None:
+        entry = self._get_disk(key) if self.disk_bytes else None
+        with self._lock:
+            self._counters["hits" if entry is not None else "misses"] += 1
+        return entry
+
+    def _store(self, key: tuple, entry: AssetEntry) -> None:
+        self.memory.put(key, entry, len(entry.body))
+        if not self.disk_bytes or len(entry.body) > self.disk_bytes:
+            return
+        file_id = self._file_id(key)
+        try:
+            size = self._write_disk(file_id, entry)
+        except OSError:
+            return
+        with self._lock:
+            self._disk_size += size - self._disk.pop(file_id, 0)
+            self._disk[file_id] = size
+            self._evict_disk()
+
+    def put(self, key: tuple, status: int, headers, body: bytes, ttl: float, must_revalidate: bool) -> AssetEntry | None:
+        if len(body) > MAX_ASSET_BYTES:
+            return None
+        now = time.time()
+        stored = [(k, v) for k, v in headers.items() if k.lower() not in _SKIP_STORED]
+        entry = AssetEntry(status, stored, body, now, now + ttl, must_revalidate)
+        self._store(key, entry)
+        with self._lock:
+            self._counters["stored"] += 1
+        return entry
+
+    def refresh(self, key: tuple, entry: AssetEntry, headers, ttl: float, must_revalidate: bool) -> AssetEntry:
+        # 304 do backend: o corpo guardado continua valido; atualiza cabecalhos e validade.
+        now = time.time()
+        refreshed = AssetEntry(entry.status, entry.merged(headers).items(), entry.body, now, now + ttl, must_revalidate)
+        self._store(key, refreshed)
+        with self._lock:
+            self._counters["revalidated"] += 1
+        return refreshed
+
+    def invalidate_instance(self, instance_id: str) -> int:
+        removed = self.memory.invalidate(lambda k: k[0] == instance_id)
+        with self._lock:
+            prefix = self._instance_dir(instance_id)
+            ids = [f for f in self._disk if f.split("/", 1)[0] == prefix]
+            for file_id in ids:
+                self._disk_size -= self._disk.pop(file_id)
+        for file_id in ids:
+            self._remove_files(file_id)
+        with self._lock:
+            self._counters["invalidated"] += max(removed, len(ids))
+        return max(removed, len(ids))
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self._counters["hits"] + self._counters["misses"]
+            return dict(
+                self._counters,
+                hit_ratio=round(self._counters["hits"] / lookups, 4) if lookups else 0.0,
+                memory=self.memory.stats(),
+                disk_entries=len(self._disk),
+                disk_bytes=self._disk_size,
+                disk_max_bytes=self.disk_bytes,
+            )
+
@@ -0,0 +1,915 @@
+from __future__ import annotations
+
+import asyncio
+import io
+import json
+import threading
+import time
+from email.utils import formatdate
+from http import HTTPStatus
+from http.client import HTTPMessage, parse_headers
+from urllib.parse import urlparse
+
+from core import metrics
+from core.metrics import AsyncCountingReader, CountingWriter
+from instances.models import InstanceConfig
+from web.bodies import ClientBodyError, MalformedChunkedBody, RequestBodyTooLarge, parse_chunk_size
+from web.coalesce import BufferedResponse
+from web.conditional import conditional_response, hub_etag, without_conditionals
+from web.encoding import (
+    TransformChain,
+    can_decode,
+    is_compressible,
+    negotiate,
+    normalize_encoding,
+    stream_decoder,
+    stream_encoder,
+)
+from web.assets import MAX_ASSET_BYTES
+from web.rewriter import is_rewritable
+from web.server import (
+    FEED_HEARTBEAT,
+    HOME_CACHE_CONTROL,
+    HUB_STATIC_PREFIX,
+    REWRITE_BUFFER_LIMIT,
+    STATIC_CACHE_CONTROL,
+    STREAM_CHUNK_SIZE,
+    HubHttpServer,
+    _encode_hub_body,
+    _precompressed_reply,
+)
+from web.timing import RequestTimer
+from web.upstream import IDEMPOTENT_METHODS
+
+
+_MAX_HEADER_LINES = 100
+_MAX_LINE = 64 * 1024
+UPSTREAM_TIMEOUT = 45.0
+_LINGER_SECONDS = 2.0
+_LINGER_MAX_BYTES = 4 * 1024 * 1024
+
+
+class _BadRequest(Exception):
+    pass
+
+
+class _UpstreamStale(Exception):
+    pass
+
+
+class _Request:
+    __slots__ = ("method", "target", "version", "headers", "metric_route", "metric_status", "timer")
+
+    def __init__(self, method: str, target: str, version: str, headers: HTTPMessage):
+        self.method = method
+        self.target = target
+        self.version = version
+        self.headers = headers
+        self.metric_route = "hub"
+        self.metric_status = 0
+        self.timer = RequestTimer()
+
+    def has_body(self) -> bool:
+        if "chunked" in self.headers.get("Transfer-Encoding", "").lower():
+            return True
+        try:
+            return int(self.headers.get("Content-Length", "0") or 0) > 0
+        except ValueError:
+            return True
+
+
+class _UpstreamResponse:
+    __slots__ = ("status", "headers", "length", "chunked", "will_close", "sent_at", "backend")
+
+    def __init__(self, status: int, headers: HTTPMessage, length: int | None, chunked: bool, will_close: bool):
+        self.status = status
+        self.headers = headers
+        self.length = length
+        self.chunked = chunked
+        self.will_close = will_close
+        self.sent_at = 0.0
+        self.backend = ""
+
+
+async def _read_head(reader: asyncio.StreamReader) -> tuple[bytes, HTTPMessage] | None:
+    # Primeira linha + cabecalhos ate a linha em branco. None = EOF antes de qualquer byte.
+    line = await reader.readline()
+    while line in {b"\r\n", b"\n"}:
+        line = await reader.readline()
+    if not line:
+        return None
+    lines = []
+    while True:
+        header = await reader.readline()
+        if header in {b"\r\n", b"\n", b""}:
+            break
+        lines.append(header)
+        if len(lines) > _MAX_HEADER_LINES:
+            raise _BadRequest("Cabecalhos demais")
+    return line, parse_headers(io.BytesIO(b"".join(lines) + b"\r\n"))
+
+
+async def _read_block(reader: asyncio.StreamReader, size: int, timeout: float | None) -> bytes:
+    if timeout is None:
+        return await reader.read(size)
+    return await asyncio.wait_for(reader.read(size), timeout=timeout)
+
+
+async def _read_line(reader: asyncio.StreamReader, timeout: float | None) -> bytes:
+    if timeout is None:
+        return await reader.readline()
+    return await asyncio.wait_for(reader.readline(), timeout=timeout)
+
+
+async def _iter_chunked(reader: asyncio.StreamReader, max_bytes: int = 0, timeout: float | None = None):
+    total = 0
+    while True:
+        line = await _read_line(reader, timeout)
+        if not line:
+            raise ConnectionError("Corpo chunked encerrado antes do fim")
+        size = parse_chunk_size(line)
+        if size == 0:
+            while (await _read_line(reader, timeout)) not in {b"\r\n", b"\n", b""}:
+                pass
+            return
+        total += size
+        if max_bytes and total > max_bytes:
+            raise RequestBodyTooLarge(f"Corpo excede {max_bytes} bytes")
+        remaining = size
+        while remaining > 0:
+            block = await _read_block(reader, min(STREAM_CHUNK_SIZE, remaining), timeout)
+            if not block:
+                raise ConnectionError("Corpo chunked encerrado antes do fim")
+            remaining -= len(block)
+            yield block
+        await _read_line(reader, timeout)
+
+
+async def _iter_fixed(reader: asyncio.StreamReader, length: int, timeout: float | None = None):
+    remaining = length
+    while remaining > 0:
+        block = await _read_block(reader, min(STREAM_CHUNK_SIZE, remaining), timeout)
+        if not block:
+            raise ConnectionError("Corpo encerrado antes do fim")
+        remaining -= len(block)
+        yield block
+
+
+async def _iter_until_eof(reader: asyncio.StreamReader, timeout: float | None = None):
+    while True:
+        block = await _read_block(reader, STREAM_CHUNK_SIZE, timeout)
+        if not block:
+            return
+        yield block
+
+
+async def _client_body(blocks):
+    # Falhas lendo o corpo do cliente nao devem contar contra a saude do backend.
+    try:
+        async for block in blocks:
+            yield block
+    except (ConnectionError, asyncio.IncompleteReadError, asyncio.TimeoutError) as exc:
+        raise ClientBodyError(str(exc) or "Cliente parou de enviar o corpo") from exc
+
+
+class AsyncHubHttpServer(HubHttpServer):
+    # Modo opcional (server_mode = "asyncio"): mesmas rotas do HubHttpServer, mas todas
+    # as conexoes (cliente e backend) rodam em um unico event loop, sem thread por requisicao.
+    # Processos, updater, health e caches sao herdados do modo threaded.
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._aio_server: asyncio.AbstractServer | None = None
+        self._aio_idle: dict[tuple[str, int], list[tuple[float, asyncio.StreamReader, asyncio.StreamWriter]]] = {}
+        self._aio_counters = {"hits": 0, "misses": 0, "stale_discarded": 0, "retries": 0}
+        self._active_connections = 0
+
+    def _stats_payload(self) -> dict:
+        out = super()._stats_payload()
+        lookups = self._aio_counters["hits"] + self._aio_counters["misses"]
+        out["upstream_pool"] = dict(
+            self._aio_counters,
+            idle_connections=sum(len(v) for v in self._aio_idle.values()),
+            reuse_ratio=round(self._aio_counters["hits"] / lookups, 4) if lookups else 0.0,
+        )
+        out["asyncio"] = {"active_connections": self._active_connections}
+        return out
+
+    def _active_handlers_metric(self) -> float:
+        return float(self._active_connections)
+
+    def start(self) -> None:
+        metrics.ACTIVE_HANDLERS.set_function(self._active_handlers_metric)
+        cfg = self.settings.snapshot().config
+        self._max_requests = int(cfg.http_max_requests_per_connection)
+        self._keepalive_timeout = int(cfg.http_keepalive_timeout_seconds)
+        ready = threading.Event()
+        errors: list[BaseException] = []
+
+        def run() -> None:
+            loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(loop)
+            self._loop = loop
+            try:
+                self._aio_server = loop.run_until_complete(
+                    asyncio.start_server(self._handle_client, self.host, self.port, limit=_MAX_LINE, backlog=1024)
+                )
+            except BaseException as exc:
+                errors.append(exc)
+                ready.set()
+                loop.close()
+                return
+            ready.set()
+            try:
+                loop.run_forever()
+            finally:
+                self._aio_server.close()
+                pending = asyncio.all_tasks(loop)
+                for task in pending:
+                    task.cancel()
+                loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
+                for stack in self._aio_idle.values():
+                    for _, _, w in stack:
+                        w.close()
+                self._aio_idle.clear()
+                loop.close()
+
+        self._thread = threading.Thread(target=run, daemon=True, name="hub-asyncio")
+        self._thread.start()
+        ready.wait()
+        if errors:
+            raise errors[0]
+        self.health.start()
+
+    def stop(self):
+        if self._loop is not None and self._loop.is_running():
+            self._loop.call_soon_threadsafe(self._loop.stop)
+        super().stop()
+
+    # --- front end -----------------------------------------------------------------
+
+    async def _handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self._active_connections += 1
+        served = 0
+        # Bytes por requisicao = diferenca desde a anterior (inclui a linha e os cabecalhos).
+        reader, writer = AsyncCountingReader(reader), CountingWriter(writer)
+        read_mark = sent_mark = 0
+        try:
+            while True:
+                try:
+                    head = await asyncio.wait_for(_read_head(reader), timeout=self._keepalive_timeout)
+                except (asyncio.TimeoutError, asyncio.LimitOverrunError, ValueError, ConnectionError):
+                    break
+                except _BadRequest:
+                    await self._send_simple(writer, None, 400, "text/plain; charset=utf-8", b"Bad Request", False)
+                    break
+                if head is None:
+                    break
+                line, headers = head
+                parts = line.decode("latin-1").strip().split()
+                if len(parts) != 3 or not parts[2].startswith("HTTP/1."):
+                    await self._send_simple(writer, None, 400, "text/plain; charset=utf-8", b"Bad Request", False)
+                    break
+                req = _Request(parts[0].upper(), parts[1], parts[2], headers)
+                served += 1
+                keep_alive = self._wants_keep_alive(req)
+                if self._max_requests and served >= self._max_requests:
+                    keep_alive = False
+                if req.version == "HTTP/1.1" and headers.get("Expect", "").lower() == "100-continue":
+                    writer.write(b"HTTP/1.1 100 Continue\r\n\r\n")
+                try:
+                    keep_alive = await self._dispatch(req, reader, writer, keep_alive)
+                finally:
+                    req.timer.lap("send")
+                    self._observe_request(
+                        req.metric_route,
+                        req.metric_status,
+                        req.timer.total(),
+                        reader.count - read_mark,
+                        writer.count - sent_mark,
+                    )
+                    read_mark, sent_mark = reader.count, writer.count
+                    self._finish_timing(req.timer, req.method, req.target, req.metric_status, req.metric_route)
+                if not keep_alive:
+                    if req.has_body():
+                        await self._linger(reader, writer)
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except asyncio.CancelledError:
+            # Encerramento do hub: a tarefa da conexao termina sem propagar o cancelamento.
+            pass
+        except Exception as exc:
+            self._diag(f"[Async] Erro atendendo conexao: {exc}")
+        finally:
+            self._active_connections -= 1
+            try:
+                writer.close()
+            except Exception:
+                pass
+
+    @staticmethod
+    async def _linger(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        # Resposta enviada com parte do corpo ainda chegando (ex.: 413): descarta o resto por
+        # um curto periodo antes de fechar, senao o kernel responde com RST e o cliente
+        # perde a resposta.
+        try:
+            if writer.can_write_eof():
+                writer.write_eof()
+            deadline = time.monotonic() + _LINGER_SECONDS
+            discarded = 0
+            while discarded < _LINGER_MAX_BYTES:
+                left = deadline - time.monotonic()
+                if left <= 0:
+                    break
+                block = await asyncio.wait_for(reader.read(STREAM_CHUNK_SIZE), timeout=left)
+                if not block:
+                    break
+                discarded += len(block)
+        except (asyncio.TimeoutError, ConnectionError, OSError):
+            pass
+
+    @staticmethod
+    def _wants_keep_alive(req: _Request) -> bool:
+        conn = req.headers.get("Connection", "").lower()
+        if req.version == "HTTP/1.1":
+            return "close" not in conn
+        return "keep-alive" in conn
+
+    def _response_head(self, req: _Request | None, status: int, headers: list[tuple[str, str]], keep_alive: bool) -> bytes:
+        if req is not None:
+            req.metric_status = status
+        try:
+            reason = HTTPStatus(status).phrase
+        except ValueError:
+            reason = ""
+        lines = [f"HTTP/1.1 {status} {reason}", f"Date: {formatdate(usegmt=True)}", "Server: FinanceHub"]
+        lines.extend(f"{k}: {v}" for k, v in headers)
+        if req is not None and req.timer.server_timing:
+            lines.append(f"Server-Timing: {req.timer.header()}")
+        if not keep_alive:
+            lines.append("Connection: close")
+        elif req is not None and req.version == "HTTP/1.0":
+            lines.append("Connection: keep-alive")
+            lines.append(f"Keep-Alive: timeout={self._keepalive_timeout}")
+        return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
+
+    async def _send_simple(
+        self,
+        writer: asyncio.StreamWriter,
+        req: _Request | None,
+        status: int,
+        content_type: str,
+        raw: bytes,
+        keep_alive: bool,
+        extra: list[tuple[str, str]] | None = None,
+    ) -> bool:
+        headers = [("Content-Type", content_type)]
+        if req is not None:
+            raw, encoding = _encode_hub_body(req.headers.get("Accept-Encoding", ""), raw)
+            if encoding != "identity":
+                headers.append(("Content-Encoding", encoding))
+            headers.append(("Vary", "Accept-Encoding"))
+        headers.extend(extra or [])
+        if req is not None and status == 200:
+            headers.append(("ETag", hub_etag(raw)))
+            status, headers = conditional_response(req.headers, req.method, status, headers)
+        if status == 304:
+            raw = b""
+        else:
+            headers.append(("Content-Length", str(len(raw))))
+        if req is not None and req.method == "HEAD":
+            raw = b""
+        writer.write(self._response_head(req, status, headers, keep_alive) + raw)
+        await writer.drain()
+        return keep_alive
+
+    async def _send_json(self, writer, req, status: int, payload: dict, keep_alive: bool) -> bool:
+        raw = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        return await self._send_simple(writer, req, status, "application/json; charset=utf-8", raw, keep_alive)
+
+    async def _send_html(
+        self, writer, req, status: int, html: str, keep_alive: bool, extra: list[tuple[str, str]] | None = None
+    ) -> bool:
+        return await self._send_simple(
+            writer, req, status, "text/html; charset=utf-8", html.encode("utf-8"), keep_alive, extra
+        )
+
+    async def _dispatch(self, req: _Request, reader, writer, keep_alive: bool) -> bool:
+        snap = self.settings.snapshot()
+        req.timer.configure(snap.config)
+        req.timer.lap("cfg")
+        path = urlparse(req.target).path
+        # Rotas do proprio hub nao leem corpo: fecha a conexao para nao interpretar o resto.
+        body_keep = keep_alive and not req.has_body()
+
+        accept = req.headers.get("Accept-Encoding", "")
+        if path == "/":
+            out_headers, body = _precompressed_reply(self._home_page(snap), accept, [("Cache-Control", HOME_CACHE_CONTROL)])
+            return await self._send_buffered_async(req, writer, 200, out_headers, body, body_keep)
+        if path.startswith(HUB_STATIC_PREFIX):
+            static = self._hub_static(path)
+            if static is None:
+                return await self._send_json(writer, req, 404, {"ok": False, "error": "Nao encontrado"}, body_keep)
+            out_headers, body = _precompressed_reply(static, accept, [("Cache-Control", STATIC_CACHE_CONTROL)])
+            return await self._send_buffered_async(req, writer, 200, out_headers, body, body_keep)
+        if path == "/hub/api/stats":
+            return await self._send_json(writer, req, 200, self._stats_payload(), body_keep)
+        if path == "/hub/metrics":
+            raw = metrics.REGISTRY.render().encode("utf-8")
+            return await self._send_simple(writer, req, 200, metrics.CONTENT_TYPE, raw, body_keep)
+        if path == "/hub/api/instances":
+            since, wait = self._feed_params(urlparse(req.target).query)
+            if since is None:
+                return await self._send_json(writer, req, 200, self._instances_payload(), body_keep)
+            req.timer.long_lived = True
+            await self._wait_feed(since, wait)
+            _, _, raw = self._feed_json(since)
+            return await self._send_simple(
+                writer, req, 200, "application/json; charset=utf-8", raw, body_keep, [("Cache-Control", "no-cache")]
+            )
+        if path.startswith("/hub/api/instances/") and path.endswith("/logs"):
+            instance_id = self._logs_instance(path)
+            if instance_id is None:
+                return await self._send_json(writer, req, 404, {"ok": False, "error": "Instancia nao encontrada"}, body_keep)
+            limit, since, follow = self._log_params(urlparse(req.target).query, req.headers.get("Last-Event-ID", ""))
+            if follow:
+                req.timer.long_lived = True
+                return await self._logs_stream_async(writer, req, instance_id, since, limit)
+            raw = self._logs_json(instance_id, since, limit)
+            return await self._send_simple(
+                writer, req, 200, "application/json; charset=utf-8", raw, body_keep, [("Cache-Control", "no-cache")]
+            )
+        if path == "/hub/api/instances/stream":
+            since, _ = self._feed_params(urlparse(req.target).query)
+            last_id = req.headers.get("Last-Event-ID", "")
+            req.timer.long_lived = True
+            return await self._feed_stream_async(writer, req, int(last_id) if last_id.isdigit() else since or 0)
+
+        match = self._route_table(snap).match(path)
+        if match is None:
+            req.metric_route = "unmatched"
+            return await self._send_json(writer, req, 404, {"ok": False, "error": "Nao encontrado"}, body_keep)
+        req.metric_route = match.prefix
+        req.timer.lap("route")
+        inst = match.instance
+        if match.exact:
+            location = f"/{match.prefix}/"
+            return await self._send_simple(writer, req, 302, "text/plain", b"", body_keep, [("Location", location)])
+        permit = self.breakers.allow(inst.instance_id)
+        if permit is None:
+            html, extra = self._unavailable_page(inst, breaker_open=True)
+            return await self._send_html(writer, req, 503, html, body_keep, extra)
+        try:
+            if not self.health.is_up(inst.instance_id):
+                loop = asyncio.get_running_loop()
+                ok = await loop.run_in_executor(None, self._ensure_backend_online, inst, True)
+                if not ok:
+                    self.breakers.record_failure(inst.instance_id, "backend nao ficou online")
+                    html, extra = self._unavailable_page(inst, breaker_open=False)
+                    return await self._send_html(writer, req, 503, html, body_keep, extra)
+            req.timer.lap("backend")
+            return await self._proxy_async(req, reader, writer, inst, keep_alive)
+        finally:
+            self.breakers.release(inst.instance_id, permit)
+
+    async def _wait_feed(self, since: int, timeout: float) -> int:
+        return await self._wait_change(self.runtime.feed, since, timeout)
+
+    @staticmethod
+    async def _wait_change(feed, since: int, timeout: float) -> int:
+        # Espera uma versao nova sem ocupar thread: o StatusFeed/LogTail acorda um Future do loop.
+        if feed.version != since or timeout <= 0:
+            return feed.version
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        def wake(version: int) -> None:
+            try:
+                loop.call_soon_threadsafe(lambda: future.done() or future.set_result(version))
+            except RuntimeError:
+                pass
+
+        feed.add_listener(wake)
+        try:
+            if feed.version != since:
+                return feed.version
+            try:
+                return await asyncio.wait_for(future, timeout)
+            except asyncio.TimeoutError:
+                return feed.version
+        finally:
+            feed.remove_listener(wake)
+
+    async def _feed_stream_async(self, writer, req: _Request, since: int) -> bool:
+        head = self._response_head(
+            req, 200, [("Content-Type", "text/event-stream; charset=utf-8"), ("Cache-Control", "no-cache")], False
+        )
+        if req.method == "HEAD":
+            writer.write(head)
+            await writer.drain()
+            return False
+        try:
+            writer.write(head + b"retry: 3000\n\n")
+            while True:
+                if since <= 0 or self.runtime.feed.version != since:
+                    since, full, raw = self._feed_json(since)
+                    writer.write(self._sse_event(since, full, raw))
+                elif await self._wait_feed(since, FEED_HEARTBEAT) == since:
+                    writer.write(b": ping\n\n")
+                await writer.drain()
+        except (ConnectionError, OSError):
+            return False
+
+    async def _logs_stream_async(self, writer, req: _Request, instance_id: str, since: int, limit: int) -> bool:
+        head = self._response_head(
+            req, 200, [("Content-Type", "text/event-stream; charset=utf-8"), ("Cache-Control", "no-cache")], False
+        )
+        if req.method == "HEAD":
+            writer.write(head)
+            await writer.drain()
+            return False
+        tail = self.output.tail(instance_id)
+        try:
+            writer.write(head + b"retry: 3000\n\n")
+            since, raw = self._log_events(tail, since, limit)
+            while True:
+                if raw:
+                    writer.write(raw)
+                await writer.drain()
+                if await self._wait_change(tail, since, FEED_HEARTBEAT) == since:
+                    raw = b": ping\n\n"
+                else:
+                    since, raw = self._log_events(tail, since)
+        except (ConnectionError, OSError):
+            return False
+
+    # --- upstream ------------------------------------------------------------------
+
+    @staticmethod
+    def _upstream_key(base_url: str) -> tuple[str, int]:
+        parsed = urlparse(base_url)
+        return parsed.hostname or "127.0.0.1", parsed.port or 80
+
+    async def _upstream_open(self, key: tuple[str, int], fresh: bool) -> tuple[asyncio.StreamReader, asyncio.StreamWriter, bool]:
+        stack = self._aio_idle.get(key) or []
+        now = time.monotonic()
+        while not fresh and stack:
+            idle_since, r, w = stack.pop()
+            if r.at_eof() or w.is_closing() or now - idle_since > self.upstream.idle_timeout:
+                self._aio_counters["stale_discarded"] += 1
+                w.close()
+                continue
+            self._aio_counters["hits"] += 1
+            return r, w, True
+        self._aio_counters["misses"] += 1
+        started = time.perf_counter()
+        r, w = await asyncio.wait_for(asyncio.open_connection(key[0], key[1], limit=_MAX_LINE), timeout=UPSTREAM_TIMEOUT)
+        metrics.UPSTREAM_CONNECT.observe(time.perf_counter() - started, f"{key[0]}:{key[1]}")
+        return r, w, False
+
+    def _upstream_release(self, key: tuple[str, int], r, w, resp: _UpstreamResponse) -> None:
+        # Chamado com o corpo lido ate o fim: fecha a medida de tempo total do backend.
+        if resp.sent_at:
+            metrics.UPSTREAM_TOTAL.observe(time.perf_counter() - resp.sent_at, resp.backend)
+        reusable = not resp.will_close
+        stack = self._aio_idle.setdefault(key, [])
+        if reusable and not w.is_closing() and len(stack) < self.upstream.max_idle_per_backend:
+            stack.append((time.monotonic(), r, w))
+        else:
+            w.close()
+
+    async def _read_upstream_head(self, r: asyncio.StreamReader, method: str, key: tuple[str, int], sent_at: float) -> _UpstreamResponse:
+        resp = await self._read_upstream_status(r, method)
+        resp.sent_at, resp.backend = sent_at, f"{key[0]}:{key[1]}"
+        metrics.UPSTREAM_TTFB.observe(time.perf_counter() - sent_at, resp.backend)
+        return resp
+
+    async def _read_upstream_status(self, r: asyncio.StreamReader, method: str) -> _UpstreamResponse:
+        while True:
+            head = await asyncio.wait_for(_read_head(r), timeout=UPSTREAM_TIMEOUT)
+            if head is None:
+                raise _UpstreamStale("Backend fechou a conexao")
+            line, headers = head
+            parts = line.decode("latin-1").strip().split(" ", 2)
+            status = int(parts[1])
+            if 100 <= status < 200:
+                continue
+            version = parts[0]
+            conn = headers.get("Connection", "").lower()
+            will_close = "close" in conn or (version == "HTTP/1.0" and "keep-alive" not in conn)
+            chunked = "chunked" in headers.get("Transfer-Encoding", "").lower()
+            length = None
+            if status in {204, 304} or method == "HEAD":
+                length = 0
+            elif not chunked and headers.get("Content-Length"):
+                length = int(headers.get("Content-Length"))
+            if length is None and not chunked:
+                will_close = True
+            return _UpstreamResponse(status, headers, length, chunked, will_close)
+
+    def _upstream_body(self, r: asyncio.StreamReader, resp: _UpstreamResponse):
+        # Timeout por leitura: backend travado no meio do corpo nao prende a conexao para sempre.
+        if resp.chunked:
+            return _iter_chunked(r, timeout=UPSTREAM_TIMEOUT)
+        if resp.length is not None:
+            return _iter_fixed(r, resp.length, timeout=UPSTREAM_TIMEOUT)
+        return _iter_until_eof(r, timeout=UPSTREAM_TIMEOUT)
+
+    async def _exchange_async(self, inst: InstanceConfig, target: str, headers: dict):
+        # GET sem corpo: envia e le o cabecalho da resposta, com uma nova tentativa se a
+        # conexao reutilizada estava morta. Falhas ja ficam registradas em health/breaker.
+        host, port = key = self._upstream_key(inst.backend_url)
+        head_lines = [f"GET {target} HTTP/1.1", f"Host: {host}:{port}"]
+        head_lines.extend(f"{k}: {v}" for k, v in headers.items())
+        request_head = ("\r\n".join(head_lines) + "\r\n\r\n").encode("latin-1")
+        started = time.perf_counter()
+        fresh = False
+        while True:
+            w = None
+            reused = False
+            try:
+                r, w, reused = await self._upstream_open(key, fresh)
+                sent_at = time.perf_counter()
+                w.write(request_head)
+                await w.drain()
+                resp = await self._read_upstream_head(r, "GET", key, sent_at)
+                break
+            except Exception as exc:
+                if w is not None:
+                    w.close()
+                if reused and isinstance(exc, (_UpstreamStale, ConnectionError, asyncio.IncompleteReadError)):
+                    self._aio_counters["retries"] += 1
+                    fresh = True
+                    continue
+                self._backend_failed(inst, str(exc) or type(exc).__name__)
+                raise
+        self._backend_ok(inst, (time.perf_counter() - started) * 1000)
+        return key, r, w, resp
+
+    async def _read_all_async(self, inst: InstanceConfig, key, r, w, resp: _UpstreamResponse) -> bytes:
+        try:
+            raw = b"".join([block async for block in self._upstream_body(r, resp)])
+        except Exception as exc:
+            w.close()
+            self._backend_failed(inst, str(exc) or type(exc).__name__)
+            raise
+        self._upstream_release(key, r, w, resp)
+        return raw
+
+    async def _fetch_buffered_async(self, inst: InstanceConfig, target: str, headers: dict) -> BufferedResponse:
+        key, r, w, resp = await self._exchange_async(inst, target, headers)
+        raw = await self._read_all_async(inst, key, r, w, resp)
+        return BufferedResponse(resp.status, resp.headers, raw)
+
+    async def _send_buffered_async(
+        self, req: _Request, writer, status: int, out_headers: list[tuple[str, str]], body: bytes, keep_alive: bool
+    ) -> bool:
+        status, out_headers = conditional_response(req.headers, req.method, status, out_headers)
+        if status in {204, 304}:
+            body = b""
+        else:
+            out_headers.append(("Content-Length", str(len(body))))
+        if req.method == "HEAD":
+            body = b""
+        writer.write(self._response_head(req, status, out_headers, keep_alive) + body)
+        await writer.drain()
+        return keep_alive
+
+    async def _proxy_asset_async(
+        self, req: _Request, writer, inst: InstanceConfig, target: str, headers: dict, cache_key: tuple, keep_alive: bool
+    ) -> bool:
+        client_accept = req.headers.get("Accept-Encoding", "")
+        credentialed = bool(req.headers.get("Cookie"))
+        loop = asyncio.get_running_loop()
+        # Memoria primeiro; disco (leitura de arquivo) fora do event loop.
+        entry = self.assets.get(cache_key, disk=False) or await loop.run_in_executor(None, self.assets.get_disk, cache_key)
+        entry = self._cached_for(entry, credentialed)
+        req.timer.lap("cache")
+        # Rewrite/compressao de ate alguns MB: fora do event loop, como o disco.
+        if entry is not None and entry.fresh():
+            out_headers, body = await loop.run_in_executor(
+                None, self._asset_reply, inst, target, entry, client_accept, "HIT"
+            )
+            req.timer.lap("rewrite")
+            return await self._send_buffered_async(req, writer, 200, out_headers, body, keep_alive)
+        request_headers = without_conditionals(headers)
+        if entry is not None:
+            request_headers.update(entry.validators())
+        try:
+            key, r, w, resp = await self._exchange_async(inst, target, request_headers)
+            req.timer.lap("upstream")
+            if resp.status == 304 and entry is not None:
+                await self._read_all_async(inst, key, r, w, resp)
+                entry = await loop.run_in_executor(None, self._refresh_asset, cache_key, entry, resp.headers, credentialed)
+                req.timer.lap("cache")
+                out_headers, body = await loop.run_in_executor(
+                    None, self._asset_reply, inst, target, entry, client_accept, "REVALIDATED"
+                )
+                req.timer.lap("rewrite")
+                return await self._send_buffered_async(req, writer, 200, out_headers, body, keep_alive)
+            if resp.length is None or resp.length > MAX_ASSET_BYTES or self._asset_policy(resp.status, resp.headers, credentialed) is None:
+                return await self._relay_async(req, writer, inst, key, r, w, resp, target, inst.route_prefix.strip("/"), keep_alive)
+            raw = await self._read_all_async(inst, key, r, w, resp)
+        except Exception as exc:
+            return await self._send_html(writer, req, 502, f"<h1>Backend indisponivel</h1><p>{exc}</p>", False)
+        req.timer.lap("read")
+        entry = await loop.run_in_executor(None, self._store_asset, cache_key, resp.status, resp.headers, raw, credentialed)
+        req.timer.lap("cache")
+        if entry is None:
+            result = BufferedResponse(resp.status, resp.headers, raw)
+            out_headers, body = await loop.run_in_executor(
+                None, self._buffered_reply, inst, inst.route_prefix.strip("/"), target, result, client_accept
+            )
+            req.timer.lap("rewrite")
+            return await self._send_buffered_async(req, writer, resp.status, out_headers, body, keep_alive)
+        out_headers, body = await loop.run_in_executor(
+            None, self._asset_reply, inst, target, entry, client_accept, "MISS"
+        )
+        req.timer.lap("rewrite")
+        return await self._send_buffered_async(req, writer, 200, out_headers, body, keep_alive)
+
+    async def _proxy_coalesced_async(
+        self, req: _Request, writer, inst: InstanceConfig, target: str, headers: dict, key: tuple, keep_alive: bool
+    ) -> bool:
+        prefix = inst.route_prefix.strip("/")
+        try:
+            result, _ = await self.coalescer.do_async(
+                key, lambda: self._fetch_buffered_async(inst, target, without_conditionals(headers))
+            )
+            req.timer.lap("upstream")
+            out_headers, body = await asyncio.get_running_loop().run_in_executor(
+                None, self._buffered_reply, inst, prefix, target, result, req.headers.get("Accept-Encoding", "")
+            )
+            req.timer.lap("rewrite")
+        except Exception as exc:
+            return await self._send_html(writer, req, 502, f"<h1>Backend indisponivel</h1><p>{exc}</p>", False)
+        return await self._send_buffered_async(req, writer, result.status, out_headers, body, keep_alive)
+
+    async def _proxy_async(self, req: _Request, reader, writer, inst: InstanceConfig, keep_alive: bool) -> bool:
+        prefix = inst.route_prefix.strip("/")
+        target = self._backend_path(req.target, f"/{prefix}")
+        headers = self._upstream_request_headers(req.headers)
+        asset_key = self._asset_key(inst, req.method, target, req.headers, headers)
+        if asset_key is not None:
+            return await self._proxy_asset_async(req, writer, inst, target, headers, asset_key, keep_alive)
+        coalesce_key = self._coalesce_key(inst, req.method, target, req.headers, headers)
+        if coalesce_key is not None:
+            return await self._proxy_coalesced_async(req, writer, inst, target, headers, coalesce_key, keep_alive)
+        host, port = key = self._upstream_key(inst.backend_url)
+        max_body = int(self.settings.snapshot().config.max_request_body_mb) * 1024 * 1024
+
+        chunked_in = "chunked" in req.headers.get("Transfer-Encoding", "").lower()
+        try:
+            length_in = 0 if chunked_in else int(req.headers.get("Content-Length", "0") or 0)
+        except ValueError:
+            return await self._send_html(writer, req, 400, "<h1>Requisicao invalida</h1>", False)
+        if length_in > max_body:
+            return await self._send_html(writer, req, 413, "<h1>Corpo da requisicao muito grande</h1>", False)
+        if chunked_in:
+            headers["Transfer-Encoding"] = "chunked"
+        elif length_in:
+            headers["Content-Length"] = str(length_in)
+        head_lines = [f"{req.method} {target} HTTP/1.1", f"Host: {host}:{port}"]
+        head_lines.extend(f"{k}: {v}" for k, v in headers.items())
+        request_head = ("\r\n".join(head_lines) + "\r\n\r\n").encode("latin-1")
+        req.timer.lap("prepare")
+
+        started = time.perf_counter()
+        fresh = False
+        while True:
+            try:
+                r, w, reused = await self._upstream_open(key, fresh)
+            except Exception as exc:
+                self._backend_failed(inst, str(exc) or type(exc).__name__)
+                return await self._send_html(writer, req, 502, f"<h1>Backend indisponivel</h1><p>{exc}</p>", False)
+            try:
+                sent_at = time.perf_counter()
+                w.write(request_head)
+                # Cliente parado no meio do upload: mesmo limite por leitura do socket no modo
+                # threaded (timeout do keep-alive), senao prende a conexao com o backend.
+                if chunked_in:
+                    async for block in _client_body(_iter_chunked(reader, max_body, self._keepalive_timeout)):
+                        w.write(b"%x\r\n%s\r\n" % (len(block), block))
+                        await w.drain()
+                    w.write(b"0\r\n\r\n")
+                elif length_in:
+                    async for block in _client_body(_iter_fixed(reader, length_in, self._keepalive_timeout)):
+                        w.write(block)
+                        await w.drain()
+                await w.drain()
+                resp = await self._read_upstream_head(r, req.method, key, sent_at)
+                break
+            except RequestBodyTooLarge:
+                w.close()
+                return await self._send_html(writer, req, 413, "<h1>Corpo da requisicao muito grande</h1>", False)
+            except ClientBodyError:
+                w.close()
+                return False
+            except MalformedChunkedBody as exc:
+                w.close()
+                return await self._send_html(writer, req, 400, f"<h1>Requisicao invalida</h1><p>{exc}</p>", False)
+            except (_UpstreamStale, ConnectionError, asyncio.IncompleteReadError) as exc:
+                w.close()
+                # Conexao keep-alive que o backend fechou: uma nova tentativa se for seguro.
+                if reused and not req.has_body() and req.method in IDEMPOTENT_METHODS:
+                    self._aio_counters["retries"] += 1
+                    fresh = True
+                    continue
+                self._backend_failed(inst, str(exc) or type(exc).__name__)
+                return await self._send_html(writer, req, 502, f"<h1>Backend indisponivel</h1><p>{exc}</p>", False)
+            except Exception as exc:
+                w.close()
+                self._backend_failed(inst, str(exc) or type(exc).__name__)
+                return await self._send_html(writer, req, 502, f"<h1>Backend indisponivel</h1><p>{exc}</p>", False)
+        self._backend_ok(inst, (time.perf_counter() - started) * 1000)
+        req.timer.lap("upstream")
+
+        return await self._relay_async(req, writer, inst, key, r, w, resp, target, prefix, keep_alive)
+
+    async def _relay_async(
+        self, req: _Request, writer, inst: InstanceConfig, key, r, w, resp: _UpstreamResponse, target: str, prefix: str, keep_alive: bool
+    ) -> bool:
+        if req.method == "HEAD":
+            # resp.length e 0 (nada a ler); os cabecalhos do backend seguem como vieram.
+            writer.write(self._response_head(req, resp.status, self._head_headers(resp.headers, prefix), keep_alive))
+            await writer.drain()
+            self._upstream_release(key, r, w, resp)
+            return keep_alive
+        client_accept = req.headers.get("Accept-Encoding", "")
+        ct = resp.headers.get("Content-Type", "")
+        upstream_enc = normalize_encoding(resp.headers.get("Content-Encoding", ""))
+        body = self._upstream_body(r, resp)
+        if resp.status in {204, 304} or not is_rewritable(ct) or not can_decode(upstream_enc):
+            return await self._stream_async(req, writer, key, r, w, resp, body, prefix, keep_alive)
+        rewriter = self._rewriter_for(inst)
+        out_enc = negotiate(client_accept) if is_compressible(ct) else "identity"
+        if resp.length is None or resp.length > REWRITE_BUFFER_LIMIT:
+            transform = TransformChain(stream_decoder(upstream_enc), rewriter.stream(), stream_encoder(out_enc))
+            return await self._stream_async(req, writer, key, r, w, resp, body, prefix, keep_alive, transform, out_enc)
+
+        try:
+            raw = b"".join([block async for block in body])
+        except Exception as exc:
+            w.close()
+            self._backend_failed(inst, str(exc) or type(exc).__name__)
+            return await self._send_html(writer, req, 502, f"<h1>Backend indisponivel</h1><p>{exc}</p>", False)
+        self._upstream_release(key, r, w, resp)
+        req.timer.lap("read")
+        try:
+            out_headers, rewritten = await asyncio.get_running_loop().run_in_executor(
+                None, self._buffered_reply, inst, prefix, target, BufferedResponse(resp.status, resp.headers, raw), client_accept
+            )
+        except Exception as exc:
+            return await self._send_html(writer, req, 502, f"<h1>Resposta invalida do backend</h1><p>{exc}</p>", keep_alive)
+        req.timer.lap("rewrite")
+        return await self._send_buffered_async(req, writer, resp.status, out_headers, rewritten, keep_alive)
+
+    async def _stream_async(
+        self,
+        req: _Request,
+        writer,
+        key,
+        r,
+        w,
+        resp: _UpstreamResponse,
+        body,
+        prefix: str,
+        keep_alive: bool,
+        transform: TransformChain | None = None,
+        encoding: str | None = None,
+    ) -> bool:
+        out_headers = self._upstream_response_headers(resp.headers, prefix, encoding)
+        chunked = False
+        no_body = resp.status in {204, 304}
+        if no_body:
+            pass
+        elif resp.length is not None and transform is None:
+            out_headers.append(("Content-Length", str(resp.length)))
+        elif req.version == "HTTP/1.1":
+            out_headers.append(("Transfer-Encoding", "chunked"))
+            chunked = True
+        else:
+            keep_alive = False
+        writer.write(self._response_head(req, resp.status, out_headers, keep_alive))
+        try:
+            async for block in body:
+                if transform is not None:
+                    block = transform.feed(block)
+                if block:
+                    writer.write(b"%x\r\n%s\r\n" % (len(block), block) if chunked else block)
+                    await writer.drain()
+            if transform is not None:
+                tail = transform.flush()
+                if tail:
+                    writer.write(b"%x\r\n%s\r\n" % (len(tail), tail) if chunked else tail)
+            if chunked:
+                writer.write(b"0\r\n\r\n")
+            await writer.drain()
+        except Exception:
+            w.close()
+            return False
+        finally:
+            req.timer.lap("stream")
+        self._upstream_release(key, r, w, resp)
+        return keep_alive
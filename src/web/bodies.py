@@ -0,0 +1,75 @@
+from __future__ import annotations
+
+import re
+from typing import BinaryIO, Iterator
+
+
+BODY_CHUNK_SIZE = 64 * 1024
+
+# So hex puro: int(..., 16) aceitaria "-100", "0x10" e "1_0" (tamanho negativo furava o limite).
+_CHUNK_SIZE = re.compile(rb"[0-9A-Fa-f]+")
+
+
+class RequestBodyTooLarge(Exception):
+    pass
+
+
+class MalformedChunkedBody(Exception):
+    pass
+
+
+class ClientBodyError(Exception):
+    # Falha lendo o corpo do lado do cliente (desconexao/timeout), nao do backend.
+    pass
+
+
+def parse_chunk_size(line: bytes) -> int:
+    digits = line.split(b";", 1)[0].strip()
+    if not _CHUNK_SIZE.fullmatch(digits):
+        raise MalformedChunkedBody(f"Tamanho de chunk invalido: {line[:40]!r}")
+    return int(digits, 16)
+
+
+def iter_fixed_body(rfile: BinaryIO, length: int, chunk_size: int = BODY_CHUNK_SIZE) -> Iterator[bytes]:
+    # Le exatamente `length` bytes do cliente, um bloco por vez.
+    remaining = length
+    while remaining > 0:
+        try:
+            block = rfile.read(min(chunk_size, remaining))
+        except OSError as exc:
+            raise ClientBodyError(str(exc)) from exc
+        if not block:
+            raise ClientBodyError("Cliente encerrou o envio do corpo antes do fim")
+        remaining -= len(block)
+        yield block
+
+
+def iter_chunked_body(rfile: BinaryIO, max_bytes: int, chunk_size: int = BODY_CHUNK_SIZE) -> Iterator[bytes]:
+    # Decodifica Transfer-Encoding: chunked de entrada sem bufferizar o corpo inteiro;
+    # o limite e verificado pelo tamanho declarado de cada chunk, antes de ler os dados.
+    total = 0
+    while True:
+        try:
+            line = rfile.readline(1024)
+        except OSError as exc:
+            raise ClientBodyError(str(exc)) from exc
+        if not line:
+            raise ClientBodyError("Cliente encerrou o envio do corpo antes do fim")
+        size = parse_chunk_size(line)
+        if size == 0:
+            # Trailers opcionais ate a linha vazia final.
+            while True:
+                try:
+                    trailer = rfile.readline(8192)
+                except OSError as exc:
+                    raise ClientBodyError(str(exc)) from exc
+                if trailer in {b"\r\n", b"\n", b""}:
+                    return
+        total += size
+        if max_bytes and total > max_bytes:
+            raise RequestBodyTooLarge(f"Corpo excede {max_bytes} bytes")
+        yield from iter_fixed_body(rfile, size, chunk_size)
+        try:
+            rfile.readline(8)
+        except OSError as exc:
+            raise ClientBodyError(str(exc)) from exc
@@ -0,0 +1,129 @@
+from __future__ import annotations
+
+import itertools
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Callable
+
+
+VALID_BREAKER = {"closed", "open", "half_open"}
+
+
+@dataclass
+class BreakerState:
+    state: str = "closed"
+    consecutive_failures: int = 0
+    last_error: str = ""
+    opened_at: str = ""
+    open_until: float = 0.0
+    # Ficha da requisicao de teste em andamento (0 = nenhuma).
+    probe_token: int = 0
+    trips: int = 0
+    rejected: int = 0
+
+
+class CircuitBreakers:
+    # Um disjuntor por instancia. closed: tudo passa. open: falha rapido ate o fim do
+    # cooldown. half_open: uma unica requisicao de teste passa; sucesso fecha, falha reabre.
+    def __init__(
+        self,
+        failure_threshold: int = 5,
+        cooldown_seconds: float = 30.0,
+        on_change: Callable[[str, str, str], None] | None = None,
+    ):
+        self.failure_threshold = max(1, int(failure_threshold))
+        self.cooldown_seconds = max(1.0, float(cooldown_seconds))
+        self._on_change = on_change
+        self._states: dict[str, BreakerState] = {}
+        self._lock = threading.Lock()
+        self._tokens = itertools.count(1)
+
+    def _set(self, instance_id: str, state: BreakerState, status: str) -> tuple[str, str] | None:
+        previous = state.state
+        state.state = status
+        if status == "open":
+            state.open_until = time.monotonic() + self.cooldown_seconds
+            state.opened_at = datetime.now().isoformat(timespec="seconds")
+            if previous == "closed":
+                state.trips += 1
+        elif status == "closed":
+            state.open_until = 0.0
+            state.opened_at = ""
+        return (previous, status) if previous != status else None
+
+    def _notify(self, instance_id: str, change: tuple[str, str] | None) -> None:
+        if change and self._on_change:
+            self._on_change(instance_id, change[0], change[1])
+
+    def allow(self, instance_id: str) -> int | None:
+        # None: recusada. 0: passa normalmente. >0: e a requisicao de teste; a ficha vai
+        # para release() no fim.
+        change = None
+        with self._lock:
+            state = self._states.setdefault(instance_id, BreakerState())
+            if state.state == "closed":
+                return 0
+            if state.state == "open" and time.monotonic() >= state.open_until:
+                change = self._set(instance_id, state, "half_open")
+            if state.state == "half_open" and not state.probe_token:
+                state.probe_token = next(self._tokens)
+                permit = state.probe_token
+            else:
+                state.rejected += 1
+                permit = None
+        self._notify(instance_id, change)
+        return permit
+
+    def retry_after(self, instance_id: str) -> int:
+        state = self._states.get(instance_id)
+        if state is None or state.state == "closed":
+            return 0
+        return max(1, int(state.open_until - time.monotonic() + 0.999))
+
+    def record_success(self, instance_id: str) -> None:
+        with self._lock:
+            state = self._states.setdefault(instance_id, BreakerState())
+            state.consecutive_failures = 0
+            state.last_error = ""
+            state.probe_token = 0
+            change = self._set(instance_id, state, "closed")
+        self._notify(instance_id, change)
+
+    def record_failure(self, instance_id: str, error: str) -> None:
+        change = None
+        with self._lock:
+            state = self._states.setdefault(instance_id, BreakerState())
+            state.consecutive_failures += 1
+            state.last_error = error
+            # Falhas tardias de requisicoes anteriores a abertura nao estendem o cooldown.
+            if state.state == "half_open" or (
+                state.state == "closed" and state.consecutive_failures >= self.failure_threshold
+            ):
+                state.probe_token = 0
+                change = self._set(instance_id, state, "open")
+        self._notify(instance_id, change)
+
+    def release(self, instance_id: str, permit: int | None) -> None:
+        # Requisicao de teste terminou sem resultado do backend (ex.: erro do cliente):
+        # libera a vaga para a proxima tentar. So a propria requisicao de teste libera.
+        if not permit:
+            return
+        with self._lock:
+            state = self._states.get(instance_id)
+            if state is not None and state.probe_token == permit:
+                state.probe_token = 0
+
+    def snapshot(self, instance_id: str) -> dict:
+        with self._lock:
+            state = self._states.get(instance_id) or BreakerState()
+            return {
+                "state": state.state,
+                "consecutive_failures": state.consecutive_failures,
+                "last_error": state.last_error,
+                "opened_at": state.opened_at,
+                "retry_after_seconds": self.retry_after(instance_id),
+                "trips": state.trips,
+                "rejected": state.rejected,
+            }
@@ -0,0 +1,75 @@
+from __future__ import annotations
+
+import threading
+from collections import OrderedDict
+from typing import Any, Hashable
+
+
+# Custo fixo estimado por entrada (chave, tupla, nos do OrderedDict).
+_ENTRY_OVERHEAD = 256
+
+
+class ByteLRUCache:
+    # LRU limitado pelo total de bytes armazenados, nao pelo numero de entradas.
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max(0, int(max_bytes))
+        self._items: OrderedDict[Hashable, tuple[Any, int, int]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._size = 0
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._bytes_saved = 0
+
+    def get(self, key: Hashable) -> Any | None:
+        with self._lock:
+            entry = self._items.get(key)
+            if entry is None:
+                self._misses += 1
+                return None
+            self._items.move_to_end(key)
+            self._hits += 1
+            self._bytes_saved += entry[2]
+            return entry[0]
+
+    def put(self, key: Hashable, value: Any, size: int, saved: int = 0) -> None:
+        # `saved`: bytes de trabalho poupados a cada hit (ex.: tamanho do corpo original).
+        cost = int(size) + _ENTRY_OVERHEAD
+        if cost > self.max_bytes:
+            return
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self._size -= old[1]
+            self._items[key] = (value, cost, int(saved))
+            self._size += cost
+            while self._size > self.max_bytes and self._items:
+                _, (_, evicted_cost, _) = self._items.popitem(last=False)
+                self._size -= evicted_cost
+                self._evictions += 1
+
+    def invalidate(self, predicate) -> int:
+        with self._lock:
+            keys = [k for k in self._items if predicate(k)]
+            for k in keys:
+                self._size -= self._items.pop(k)[1]
+        return len(keys)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._items.clear()
+            self._size = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "entries": len(self._items),
+                "bytes": self._size,
+                "max_bytes": self.max_bytes,
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_ratio": round(self._hits / lookups, 4) if lookups else 0.0,
+                "evictions": self._evictions,
+                "bytes_saved": self._bytes_saved,
+            }
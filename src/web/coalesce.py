@@ -0,0 +1,121 @@
+from __future__ import annotations
+
+import asyncio
+import threading
+from typing import Any, Callable, Hashable, NamedTuple
+
+
+class BufferedResponse(NamedTuple):
+    # Resposta do backend lida por inteiro, compartilhada entre as requisicoes agrupadas.
+    status: int
+    headers: Any
+    body: bytes
+
+
+class _Call:
+    __slots__ = ("done", "result", "error", "waiters")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: BaseException | None = None
+        self.waiters = 0
+
+
+class _LeaderGone(Exception):
+    pass
+
+
+class SingleFlight:
+    # Requisicoes identicas simultaneas esperam a chamada do "lider" em vez de repetir
+    # o trabalho. Nada e guardado depois que a chamada termina: nao e um cache.
+    def __init__(self):
+        self._calls: dict[Hashable, _Call] = {}
+        self._async_calls: dict[Hashable, asyncio.Future] = {}
+        self._lock = threading.Lock()
+        self._leaders = 0
+        self._followers = 0
+        self._errors = 0
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> tuple[Any, bool]:
+        # Retorna (resultado, compartilhado). Erros do lider sao repassados a todos.
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self._leaders += 1
+            else:
+                call.waiters += 1
+                self._followers += 1
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+        try:
+            call.result = fn()
+        except BaseException as exc:
+            call.error = exc
+            with self._lock:
+                self._errors += 1
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+        return call.result, False
+
+    async def do_async(self, key: Hashable, fn) -> tuple[Any, bool]:
+        # Versao para o event loop: `fn` e uma coroutine function; seguidores aguardam o Future.
+        counted = False
+        while True:
+            future = self._async_calls.get(key)
+            if future is None:
+                break
+            if not counted:
+                counted = True
+                with self._lock:
+                    self._followers += 1
+            try:
+                return await asyncio.shield(future), True
+            except _LeaderGone:
+                # Lider cancelado: o primeiro seguidor a acordar assume a chamada.
+                continue
+        future = asyncio.get_running_loop().create_future()
+        self._async_calls[key] = future
+        with self._lock:
+            self._leaders += 1
+        try:
+            result = await fn()
+        except Exception as exc:
+            with self._lock:
+                self._errors += 1
+            self._finish_async(key, future, exc)
+            raise
+        except BaseException:
+            # Cancelamento e do cliente do lider, nao dos seguidores: eles tentam de novo.
+            self._finish_async(key, future, _LeaderGone())
+            raise
+        self._finish_async(key, future)
+        future.set_result(result)
+        return result, False
+
+    def _finish_async(self, key: Hashable, future: asyncio.Future, exc: BaseException | None = None) -> None:
+        if self._async_calls.get(key) is future:
+            del self._async_calls[key]
+        if exc is not None:
+            future.set_exception(exc)
+            # Evita aviso de "exception never retrieved" quando nao ha seguidores.
+            future.exception()
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self._leaders + self._followers
+            return {
+                "upstream_calls": self._leaders,
+                "coalesced": self._followers,
+                "errors": self._errors,
+                "in_flight": len(self._calls) + len(self._async_calls),
+                "collapse_ratio": round(self._followers / total, 4) if total else 0.0,
+            }
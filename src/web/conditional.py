@@ -0,0 +1,97 @@
+from __future__ import annotations
+
+import hashlib
+from email.utils import parsedate_to_datetime
+
+
+# Tags gerados pelo hub; o backend nao os conhece, entao nunca sao repassados a ele.
+HUB_ETAG_PREFIX = '"hub-'
+
+# Metadados da representacao: nao vao num 304 (o cliente ja tem o corpo e seus cabecalhos).
+_REPRESENTATION_HEADERS = {
+    "content-type",
+    "content-encoding",
+    "content-language",
+    "content-length",
+    "content-range",
+    "transfer-encoding",
+}
+
+
+def hub_etag(body: bytes) -> str:
+    # Forte: calculado sobre os bytes exatamente como saem (ja comprimidos, se for o caso).
+    return f'{HUB_ETAG_PREFIX}{hashlib.blake2b(body, digest_size=12).hexdigest()}"'
+
+
+def _split_tags(value: str) -> list[str]:
+    tags = []
+    for part in str(value or "").split(","):
+        part = part.strip()
+        if part:
+            tags.append(part)
+    return tags
+
+
+def _opaque(tag: str) -> str:
+    # Comparacao fraca (If-None-Match): ignora o prefixo W/.
+    return tag[2:] if tag.startswith("W/") else tag
+
+
+def is_not_modified(request_headers, etag: str, last_modified: str = "") -> bool:
+    inm = request_headers.get("If-None-Match")
+    if inm is not None:
+        # If-None-Match presente: If-Modified-Since e ignorado.
+        if not etag:
+            return False
+        tags = _split_tags(inm)
+        return "*" in tags or _opaque(etag) in {_opaque(t) for t in tags}
+    ims = request_headers.get("If-Modified-Since")
+    if not ims or not last_modified:
+        return False
+    try:
+        return parsedate_to_datetime(last_modified) <= parsedate_to_datetime(ims)
+    except (TypeError, ValueError):
+        return False
+
+
+def strip_hub_tags(headers: dict[str, str]) -> None:
+    # Repassa ao backend so validadores que ele mesmo emitiu. Se o cliente tinha uma copia
+    # gerada pelo hub, If-Modified-Since tambem sai: quem decide o 304 e o hub.
+    key = next((k for k in headers if k.lower() == "if-none-match"), None)
+    if key is None:
+        return
+    tags = _split_tags(headers[key])
+    kept = [t for t in tags if not _opaque(t).startswith(HUB_ETAG_PREFIX)]
+    if len(kept) == len(tags):
+        return
+    if kept:
+        headers[key] = ", ".join(kept)
+    else:
+        del headers[key]
+    for k in [k for k in headers if k.lower() == "if-modified-since"]:
+        del headers[k]
+
+
+def without_conditionals(headers: dict[str, str]) -> dict[str, str]:
+    # Buscas compartilhadas (cache/coalescing) precisam do corpo completo, nao de um 304
+    # valido so para o cliente que iniciou a busca.
+    return {k: v for k, v in headers.items() if k.lower() not in {"if-none-match", "if-modified-since"}}
+
+
+def header_value(headers: list[tuple[str, str]], name: str) -> str:
+    lname = name.lower()
+    for k, v in headers:
+        if k.lower() == lname:
+            return v
+    return ""
+
+
+def conditional_response(
+    request_headers, method: str, status: int, headers: list[tuple[str, str]]
+) -> tuple[int, list[tuple[str, str]]]:
+    # 200 com validador que o cliente ja tem vira 304 sem corpo.
+    if status != 200 or method not in {"GET", "HEAD"}:
+        return status, headers
+    if not is_not_modified(request_headers, header_value(headers, "ETag"), header_value(headers, "Last-Modified")):
+        return status, headers
+    return 304, [(k, v) for k, v in headers if k.lower() not in _REPRESENTATION_HEADERS]
@@ -0,0 +1,174 @@
+from __future__ import annotations
+
+import gzip
+import zlib
+
+try:
+    import brotli
+except ImportError:  # brotli e opcional; sem ele o hub negocia apenas gzip.
+    brotli = None
+
+
+# Abaixo disso comprimir nao compensa o custo (cabecalhos + CPU).
+MIN_COMPRESS_SIZE = 1024
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+# Encodings que o hub sabe decodificar (para reescrever) e gerar, em ordem de preferencia.
+SUPPORTED_ENCODINGS = ("br", "gzip") if brotli is not None else ("gzip",)
+
+
+def parse_accept_encoding(header: str) -> dict[str, float]:
+    out: dict[str, float] = {}
+    for part in str(header or "").split(","):
+        token, _, params = part.strip().partition(";")
+        token = token.strip().lower()
+        if not token:
+            continue
+        q = 1.0
+        for param in params.split(";"):
+            name, _, value = param.strip().partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        out[token] = q
+    return out
+
+
+def _accepts(accepted: dict[str, float], encoding: str) -> bool:
+    if encoding in accepted:
+        return accepted[encoding] > 0
+    return accepted.get("*", 0) > 0
+
+
+def negotiate(accept_header: str) -> str:
+    accepted = parse_accept_encoding(accept_header)
+    for encoding in SUPPORTED_ENCODINGS:
+        if _accepts(accepted, encoding):
+            return encoding
+    return "identity"
+
+
+def upstream_accept_encoding(client_header: str) -> str:
+    # Pede ao backend so o que o cliente aceita E o hub consegue decodificar: corpos
+    # repassados chegam ao navegador como vieram; corpos reescritos podem ser abertos.
+    accepted = parse_accept_encoding(client_header)
+    allowed = [enc for enc in SUPPORTED_ENCODINGS if _accepts(accepted, enc)]
+    return ", ".join(allowed) if allowed else "identity"
+
+
+def is_compressible(content_type: str) -> bool:
+    ctype = (content_type or "").lower()
+    return (
+        ctype.startswith("text/")
+        or "javascript" in ctype
+        or "json" in ctype
+        or "xml" in ctype
+        or "svg" in ctype
+    )
+
+
+def normalize_encoding(value: str) -> str:
+    enc = str(value or "").strip().lower()
+    return enc if enc else "identity"
+
+
+def can_decode(encoding: str) -> bool:
+    return encoding == "identity" or encoding in SUPPORTED_ENCODINGS
+
+
+def compress(data: bytes, encoding: str) -> bytes:
+    if encoding == "gzip":
+        return gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)
+    if encoding == "br" and brotli is not None:
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+    return data
+
+
+def decompress(data: bytes, encoding: str) -> bytes:
+    if encoding == "gzip":
+        return zlib.decompress(data, 47)
+    if encoding == "br" and brotli is not None:
+        return brotli.decompress(data)
+    return data
+
+
+class _GzipEncoder:
+    def __init__(self):
+        self._obj = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+
+    def feed(self, data: bytes) -> bytes:
+        return self._obj.compress(data)
+
+    def flush(self) -> bytes:
+        return self._obj.flush()
+
+
+class _GzipDecoder:
+    def __init__(self):
+        self._obj = zlib.decompressobj(47)
+
+    def feed(self, data: bytes) -> bytes:
+        return self._obj.decompress(data)
+
+    def flush(self) -> bytes:
+        return self._obj.flush()
+
+
+class _BrotliEncoder:
+    def __init__(self):
+        self._obj = brotli.Compressor(quality=BROTLI_QUALITY)
+
+    def feed(self, data: bytes) -> bytes:
+        return self._obj.process(data)
+
+    def flush(self) -> bytes:
+        return self._obj.finish()
+
+
+class _BrotliDecoder:
+    def __init__(self):
+        self._obj = brotli.Decompressor()
+
+    def feed(self, data: bytes) -> bytes:
+        return self._obj.process(data)
+
+    def flush(self) -> bytes:
+        return b""
+
+
+def stream_encoder(encoding: str):
+    if encoding == "gzip":
+        return _GzipEncoder()
+    if encoding == "br" and brotli is not None:
+        return _BrotliEncoder()
+    return None
+
+
+def stream_decoder(encoding: str):
+    if encoding == "gzip":
+        return _GzipDecoder()
+    if encoding == "br" and brotli is not None:
+        return _BrotliDecoder()
+    return None
+
+
+class TransformChain:
+    # Encadeia etapas feed/flush (decode -> rewrite -> encode) sobre um corpo em streaming.
+    def __init__(self, *stages):
+        self._stages = [s for s in stages if s is not None]
+
+    def feed(self, data: bytes) -> bytes:
+        for stage in self._stages:
+            if not data:
+                return b""
+            data = stage.feed(data)
+        return data
+
+    def flush(self) -> bytes:
+        data = b""
+        for stage in self._stages:
+            data = (stage.feed(data) if data else b"") + stage.flush()
+        return data
@@ -0,0 +1,123 @@
+from __future__ import annotations
+
+import threading
+import time
+import urllib.error
+import urllib.request
+from dataclasses import asdict, dataclass
+from datetime import datetime
+from typing import Callable, Iterable
+
+from instances.models import InstanceConfig
+
+
+VALID_HEALTH = {"unknown", "up", "down", "starting"}
+
+
+@dataclass
+class BackendHealth:
+    status: str = "unknown"
+    last_latency_ms: float | None = None
+    last_checked_at: str = ""
+    last_error: str = ""
+    consecutive_failures: int = 0
+    source: str = ""
+
+
+class BackendHealthMonitor:
+    # Estado de saude por instancia: probes ativos em thread propria + resultado
+    # passivo das requisicoes reais do proxy. O caminho da requisicao so le memoria.
+    def __init__(
+        self,
+        instances: Callable[[], Iterable[InstanceConfig]],
+        interval_seconds: float = 5.0,
+        probe_timeout: float = 1.2,
+        on_change: Callable[[str, str, str], None] | None = None,
+    ):
+        self._instances = instances
+        self.interval_seconds = max(0.5, float(interval_seconds))
+        self.probe_timeout = float(probe_timeout)
+        self._on_change = on_change
+        self._states: dict[str, BackendHealth] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def _update(self, instance_id: str, status: str, source: str, latency_ms: float | None = None, error: str = "") -> None:
+        if status not in VALID_HEALTH:
+            status = "unknown"
+        with self._lock:
+            state = self._states.setdefault(instance_id, BackendHealth())
+            previous = state.status
+            state.status = status
+            state.source = source
+            state.last_checked_at = datetime.now().isoformat(timespec="seconds")
+            if latency_ms is not None:
+                state.last_latency_ms = round(latency_ms, 2)
+            if status == "down":
+                state.consecutive_failures += 1
+                state.last_error = error
+            elif status == "up":
+                state.consecutive_failures = 0
+                state.last_error = ""
+        if previous != status and self._on_change:
+            self._on_change(instance_id, previous, status)
+
+    def status(self, instance_id: str) -> str:
+        state = self._states.get(instance_id)
+        return state.status if state else "unknown"
+
+    def is_up(self, instance_id: str) -> bool:
+        return self.status(instance_id) == "up"
+
+    def snapshot(self, instance_id: str) -> dict:
+        with self._lock:
+            state = self._states.get(instance_id)
+            return asdict(state) if state else asdict(BackendHealth())
+
+    def mark_starting(self, instance_id: str) -> None:
+        self._update(instance_id, "starting", "startup")
+
+    def record_success(self, instance_id: str, latency_ms: float | None = None, source: str = "passive") -> None:
+        self._update(instance_id, "up", source, latency_ms=latency_ms)
+
+    def record_failure(self, instance_id: str, error: str, source: str = "passive") -> None:
+        self._update(instance_id, "down", source, error=error)
+
+    def probe(self, inst: InstanceConfig) -> bool:
+        started = time.perf_counter()
+        try:
+            with urllib.request.urlopen(inst.backend_url, timeout=self.probe_timeout):
+                pass
+        except urllib.error.HTTPError:
+            # Qualquer resposta HTTP (401, 404, 500...) prova que o processo esta de pe.
+            pass
+        except Exception as exc:
+            if self.status(inst.instance_id) != "starting":
+                self.record_failure(inst.instance_id, str(exc), source="probe")
+            return False
+        self.record_success(inst.instance_id, (time.perf_counter() - started) * 1000, source="probe")
+        return True
+
+    def _loop(self) -> None:
+        while not self._stop.wait(self.interval_seconds):
+            try:
+                instances = list(self._instances())
+            except Exception:
+                continue
+            for inst in instances:
+                if self._stop.is_set():
+                    return
+                if not inst.enabled or not inst.backend_url:
+                    continue
+                self.probe(inst)
+
+    def start(self) -> None:
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, daemon=True, name="hub-health")
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
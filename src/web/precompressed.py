@@ -0,0 +1,37 @@
+from __future__ import annotations
+
+import gzip
+from typing import NamedTuple
+
+from web.conditional import hub_etag
+from web.encoding import MIN_COMPRESS_SIZE, SUPPORTED_ENCODINGS, brotli, negotiate
+
+
+class Precompressed(NamedTuple):
+    # Corpo gerado uma vez pelo hub com todas as variantes ja comprimidas:
+    # encoding -> (bytes, ETag). Servir e so escolher a variante.
+    content_type: str
+    variants: dict[str, tuple[bytes, str]]
+
+    def select(self, accept_encoding: str) -> tuple[bytes, str, str]:
+        encoding = negotiate(accept_encoding)
+        if encoding not in self.variants:
+            encoding = "identity"
+        body, etag = self.variants[encoding]
+        return body, encoding, etag
+
+
+def _compress_max(data: bytes, encoding: str) -> bytes:
+    # Custo pago uma vez por versao: nivel maximo em vez do usado por requisicao.
+    if encoding == "br" and brotli is not None:
+        return brotli.compress(data, quality=11)
+    return gzip.compress(data, compresslevel=9, mtime=0)
+
+
+def precompress(content_type: str, raw: bytes) -> Precompressed:
+    variants = {"identity": (raw, hub_etag(raw))}
+    if len(raw) >= MIN_COMPRESS_SIZE:
+        for encoding in SUPPORTED_ENCODINGS:
+            body = _compress_max(raw, encoding)
+            variants[encoding] = (body, hub_etag(body))
+    return Precompressed(content_type, variants)
@@ -0,0 +1,138 @@
+from __future__ import annotations
+
+import hashlib
+import re
+from functools import lru_cache
+
+
+# Rotas estaticas/media usadas pela UI do FinanceBot.
+DEFAULT_STATIC_ROOTS = ("/store-image", "/favicon.ico", "/assets/", "/static/")
+
+
+def _default_rules() -> tuple[str, ...]:
+    rules = [
+        # API and auth routes
+        '"/api/',
+        "'/api/",
+        "`/api/",
+        'href="/logout"',
+        'href="/login"',
+        'action="/login"',
+        'action="/logout"',
+        # JS redirects in FinanceBot pages
+        "window.location.href='/'",
+        'window.location.href="/"',
+        "window.location='/'",
+        'window.location="/"',
+        "window.location.href='/login'",
+        'window.location.href="/login"',
+        "window.location='/login'",
+        'window.location="/login"',
+    ]
+    for p in DEFAULT_STATIC_ROOTS:
+        rules.extend([f'"{p}', f"'{p}", f"url({p}", f'url("{p}', f"url('{p}"])
+    return tuple(rules)
+
+
+# Cada regra e um trecho literal; o prefixo da instancia e inserido antes da
+# primeira "/" do trecho. Ex.: 'href="/login"' -> 'href="/financeiro/login"'.
+DEFAULT_REWRITE_RULES = _default_rules()
+
+
+def is_rewritable(content_type: str) -> bool:
+    ctype = (content_type or "").lower()
+    return "text/html" in ctype or "javascript" in ctype
+
+
+def _trie_pattern(needles: list[bytes]) -> bytes:
+    # Fatora os prefixos comuns das regras ('"/a(?:pi/|ssets/)|...'): o regex testa
+    # cada posicao uma unica vez em vez de tentar todas as alternativas.
+    trie: dict = {}
+    for needle in needles:
+        node = trie
+        for ch in needle:
+            node = node.setdefault(ch, {})
+        node[None] = True
+
+    def build(node: dict) -> bytes:
+        ends_here = None in node
+        alts = [re.escape(bytes([ch])) + build(node[ch]) for ch in sorted(k for k in node if k is not None)]
+        if not alts:
+            return b""
+        if len(alts) == 1 and not ends_here:
+            return alts[0]
+        # Grupo opcional guloso: tenta primeiro o trecho mais longo (longest match).
+        return b"(?:" + b"|".join(alts) + b")" + (b"?" if ends_here else b"")
+
+    return build(trie)
+
+
+class PrefixRewriter:
+    # Todas as regras compiladas em um unico regex (trie) sobre bytes:
+    # uma passada no corpo, sem decode/encode.
+    def __init__(self, prefix: str, rules: tuple[str, ...] = DEFAULT_REWRITE_RULES):
+        self.prefix = prefix.strip("/")
+        insert = f"/{self.prefix}".encode("utf-8")
+        self._replacements: dict[bytes, bytes] = {}
+        for rule in rules:
+            needle = rule.encode("utf-8")
+            cut = needle.find(b"/")
+            if cut < 0 or needle in self._replacements:
+                continue
+            self._replacements[needle] = needle[:cut] + insert + needle[cut:]
+        needles = list(self._replacements)
+        # Identifica prefixo + regras nas chaves de cache de corpos reescritos.
+        self.cache_token = hashlib.blake2b(b"\0".join([insert, *needles]), digest_size=8).hexdigest()
+        self._pattern = re.compile(_trie_pattern(needles)) if needles else None
+        self.max_needle = max((len(n) for n in needles), default=0)
+
+    def _replace(self, match: re.Match) -> bytes:
+        return self._replacements[match.group(0)]
+
+    def rewrite(self, data: bytes) -> bytes:
+        if self._pattern is None:
+            return data
+        return self._pattern.sub(self._replace, data)
+
+    def stream(self) -> "StreamRewriter":
+        return StreamRewriter(self)
+
+
+class StreamRewriter:
+    # Rewrite incremental: segura no maximo (maior regra - 1) bytes entre blocos para
+    # nao perder trechos que cruzam a fronteira de um chunk.
+    def __init__(self, rewriter: PrefixRewriter):
+        self._rewriter = rewriter
+        self._tail = b""
+
+    def feed(self, chunk: bytes) -> bytes:
+        rw = self._rewriter
+        if rw._pattern is None:
+            return chunk
+        buf = self._tail + chunk if self._tail else chunk
+        safe = len(buf) - (rw.max_needle - 1)
+        if safe <= 0:
+            self._tail = buf
+            return b""
+        out = []
+        pos = 0
+        for match in rw._pattern.finditer(buf):
+            start = match.start()
+            if start >= safe:
+                break
+            out.append(buf[pos:start])
+            out.append(rw._replacements[match.group(0)])
+            pos = match.end()
+        cut = max(pos, safe)
+        out.append(buf[pos:cut])
+        self._tail = buf[cut:]
+        return b"".join(out)
+
+    def flush(self) -> bytes:
+        tail, self._tail = self._tail, b""
+        return self._rewriter.rewrite(tail)
+
+
+@lru_cache(maxsize=128)
+def compile_rewriter(prefix: str, rules: tuple[str, ...] = DEFAULT_REWRITE_RULES) -> PrefixRewriter:
+    return PrefixRewriter(prefix, rules)
@@ -0,0 +1,43 @@
+from __future__ import annotations
+
+from typing import NamedTuple
+
+from instances.models import InstanceConfig
+
+
+class RouteMatch(NamedTuple):
+    prefix: str
+    instance: InstanceConfig
+    # True quando o path e exatamente "/<prefix>" (sem barra final).
+    exact: bool
+
+
+class RouteTable:
+    # Tabela de prefixos compilada uma vez por versao da config. A busca percorre
+    # apenas os segmentos do path (limitado a profundidade do maior prefixo),
+    # entao o custo nao cresce com o numero de instancias.
+    def __init__(self, version: int, instances: tuple[InstanceConfig, ...] | list[InstanceConfig]):
+        self.version = version
+        self._by_prefix: dict[str, InstanceConfig] = {}
+        for inst in instances:
+            p = inst.route_prefix.strip("/")
+            if p and p not in self._by_prefix:
+                self._by_prefix[p] = inst
+        self._max_depth = max((p.count("/") + 1 for p in self._by_prefix), default=0)
+
+    def prefixes(self) -> list[str]:
+        return list(self._by_prefix)
+
+    def match(self, path: str) -> RouteMatch | None:
+        if not self._max_depth or not path.startswith("/"):
+            return None
+        segments = path[1:].split("/", self._max_depth)
+        depth = min(len(segments), self._max_depth)
+        # Longest match: tenta "a/b/c", depois "a/b", depois "a".
+        while depth > 0:
+            prefix = segments[0] if depth == 1 else "/".join(segments[:depth])
+            inst = self._by_prefix.get(prefix)
+            if inst is not None:
+                return RouteMatch(prefix, inst, len(segments) == depth)
+            depth -= 1
+        return None
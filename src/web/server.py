@@ -1,5 +1,7 @@
 from __future__ import annotations
 
+import hashlib
+import html
 import json
 import os
 from pathlib import Path
@@ -9,40 +11,142 @@ import sys
 import threading
 import time
 import math
-import urllib.error
 import urllib.parse
-import urllib.request
 import traceback
-from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
-from urllib.parse import urlparse
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-
+from http.server import BaseHTTPRequestHandler
+from urllib.parse import parse_qs, urlparse
+
+from core import metrics
+from core.diaglog import DiagLogger
+from core.gitcmd import TIMEOUT_CODE, run_git
+from core.proclog import BackendOutput, LogTail
+from core.metrics import CountingReader, CountingWriter
 from core.runtime import InstanceRuntimeManager
 from instances.models import InstanceConfig
-from storage.settings import AppSettingsStore
+from storage.settings import AppSettingsStore, ConfigSnapshot
+from web.bodies import (
+    BODY_CHUNK_SIZE,
+    ClientBodyError,
+    MalformedChunkedBody,
+    RequestBodyTooLarge,
+    iter_chunked_body,
+    iter_fixed_body,
+)
+from web.assets import MAX_ASSET_BYTES, AssetEntry, AssetCache, cache_policy, is_static_path, refresh_policy
+from web.breaker import CircuitBreakers
+from web.cache import ByteLRUCache
+from web.coalesce import BufferedResponse, SingleFlight
+from web.conditional import conditional_response, hub_etag, strip_hub_tags, without_conditionals
+from web.encoding import (
+    MIN_COMPRESS_SIZE,
+    TransformChain,
+    can_decode,
+    compress,
+    decompress,
+    is_compressible,
+    negotiate,
+    normalize_encoding,
+    stream_decoder,
+    stream_encoder,
+    upstream_accept_encoding,
+)
+from web.health import BackendHealthMonitor
+from web.precompressed import Precompressed, precompress
+from web.rewriter import DEFAULT_REWRITE_RULES, PrefixRewriter, compile_rewriter, is_rewritable
+from web.routing import RouteTable
+from web.timing import RequestTimer
+from web.upstream import HOP_BY_HOP, UpstreamPool, connection_tokens
+from web.workers import BoundedWorkerPool, PooledHTTPServer
+
+
+STREAM_CHUNK_SIZE = 64 * 1024
+# Acima disso (ou sem Content-Length) o rewrite e feito em streaming, bloco a bloco.
+REWRITE_BUFFER_LIMIT = 4 * 1024 * 1024
+
+HUB_STATIC_PREFIX = "/hub/static/"
+# Pagina inicial muda com a config: sempre revalida (304 barato). CSS tem fingerprint no nome.
+HOME_CACHE_CONTROL = "no-cache"
+STATIC_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+# Feed de status: long-poll espera no maximo FEED_MAX_WAIT; SSE manda ping a cada
+# FEED_HEARTBEAT. No modo threaded cada stream ocupa um worker, entao dura no maximo
+# FEED_STREAM_MAX_SECONDS e o EventSource reconecta com Last-Event-ID (so recebe o delta).
+FEED_DEFAULT_WAIT = 25
+FEED_MAX_WAIT = 60
+FEED_HEARTBEAT = 15
+FEED_STREAM_MAX_SECONDS = 300
+# /hub/api/instances/<id>/logs: linhas devolvidas quando ?lines= nao e informado.
+LOG_TAIL_DEFAULT_LINES = 200
+
+
+def _encode_hub_body(accept_encoding: str, raw: bytes) -> tuple[bytes, str]:
+    if len(raw) < MIN_COMPRESS_SIZE:
+        return raw, "identity"
+    encoding = negotiate(accept_encoding)
+    return compress(raw, encoding), encoding
+
+
+def _body_response(
+    handler: BaseHTTPRequestHandler,
+    status: int,
+    content_type: str,
+    raw: bytes,
+    extra_headers: list[tuple[str, str]] | None = None,
+):
+    raw, encoding = _encode_hub_body(handler.headers.get("Accept-Encoding", ""), raw)
+    headers = [("Content-Type", content_type)]
+    headers.extend(extra_headers or [])
+    if encoding != "identity":
+        headers.append(("Content-Encoding", encoding))
+    headers.append(("Vary", "Accept-Encoding"))
+    if status == 200:
+        headers.append(("ETag", hub_etag(raw)))
+    status, headers = conditional_response(handler.headers, handler.command, status, headers)
+    handler.send_response(status)
+    for key, value in headers:
+        handler.send_header(key, value)
+    if status == 304:
+        handler.end_headers()
+        return
+    handler.send_header("Content-Length", str(len(raw)))
+    handler.end_headers()
+    if handler.command != "HEAD":
+        handler.wfile.write(raw)
+
+
+def _precompressed_reply(
+    page: Precompressed, accept_encoding: str, extra_headers: list[tuple[str, str]] | None = None
+) -> tuple[list[tuple[str, str]], bytes]:
+    body, encoding, etag = page.select(accept_encoding)
+    headers = [("Content-Type", page.content_type)]
+    headers.extend(extra_headers or [])
+    if encoding != "identity":
+        headers.append(("Content-Encoding", encoding))
+    headers.append(("Vary", "Accept-Encoding"))
+    headers.append(("ETag", etag))
+    return headers, body
 
 
 def _json_response(handler: BaseHTTPRequestHandler, status: int, payload: dict):
     raw = json.dumps(payload, ensure_ascii=False).encode("utf-8")
-    handler.send_response(status)
-    handler.send_header("Content-Type", "application/json; charset=utf-8")
-    handler.send_header("Content-Length", str(len(raw)))
-    handler.end_headers()
-    handler.wfile.write(raw)
+    _body_response(handler, status, "application/json; charset=utf-8", raw)
 
 
-def _html_response(handler: BaseHTTPRequestHandler, status: int, html: str):
-    raw = html.encode("utf-8")
-    handler.send_response(status)
-    handler.send_header("Content-Type", "text/html; charset=utf-8")
-    handler.send_header("Content-Length", str(len(raw)))
-    handler.end_headers()
-    handler.wfile.write(raw)
+def _html_response(
+    handler: BaseHTTPRequestHandler,
+    status: int,
+    html: str,
+    extra_headers: list[tuple[str, str]] | None = None,
+):
+    _body_response(handler, status, "text/html; charset=utf-8", html.encode("utf-8"), extra_headers)
 
 
 def _redirect_response(handler: BaseHTTPRequestHandler, location: str):
     handler.send_response(302)
     handler.send_header("Location", location)
+    handler.send_header("Content-Length", "0")
     handler.end_headers()
 
 
@@ -52,7 +156,8 @@ class HubHttpServer:
         self.port = port
         self.runtime = runtime
         self.settings = settings
-        self.httpd: ThreadingHTTPServer | None = None
+        self.httpd: PooledHTTPServer | None = None
+        self.workers: BoundedWorkerPool | None = None
         self._thread: threading.Thread | None = None
         self._procs: dict[str, subprocess.Popen] = {}
         self._proc_lock = threading.Lock()
@@ -61,19 +166,61 @@ class HubHttpServer:
         self._inst_updater_interval_minutes = 5
         self._inst_updater_git_missing_logged = False
         self._instance_update_restarts = 0
+        self._inst_update_lock = threading.Lock()
+        # Ultimo resultado por instancia: outcome, detail, duration_seconds, checked_at.
+        self._inst_update_results: dict[str, dict] = {}
         logs_dir = Path(self.settings.base_dir) / "logs"
         logs_dir.mkdir(parents=True, exist_ok=True)
         self._logs_dir = logs_dir
         self._debug_log_path = logs_dir / "instance_debug.log"
+        self._slow_log_path = logs_dir / "slow_requests.log"
+        cfg = self.settings.snapshot().config
+        log_limits = dict(
+            max_bytes=int(cfg.diag_log_max_mb) * 1024 * 1024,
+            max_age_seconds=int(cfg.diag_log_rotate_hours) * 3600,
+            backups=int(cfg.diag_log_backups),
+        )
+        self.diaglog = DiagLogger(self._debug_log_path, echo=cfg.diag_console_echo, **log_limits)
+        self.slowlog = DiagLogger(self._slow_log_path, echo=False, name="hub-slowlog", **log_limits)
+        self.diaglog.start()
+        self.slowlog.start()
+        self.output = BackendOutput(
+            max_bytes=int(cfg.backend_log_max_mb) * 1024 * 1024,
+            backups=int(cfg.backend_log_backups),
+            tail_lines=int(cfg.backend_log_tail_lines),
+        )
+        self._routes = RouteTable(version=0, instances=[])
+        self._routes_lock = threading.Lock()
+        self.upstream = UpstreamPool()
+        self.rewrite_cache = ByteLRUCache(int(self.settings.snapshot().config.rewrite_cache_mb) * 1024 * 1024)
+        self.health = BackendHealthMonitor(
+            instances=lambda: self.settings.snapshot().instances,
+            on_change=self._on_health_change,
+        )
+        self.coalescer = SingleFlight()
+        self.assets = AssetCache(
+            Path(self.settings.base_dir) / "cache" / "assets",
+            memory_bytes=int(cfg.asset_cache_memory_mb) * 1024 * 1024,
+            disk_bytes=int(cfg.asset_cache_disk_mb) * 1024 * 1024,
+        )
+        self.breakers = CircuitBreakers(
+            failure_threshold=cfg.breaker_failure_threshold,
+            cooldown_seconds=cfg.breaker_cooldown_seconds,
+            on_change=self._on_breaker_change,
+        )
+        styles = _base_styles().encode("utf-8")
+        self._stylesheet = precompress("text/css; charset=utf-8", styles)
+        self.stylesheet_path = f"{HUB_STATIC_PREFIX}hub.{hashlib.blake2b(styles, digest_size=6).hexdigest()}.css"
+        self._home: tuple[int, Precompressed] | None = None
+        self._home_lock = threading.Lock()
+        # (since, versao) -> JSON pronto: paineis na mesma versao compartilham o mesmo delta.
+        self._feed_cache: dict[tuple[int, int], tuple[bool, bytes]] = {}
+        metrics.BACKEND_UP.set_function(self._backend_up_metric)
+        metrics.BACKEND_PROCESS.set_function(self._backend_process_metric)
 
     def _diag(self, message: str):
-        line = f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] {message}"
-        print(line)
-        try:
-            with self._debug_log_path.open("a", encoding="utf-8") as f:
-                f.write(line + "\n")
-        except Exception:
-            pass
+        # Chamado de threads de requisicao: so enfileira, a escrita (e o print) fica no DiagLogger.
+        self.diaglog.log(message)
 
     @staticmethod
     def _clear_console() -> None:
@@ -82,13 +229,37 @@ class HubHttpServer:
         except Exception:
             pass
 
-    @staticmethod
-    def _url_online(url: str, timeout: float = 1.2) -> bool:
-        try:
-            with urllib.request.urlopen(url, timeout=timeout):
-                return True
-        except Exception:
-            return False
+    def _on_health_change(self, instance_id: str, previous: str, status: str) -> None:
+        self.runtime.touch(instance_id)
+        if previous == "unknown" and status == "up":
+            return
+        self._diag(f"[Health] {instance_id}: {previous} -> {status}")
+
+    def _on_breaker_change(self, instance_id: str, previous: str, status: str) -> None:
+        self.runtime.touch(instance_id)
+        self._diag(f"[Breaker] {instance_id}: {previous} -> {status}")
+
+    def _backend_ok(self, inst: InstanceConfig, latency_ms: float) -> None:
+        self.health.record_success(inst.instance_id, latency_ms)
+        self.breakers.record_success(inst.instance_id)
+
+    def _backend_failed(self, inst: InstanceConfig, error: str) -> None:
+        self.health.record_failure(inst.instance_id, error)
+        self.breakers.record_failure(inst.instance_id, error)
+
+    def _unavailable_page(self, inst: InstanceConfig, breaker_open: bool) -> tuple[str, list[tuple[str, str]]]:
+        if breaker_open:
+            retry = self.breakers.retry_after(inst.instance_id)
+            return (
+                f"<h1>{inst.display_name} indisponivel</h1>"
+                f"<p>Backend com falhas seguidas; nova tentativa em {retry}s</p>",
+                [("Retry-After", str(retry))],
+            )
+        return (
+            f"<h1>{inst.display_name} indisponivel</h1>"
+            "<p>Nao foi possivel iniciar ou alcancar o backend configurado</p>",
+            [],
+        )
 
     @staticmethod
     def _system_python_cmd() -> list[str]:
@@ -182,16 +353,16 @@ class HubHttpServer:
                 out_path, err_path = self._instance_log_paths(key)
                 self._diag(f"[Runtime] Iniciando {key}: cwd={app_dir} cmd={' '.join(cmd)}")
                 self._diag(f"[Runtime] Logs {key}: stdout={out_path} stderr={err_path}")
-                out_handle = open(out_path, "ab")
-                err_handle = open(err_path, "ab")
+                # Saida por pipe: linhas chegam na hora (sem buffer do Python do backend) e em UTF-8.
+                env = dict(os.environ, PYTHONUNBUFFERED="1", PYTHONIOENCODING="utf-8")
                 self._procs[key] = subprocess.Popen(
                     cmd,
                     cwd=app_dir,
-                    stdout=out_handle,
-                    stderr=err_handle,
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.PIPE,
+                    env=env,
                 )
-                out_handle.close()
-                err_handle.close()
+                self.output.attach(key, self._procs[key], out_path, err_path)
                 self._diag(f"[Runtime] Processo {key} iniciado pid={self._procs[key].pid}")
                 time.sleep(0.8)
                 if self._procs[key].poll() is not None:
@@ -203,22 +374,8 @@ class HubHttpServer:
                 return False
 
     @staticmethod
-    def _run_git(repo_dir: Path, *args: str) -> tuple[int, str]:
-        try:
-            env = os.environ.copy()
-            env["GIT_TERMINAL_PROMPT"] = "0"
-            proc = subprocess.run(
-                ["git", *args],
-                cwd=str(repo_dir),
-                text=True,
-                capture_output=True,
-                check=False,
-                env=env,
-            )
-            out = (proc.stdout or proc.stderr or "").strip()
-            return proc.returncode, out
-        except Exception as exc:
-            return 1, str(exc)
+    def _run_git(repo_dir: Path, *args: str, timeout: float = 0.0) -> tuple[int, str]:
+        return run_git(repo_dir, *args, timeout=timeout)
 
     def _restart_managed_instance(self, instance_id: str, app_dir: str, start_args: list[str]) -> bool:
         with self._proc_lock:
@@ -236,59 +393,75 @@ class HubHttpServer:
                     self._procs.pop(instance_id, None)
         return self._start_app_if_needed(instance_id, app_dir, start_args)
 
-    def _update_instance_repo_once(self, inst: InstanceConfig) -> None:
+    def _update_instance_repo_once(self, inst: InstanceConfig, timeout: float = 0.0) -> tuple[str, str]:
+        # Devolve (outcome, detalhe). Cada chamada ao git tem `timeout`: remoto travado
+        # so atrasa esta instancia.
         app_dir = Path(str(inst.app_dir or "")).resolve()
         if not app_dir.exists():
-            return
+            return "skipped", "app_dir inexistente"
         if not (app_dir / ".git").exists():
-            return
+            return "skipped", "app_dir sem repositorio git"
         branch = str(inst.repo_branch or "main").strip() or "main"
         remote = "origin"
 
-        code, out = self._run_git(app_dir, "fetch", remote, branch)
-        if code != 0:
+        def failed(step: str, code: int, out: str) -> tuple[str, str]:
             if out:
-                self._diag(f"[Instance Updater] {inst.display_name}: falha no fetch: {out}")
-            return
+                self._diag(f"[Instance Updater] {inst.display_name}: falha no {step}: {out}")
+            return ("timeout" if code == TIMEOUT_CODE else "failed"), f"{step}: {out}"
+
+        code_l, local_head = self._run_git(app_dir, "rev-parse", "HEAD", timeout=timeout)
+        local_head = (local_head or "").strip() if code_l == 0 else ""
 
-        code_l, local_head = self._run_git(app_dir, "rev-parse", "HEAD")
-        code_r, remote_head = self._run_git(app_dir, "rev-parse", f"{remote}/{branch}")
+        # ls-remote so pergunta o hash do branch: sem mudanca, nao baixa nada.
+        code, out = self._run_git(app_dir, "ls-remote", "--exit-code", remote, f"refs/heads/{branch}", timeout=timeout)
+        if code != 0:
+            return failed("ls-remote", code, out)
+        advertised = (out.split() or [""])[0]
+        if local_head and advertised == local_head:
+            return "current", local_head[:7]
+
+        code, out = self._run_git(app_dir, "fetch", remote, branch, timeout=timeout)
+        if code != 0:
+            return failed("fetch", code, out)
+
+        code_r, remote_head = self._run_git(app_dir, "rev-parse", f"{remote}/{branch}", timeout=timeout)
         if code_l != 0 or code_r != 0:
-            return
-        local_head = (local_head or "").strip()
+            return "failed", "rev-parse"
         remote_head = (remote_head or "").strip()
         if not local_head or not remote_head or local_head == remote_head:
-            return
+            return "current", local_head[:7]
 
         self._diag(
             f"[Instance Updater] {inst.display_name}: nova versao detectada "
             f"({local_head[:7]} -> {remote_head[:7]})"
         )
-        code, out = self._run_git(app_dir, "pull", "--ff-only", remote, branch)
+        code, out = self._run_git(app_dir, "pull", "--ff-only", remote, branch, timeout=timeout)
         if code != 0:
-            if out:
-                self._diag(f"[Instance Updater] {inst.display_name}: falha no pull: {out}")
-            return
+            return failed("pull", code, out)
 
-        code_n, new_head = self._run_git(app_dir, "rev-parse", "HEAD")
+        code_n, new_head = self._run_git(app_dir, "rev-parse", "HEAD", timeout=timeout)
         new_head = (new_head or "").strip() if code_n == 0 else ""
         if not new_head or new_head == local_head:
-            return
+            return "current", local_head[:7]
 
         self._diag(f"[Instance Updater] {inst.display_name}: atualizacao aplicada para {new_head[:7]}")
         restarted = self._restart_managed_instance(inst.instance_id, str(app_dir), list(inst.start_args or ["main.py"]))
+        # Depois do restart: assets servidos dai em diante ja sao da nova versao.
+        dropped = self.assets.invalidate_instance(inst.instance_id)
+        if dropped:
+            self._diag(f"[Assets] {inst.display_name}: {dropped} asset(s) removido(s) do cache")
         if restarted:
-            self._instance_update_restarts += 1
-            self._clear_console()
-            print(
-                "[Hub] Atualizacoes de instancias nesta sessao: "
-                f"{self._instance_update_restarts}"
-            )
+            with self._inst_update_lock:
+                self._instance_update_restarts += 1
+                restarts = self._instance_update_restarts
+                self._clear_console()
+                print(f"[Hub] Atualizacoes de instancias nesta sessao: {restarts}")
             self._diag(f"[Instance Updater] {inst.display_name}: reiniciado com a nova versao")
-        else:
-            self._diag(
-                f"[Instance Updater] {inst.display_name}: atualizado, mas nao foi possivel reiniciar automaticamente"
-            )
+            return "updated", f"{local_head[:7]} -> {new_head[:7]}"
+        self._diag(
+            f"[Instance Updater] {inst.display_name}: atualizado, mas nao foi possivel reiniciar automaticamente"
+        )
+        return "updated_no_restart", f"{local_head[:7]} -> {new_head[:7]}"
 
     def _instance_updater_loop(self) -> None:
         self._diag(f"[Instance Updater] Ativo: intervalo={self._inst_updater_interval_minutes}min")
@@ -310,13 +483,37 @@ class HubHttpServer:
                 self._inst_updater_git_missing_logged = True
             return
         try:
-            cfg = self.settings.load()
+            snap = self.settings.snapshot()
         except Exception:
             return
-        for inst in cfg.instances:
-            if not inst.enabled:
-                continue
-            self._update_instance_repo_once(inst)
+        targets = [inst for inst in snap.instances if inst.enabled]
+        if not targets:
+            return
+        cfg = snap.config
+        timeout = float(cfg.instance_update_git_timeout_seconds)
+        # Uma thread por repo ate o teto; o ciclo dura o do repo mais lento, nao a soma.
+        workers = max(1, min(len(targets), int(cfg.instance_update_workers)))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="inst-update") as pool:
+            for inst in targets:
+                pool.submit(self._update_instance_timed, inst, timeout)
+
+    def _update_instance_timed(self, inst: InstanceConfig, timeout: float) -> None:
+        started = time.perf_counter()
+        try:
+            outcome, detail = self._update_instance_repo_once(inst, timeout)
+        except Exception as exc:
+            outcome, detail = "failed", str(exc)
+            self._diag(f"[Instance Updater] {inst.display_name}: erro inesperado: {exc}")
+        elapsed = time.perf_counter() - started
+        metrics.UPDATER_RUN.observe(elapsed, inst.instance_id)
+        metrics.UPDATER_OUTCOME.inc(inst.instance_id, outcome)
+        with self._inst_update_lock:
+            self._inst_update_results[inst.instance_id] = {
+                "outcome": outcome,
+                "detail": detail,
+                "duration_seconds": round(elapsed, 3),
+                "checked_at": datetime.now().isoformat(timespec="seconds"),
+            }
 
     def start_instance_updater(self, enabled: bool, interval_minutes: int) -> None:
         self._inst_updater_stop.clear()
@@ -372,7 +569,7 @@ class HubHttpServer:
             return False
 
     def _ensure_backend_online(self, inst: InstanceConfig, quiet_if_online: bool = False) -> bool:
-        if self._url_online(inst.backend_url):
+        if self.health.probe(inst):
             if not quiet_if_online:
                 self._diag(f"[Warmup] Backend ja online: {inst.display_name}")
             return True
@@ -383,27 +580,29 @@ class HubHttpServer:
             # se a pasta ja existir mas clone nao era necessario, segue normalmente
             if not Path(inst.app_dir).exists():
                 return False
+        self.health.mark_starting(inst.instance_id)
         if not self._start_app_if_needed(inst.instance_id, inst.app_dir, inst.start_args):
             self._diag(f"[Warmup] Falha ao iniciar processo de {inst.display_name}")
+            self.health.record_failure(inst.instance_id, "falha ao iniciar processo", source="startup")
             return False
         deadline = time.time() + 30
         while time.time() < deadline:
-            if self._url_online(inst.backend_url):
+            if self.health.probe(inst):
                 self._diag(f"[Warmup] Backend ficou online: {inst.display_name}")
                 return True
             time.sleep(0.6)
         self._diag(f"[Warmup] Timeout aguardando backend: {inst.display_name}")
+        self.health.record_failure(inst.instance_id, "timeout aguardando backend", source="startup")
         return False
 
     @staticmethod
-    def _backend_target(base_url: str, inbound_path: str, prefix: str) -> str:
+    def _backend_path(inbound_path: str, prefix: str) -> str:
         # inbound_path ex: /financeiro/api/history?limit=300 -> /api/history?limit=300
         parsed_in = urlparse(inbound_path)
         path = parsed_in.path[len(prefix) :]
         if not path.startswith("/"):
             path = "/" + path
-        parsed = urlparse(base_url)
-        return urllib.parse.urlunparse((parsed.scheme, parsed.netloc, path, "", parsed_in.query or "", ""))
+        return f"{path}?{parsed_in.query}" if parsed_in.query else path
 
     @staticmethod
     def _rewrite_location_for_prefix(location: str, prefix: str) -> str:
@@ -417,171 +616,892 @@ class HubHttpServer:
         return urllib.parse.urlunparse(("", "", path, "", parsed.query or "", parsed.fragment or ""))
 
     @staticmethod
-    def _rewrite_text_for_prefix(body: bytes, content_type: str, prefix: str) -> bytes:
-        ctype = (content_type or "").lower()
-        if "text/html" not in ctype and "javascript" not in ctype:
-            return body
+    def _rewriter_for(inst: InstanceConfig) -> PrefixRewriter:
+        rules = tuple(inst.rewrite_rules) if inst.rewrite_rules else DEFAULT_REWRITE_RULES
+        return compile_rewriter(inst.route_prefix.strip("/"), rules)
+
+    @staticmethod
+    def _rewrite_cache_key(rewriter: PrefixRewriter, target: str, headers, body: bytes) -> tuple:
+        # So ETag forte identifica o conteudo (vale por URL, entao entra o path). ETag fraca
+        # (W/) e Last-Modified (resolucao de 1s) podem repetir com corpo diferente: digest.
+        etag = headers.get("ETag", "")
+        if etag and not etag.startswith("W/"):
+            return (rewriter.cache_token, "etag", target, etag, len(body))
+        return (rewriter.cache_token, "digest", hashlib.blake2b(body, digest_size=16).digest())
+
+    @staticmethod
+    def _coalesce_key(inst: InstanceConfig, method: str, target: str, client_headers, headers: dict) -> tuple | None:
+        # So GETs sem corpo em paths liberados pela instancia; a chave inclui tudo que
+        # pode mudar a resposta por usuario (cookie/autorizacao) ou o encoding recebido.
+        if method != "GET" or not inst.coalesce_paths:
+            return None
+        if client_headers.get("Content-Length", "0") not in {"", "0"} or client_headers.get("Transfer-Encoding"):
+            return None
+        path = target.split("?", 1)[0]
+        if not any(path.startswith(p) for p in inst.coalesce_paths):
+            return None
+        return (
+            inst.instance_id,
+            target,
+            headers.get("Accept-Encoding", ""),
+            client_headers.get("Cookie", ""),
+            client_headers.get("Authorization", ""),
+        )
+
+    def _fetch_buffered(self, inst: InstanceConfig, target: str, headers: dict) -> BufferedResponse:
+        started = time.perf_counter()
         try:
-            text = body.decode("utf-8", errors="ignore")
-        except Exception:
-            return body
-
-        # API and auth routes
-        text = text.replace('"/api/', f'"/{prefix}/api/')
-        text = text.replace("'/api/", f"'/{prefix}/api/")
-        text = text.replace("`/api/", f"`/{prefix}/api/")
-        text = text.replace('fetch("/api/', f'fetch("/{prefix}/api/')
-        text = text.replace("fetch('/api/", f"fetch('/{prefix}/api/")
-        text = text.replace("fetch(`/api/", f"fetch(`/{prefix}/api/")
-
-        text = text.replace('href="/logout"', f'href="/{prefix}/logout"')
-        text = text.replace('href="/login"', f'href="/{prefix}/login"')
-        text = text.replace('action="/login"', f'action="/{prefix}/login"')
-        text = text.replace('action="/logout"', f'action="/{prefix}/logout"')
-
-        # JS redirects in FinanceBot pages
-        text = text.replace("window.location.href='/'", f"window.location.href='/{prefix}/'")
-        text = text.replace('window.location.href="/"', f'window.location.href="/{prefix}/"')
-        text = text.replace("window.location='/'", f"window.location='/{prefix}/'")
-        text = text.replace('window.location="/"', f'window.location="/{prefix}/"')
-        text = text.replace("window.location.href='/login'", f"window.location.href='/{prefix}/login'")
-        text = text.replace('window.location.href="/login"', f'window.location.href="/{prefix}/login"')
-        text = text.replace("window.location='/login'", f"window.location='/{prefix}/login'")
-        text = text.replace('window.location="/login"', f'window.location="/{prefix}/login"')
-
-        # Static/media routes commonly used by FinanceBot UI
-        root_paths = [
-            "/store-image",
-            "/favicon.ico",
-            "/assets/",
-            "/static/",
-        ]
-        for p in root_paths:
-            text = text.replace(f'"{p}', f'"/{prefix}{p}')
-            text = text.replace(f"'{p}", f"'/{prefix}{p}")
-            text = text.replace(f"url({p}", f"url(/{prefix}{p}")
-            text = text.replace(f'url("{p}', f'url("/{prefix}{p}')
-            text = text.replace(f"url('{p}", f"url('/{prefix}{p}")
-
-        return text.encode("utf-8")
+            conn, resp = self.upstream.request(inst.backend_url, "GET", target, headers)
+            try:
+                raw = resp.read()
+            except Exception:
+                self.upstream.release(inst.backend_url, conn, None)
+                raise
+        except Exception as exc:
+            self._backend_failed(inst, str(exc) or type(exc).__name__)
+            raise
+        self.upstream.release(inst.backend_url, conn, resp)
+        self._backend_ok(inst, (time.perf_counter() - started) * 1000)
+        return BufferedResponse(resp.status, resp.headers, raw)
+
+    def _buffered_reply(
+        self,
+        inst: InstanceConfig,
+        prefix: str,
+        target: str,
+        result: BufferedResponse,
+        client_accept: str,
+    ) -> tuple[list[tuple[str, str]], bytes]:
+        # Cada participante do grupo rende o corpo compartilhado para o proprio cliente.
+        ct = result.headers.get("Content-Type", "")
+        upstream_enc = normalize_encoding(result.headers.get("Content-Encoding", ""))
+        if result.status in {204, 304} or not is_rewritable(ct) or not can_decode(upstream_enc):
+            out_headers, body = self._upstream_response_headers(result.headers, prefix), result.body
+        else:
+            out_enc = negotiate(client_accept) if is_compressible(ct) else "identity"
+            body, out_enc = self._render_rewritten(
+                self._rewriter_for(inst), target, result.headers, result.body, upstream_enc, out_enc
+            )
+            out_headers = self._upstream_response_headers(result.headers, prefix, out_enc)
+        # Corpo reescrito perde o ETag do backend; sem validador, o hub gera um sobre os bytes enviados.
+        if result.status == 200 and not any(k.lower() == "etag" for k, _ in out_headers):
+            out_headers.append(("ETag", hub_etag(body)))
+        return out_headers, body
 
-    def _proxy(self, handler: BaseHTTPRequestHandler, inst: InstanceConfig):
+    def _proxy_coalesced(self, handler: BaseHTTPRequestHandler, inst: InstanceConfig, target: str, headers: dict, key: tuple):
         prefix = inst.route_prefix.strip("/")
-        prefix_path = f"/{prefix}"
-        target = self._backend_target(inst.backend_url, handler.path, prefix_path)
+        handler.body_consumed = True
+        try:
+            result, _ = self.coalescer.do(
+                key, lambda: self._fetch_buffered(inst, target, without_conditionals(headers))
+            )
+            handler.timer.lap("upstream")
+            out_headers, body = self._buffered_reply(inst, prefix, target, result, handler.headers.get("Accept-Encoding", ""))
+            handler.timer.lap("rewrite")
+        except Exception as exc:
+            return _html_response(handler, 502, f"<h1>Backend indisponivel</h1><p>{exc}</p>")
+        self._send_buffered(handler, result.status, out_headers, body)
 
-        headers = {}
-        for k, v in handler.headers.items():
-            kl = k.lower()
-            if kl in {"host", "content-length", "accept-encoding", "connection"}:
-                continue
-            headers[k] = v
+    @staticmethod
+    def _send_buffered(handler: BaseHTTPRequestHandler, status: int, out_headers: list[tuple[str, str]], body: bytes):
+        status, out_headers = conditional_response(handler.headers, handler.command, status, out_headers)
+        handler.send_response(status)
+        for k, v in out_headers:
+            handler.send_header(k, v)
+        if status not in {204, 304}:
+            handler.send_header("Content-Length", str(len(body)))
+        handler.end_headers()
+        if status not in {204, 304} and handler.command != "HEAD":
+            handler.wfile.write(body)
+
+    def _asset_key(self, inst: InstanceConfig, method: str, target: str, client_headers, headers: dict) -> tuple | None:
+        if method != "GET" or not self.assets.enabled:
+            return None
+        if client_headers.get("Content-Length", "0") not in {"", "0"} or client_headers.get("Transfer-Encoding"):
+            return None
+        # Requisicoes autenticadas por cabecalho nao entram no cache compartilhado.
+        if client_headers.get("Authorization") or not is_static_path(target.split("?", 1)[0]):
+            return None
+        return (inst.instance_id, target, headers.get("Accept-Encoding", ""))
+
+    def _asset_reply(
+        self, inst: InstanceConfig, target: str, entry: AssetEntry, client_accept: str, cache_status: str
+    ) -> tuple[list[tuple[str, str]], bytes]:
+        result = BufferedResponse(entry.status, entry.message(), entry.body)
+        out_headers, body = self._buffered_reply(inst, inst.route_prefix.strip("/"), target, result, client_accept)
+        out_headers.append(("X-Hub-Cache", cache_status))
+        return out_headers, body
+
+    def _asset_policy(self, status: int, resp_headers, credentialed: bool = False) -> tuple[float, bool] | None:
+        # Sem Cache-Control explicito o asset vale pelo TTL padrao configurado (so sem Cookie).
+        ttl = float(self.settings.snapshot().config.asset_cache_default_ttl_seconds)
+        return cache_policy(status, resp_headers, ttl, credentialed)
+
+    @staticmethod
+    def _cached_for(entry: AssetEntry | None, credentialed: bool) -> AssetEntry | None:
+        # Com Cookie, so serve (ou revalida) o que o backend marcou como public.
+        if entry is not None and credentialed and not entry.shared():
+            return None
+        return entry
+
+    def _store_asset(
+        self, key: tuple, status: int, resp_headers, body: bytes, credentialed: bool = False
+    ) -> AssetEntry | None:
+        policy = self._asset_policy(status, resp_headers, credentialed)
+        if policy is None:
+            return None
+        return self.assets.put(key, status, resp_headers, body, *policy)
+
+    def _refresh_asset(self, key: tuple, entry: AssetEntry, resp_headers, credentialed: bool = False) -> AssetEntry:
+        ttl = float(self.settings.snapshot().config.asset_cache_default_ttl_seconds)
+        policy = refresh_policy(entry, resp_headers, ttl, credentialed)
+        if policy is None:
+            return entry
+        return self.assets.refresh(key, entry, resp_headers, *policy)
+
+    def _proxy_asset(self, handler: BaseHTTPRequestHandler, inst: InstanceConfig, target: str, headers: dict, key: tuple):
+        handler.body_consumed = True
+        client_accept = handler.headers.get("Accept-Encoding", "")
+        credentialed = bool(handler.headers.get("Cookie"))
+        entry = self._cached_for(self.assets.get(key), credentialed)
+        handler.timer.lap("cache")
+        if entry is not None and entry.fresh():
+            out_headers, body = self._asset_reply(inst, target, entry, client_accept, "HIT")
+            handler.timer.lap("rewrite")
+            return self._send_buffered(handler, 200, out_headers, body)
+        # Validadores do proprio cache, nunca os do cliente: o 304 ao cliente e decidido pelo hub.
+        request_headers = without_conditionals(headers)
+        if entry is not None:
+            request_headers.update(entry.validators())
+        started = time.perf_counter()
+        try:
+            conn, resp = self.upstream.request(inst.backend_url, "GET", target, request_headers)
+        except Exception as exc:
+            self._backend_failed(inst, str(exc) or type(exc).__name__)
+            return _html_response(handler, 502, f"<h1>Backend indisponivel</h1><p>{exc}</p>")
+        self._backend_ok(inst, (time.perf_counter() - started) * 1000)
+        handler.timer.lap("upstream")
+        if resp.status == 304 and entry is not None:
+            resp.read()
+            self.upstream.release(inst.backend_url, conn, resp)
+            entry = self._refresh_asset(key, entry, resp.headers, credentialed)
+            handler.timer.lap("cache")
+            out_headers, body = self._asset_reply(inst, target, entry, client_accept, "REVALIDATED")
+            handler.timer.lap("rewrite")
+            return self._send_buffered(handler, 200, out_headers, body)
+        if (
+            resp.length is None
+            or resp.length > MAX_ASSET_BYTES
+            or self._asset_policy(resp.status, resp.headers, credentialed) is None
+        ):
+            return self._relay(handler, inst, conn, resp, target, inst.route_prefix.strip("/"))
+        try:
+            raw = resp.read()
+        except Exception as exc:
+            self.upstream.release(inst.backend_url, conn, None)
+            self._backend_failed(inst, str(exc) or type(exc).__name__)
+            return _html_response(handler, 502, f"<h1>Backend indisponivel</h1><p>{exc}</p>")
+        self.upstream.release(inst.backend_url, conn, resp)
+        handler.timer.lap("read")
+        entry = self._store_asset(key, resp.status, resp.headers, raw, credentialed)
+        handler.timer.lap("cache")
+        if entry is None:
+            result = BufferedResponse(resp.status, resp.headers, raw)
+            out_headers, body = self._buffered_reply(inst, inst.route_prefix.strip("/"), target, result, client_accept)
+            handler.timer.lap("rewrite")
+            return self._send_buffered(handler, resp.status, out_headers, body)
+        out_headers, body = self._asset_reply(inst, target, entry, client_accept, "MISS")
+        handler.timer.lap("rewrite")
+        return self._send_buffered(handler, 200, out_headers, body)
 
-        body = b""
-        if handler.command in {"POST", "PUT", "PATCH"}:
+    def _proxy(self, handler: BaseHTTPRequestHandler, inst: InstanceConfig):
+        prefix = inst.route_prefix.strip("/")
+        prefix_path = f"/{prefix}"
+        target = self._backend_path(handler.path, prefix_path)
+
+        headers = self._upstream_request_headers(handler.headers)
+        asset_key = self._asset_key(inst, handler.command, target, handler.headers, headers)
+        if asset_key is not None:
+            return self._proxy_asset(handler, inst, target, headers, asset_key)
+        coalesce_key = self._coalesce_key(inst, handler.command, target, handler.headers, headers)
+        if coalesce_key is not None:
+            return self._proxy_coalesced(handler, inst, target, headers, coalesce_key)
+
+        max_body = int(self.settings.snapshot().config.max_request_body_mb) * 1024 * 1024
+        body = None
+        replayable = True
+        if "chunked" in handler.headers.get("Transfer-Encoding", "").lower():
+            # Upload chunked: repassado ao backend tambem como chunked, conforme chega.
+            body = iter_chunked_body(handler.rfile, max_body)
+            replayable = False
+        else:
             try:
                 size = int(handler.headers.get("Content-Length", "0"))
             except Exception:
                 size = 0
+            if size > max_body:
+                handler.close_connection = True
+                return _html_response(handler, 413, "<h1>Corpo da requisicao muito grande</h1>")
             if size > 0:
-                body = handler.rfile.read(size)
-
-        req = urllib.request.Request(target, data=body if body else None, headers=headers, method=handler.command)
+                headers["Content-Length"] = str(size)
+                if size <= BODY_CHUNK_SIZE:
+                    body = handler.rfile.read(size)
+                else:
+                    body = iter_fixed_body(handler.rfile, size)
+                    replayable = False
+        handler.timer.lap("prepare")
+
+        started = time.perf_counter()
         try:
-            with urllib.request.urlopen(req, timeout=45) as resp:
-                raw = resp.read()
-                ct = resp.headers.get("Content-Type", "")
-                raw = self._rewrite_text_for_prefix(raw, ct, prefix)
-
-                handler.send_response(resp.status)
-                for k, v in resp.headers.items():
-                    kl = k.lower()
-                    if kl in {"content-length", "transfer-encoding", "connection", "content-encoding"}:
-                        continue
-                    if kl == "location":
-                        handler.send_header("Location", self._rewrite_location_for_prefix(v, prefix))
-                        continue
-                    handler.send_header(k, v)
-                handler.send_header("Content-Length", str(len(raw)))
-                handler.end_headers()
-                handler.wfile.write(raw)
-                return
-        except urllib.error.HTTPError as e:
-            raw = e.read()
-            ct = e.headers.get("Content-Type", "")
-            raw = self._rewrite_text_for_prefix(raw, ct, prefix)
-            handler.send_response(e.code)
-            for k, v in e.headers.items():
-                kl = k.lower()
-                if kl in {"content-length", "transfer-encoding", "connection", "content-encoding"}:
-                    continue
-                if kl == "location":
-                    handler.send_header("Location", self._rewrite_location_for_prefix(v, prefix))
-                    continue
+            conn, resp = self.upstream.request(
+                inst.backend_url,
+                handler.command,
+                target,
+                headers,
+                body=body,
+                replayable=replayable,
+            )
+        except RequestBodyTooLarge:
+            handler.close_connection = True
+            return _html_response(handler, 413, "<h1>Corpo da requisicao muito grande</h1>")
+        except MalformedChunkedBody as exc:
+            handler.close_connection = True
+            return _html_response(handler, 400, f"<h1>Requisicao invalida</h1><p>{exc}</p>")
+        except ClientBodyError:
+            handler.close_connection = True
+            return
+        except Exception as exc:
+            if not replayable:
+                # Corpo pode ter ficado pela metade no socket do cliente.
+                handler.close_connection = True
+            self._backend_failed(inst, str(exc) or type(exc).__name__)
+            return _html_response(handler, 502, f"<h1>Backend indisponivel</h1><p>{exc}</p>")
+        handler.body_consumed = True
+        self._backend_ok(inst, (time.perf_counter() - started) * 1000)
+        # Inclui o envio do corpo da requisicao (uploads) e o tempo ate o cabecalho da resposta.
+        handler.timer.lap("upstream")
+        return self._relay(handler, inst, conn, resp, target, prefix)
+
+    def _relay(self, handler: BaseHTTPRequestHandler, inst: InstanceConfig, conn, resp, target: str, prefix: str):
+        if handler.command == "HEAD":
+            handler.send_response(resp.status)
+            for k, v in self._head_headers(resp.headers, prefix):
                 handler.send_header(k, v)
-            handler.send_header("Content-Length", str(len(raw)))
             handler.end_headers()
-            handler.wfile.write(raw)
+            resp.read()
+            self.upstream.release(inst.backend_url, conn, resp)
             return
+        ct = resp.headers.get("Content-Type", "")
+        client_accept = handler.headers.get("Accept-Encoding", "")
+        upstream_enc = normalize_encoding(resp.headers.get("Content-Encoding", ""))
+        if resp.status in {204, 304} or not is_rewritable(ct) or not can_decode(upstream_enc):
+            # Passthrough: corpo (comprimido ou nao) segue exatamente como o backend enviou.
+            return self._stream_response(handler, inst, conn, resp, prefix)
+        rewriter = self._rewriter_for(inst)
+        out_enc = negotiate(client_accept) if is_compressible(ct) else "identity"
+        if resp.length is None or resp.length > REWRITE_BUFFER_LIMIT:
+            transform = TransformChain(stream_decoder(upstream_enc), rewriter.stream(), stream_encoder(out_enc))
+            return self._stream_response(handler, inst, conn, resp, prefix, transform=transform, encoding=out_enc)
+
+        # Corpos pequenos que precisam de rewrite sao bufferizados (tamanho final conhecido).
+        try:
+            raw = resp.read()
+        except Exception as exc:
+            self.upstream.release(inst.backend_url, conn, None)
+            self._backend_failed(inst, str(exc) or type(exc).__name__)
+            return _html_response(handler, 502, f"<h1>Backend indisponivel</h1><p>{exc}</p>")
+        self.upstream.release(inst.backend_url, conn, resp)
+        handler.timer.lap("read")
+
+        try:
+            out_headers, rewritten = self._buffered_reply(
+                inst, prefix, target, BufferedResponse(resp.status, resp.headers, raw), client_accept
+            )
         except Exception as exc:
-            _html_response(handler, 502, f"<h1>Backend indisponivel</h1><p>{exc}</p>")
+            return _html_response(handler, 502, f"<h1>Resposta invalida do backend</h1><p>{exc}</p>")
+        handler.timer.lap("rewrite")
+        self._send_buffered(handler, resp.status, out_headers, rewritten)
+
+    @staticmethod
+    def _upstream_request_headers(client_headers) -> dict[str, str]:
+        skip = HOP_BY_HOP | connection_tokens(client_headers) | {"host", "content-length", "accept-encoding", "expect"}
+        headers = {}
+        for k, v in client_headers.items():
+            if k.lower() in skip:
+                continue
+            headers[k] = v
+        headers["Accept-Encoding"] = upstream_accept_encoding(client_headers.get("Accept-Encoding", ""))
+        strip_hub_tags(headers)
+        return headers
+
+    def _render_rewritten(
+        self,
+        rewriter: PrefixRewriter,
+        target: str,
+        resp_headers,
+        raw: bytes,
+        upstream_enc: str,
+        out_enc: str,
+    ) -> tuple[bytes, str]:
+        raw = decompress(raw, upstream_enc)
+        key = self._rewrite_cache_key(rewriter, target, resp_headers, raw)
+        rewritten = self.rewrite_cache.get(key)
+        if rewritten is None:
+            started = time.perf_counter()
+            rewritten = rewriter.rewrite(raw)
+            metrics.REWRITE_DURATION.observe(time.perf_counter() - started, rewriter.prefix)
+            metrics.REWRITE_BYTES.inc(rewriter.prefix, "in", amount=len(raw))
+            metrics.REWRITE_BYTES.inc(rewriter.prefix, "out", amount=len(rewritten))
+            self.rewrite_cache.put(key, rewritten, len(rewritten), saved=len(raw))
+        if len(rewritten) < MIN_COMPRESS_SIZE or out_enc == "identity":
+            return rewritten, "identity"
+        # Variante comprimida guardada ao lado da reescrita: recomprime uma vez so.
+        encoded_key = key + (out_enc,)
+        encoded = self.rewrite_cache.get(encoded_key)
+        if encoded is None:
+            encoded = compress(rewritten, out_enc)
+            self.rewrite_cache.put(encoded_key, encoded, len(encoded), saved=len(raw))
+        return encoded, out_enc
+
+    def _head_headers(self, resp_headers, prefix: str) -> list[tuple[str, str]]:
+        # HEAD: cabecalhos do backend como vieram, com o Content-Length/ETag que o GET teria.
+        out = self._upstream_response_headers(resp_headers, prefix)
+        length = resp_headers.get("Content-Length")
+        if length:
+            out.append(("Content-Length", length))
+        return out
+
+    def _upstream_response_headers(self, resp_headers, prefix: str, encoding: str | None = None) -> list[tuple[str, str]]:
+        # encoding=None: passthrough, mantem Content-Encoding/Vary do backend.
+        # Caso contrario o hub recodificou o corpo e define os dois cabecalhos.
+        # Date/Server ja sao emitidos pelo hub; repassar duplicaria os cabecalhos.
+        skip = HOP_BY_HOP | connection_tokens(resp_headers) | {"content-length", "date", "server"}
+        if encoding is not None:
+            # O ETag do backend descreve outros bytes; no modo bufferizado o hub emite o proprio.
+            skip = skip | {"content-encoding", "vary", "etag"}
+        out = []
+        vary = []
+        for k, v in resp_headers.items():
+            kl = k.lower()
+            if kl == "vary" and encoding is not None:
+                vary.extend(x.strip() for x in v.split(",") if x.strip())
+            if kl in skip:
+                continue
+            if kl == "location":
+                out.append(("Location", self._rewrite_location_for_prefix(v, prefix)))
+                continue
+            out.append((k, v))
+        if encoding is not None:
+            if encoding != "identity":
+                out.append(("Content-Encoding", encoding))
+            if not any(x.lower() == "accept-encoding" for x in vary):
+                vary.append("Accept-Encoding")
+            out.append(("Vary", ", ".join(vary)))
+        return out
+
+    def _send_upstream_headers(
+        self,
+        handler: BaseHTTPRequestHandler,
+        resp,
+        prefix: str,
+        encoding: str | None = None,
+    ) -> None:
+        handler.send_response(resp.status)
+        for k, v in self._upstream_response_headers(resp.headers, prefix, encoding):
+            handler.send_header(k, v)
+
+    def _stream_response(
+        self,
+        handler: BaseHTTPRequestHandler,
+        inst: InstanceConfig,
+        conn,
+        resp,
+        prefix: str,
+        transform: TransformChain | None = None,
+        encoding: str | None = None,
+    ) -> None:
+        # Repassa o corpo em blocos de tamanho fixo: memoria por requisicao fica limitada
+        # a STREAM_CHUNK_SIZE independente do tamanho da resposta.
+        self._send_upstream_headers(handler, resp, prefix, encoding=encoding)
+        if resp.status in {204, 304} or 100 <= resp.status < 200:
+            handler.end_headers()
+            resp.read()
+            self.upstream.release(inst.backend_url, conn, resp)
+            return
+        chunked = False
+        if resp.length is not None and transform is None:
+            handler.send_header("Content-Length", str(resp.length))
+        elif handler.request_version == "HTTP/1.1" and handler.protocol_version == "HTTP/1.1":
+            handler.send_header("Transfer-Encoding", "chunked")
+            chunked = True
+        else:
+            # Cliente HTTP/1.0 sem tamanho conhecido: corpo delimitado pelo fechamento.
+            handler.close_connection = True
+        handler.end_headers()
+        try:
+            while True:
+                block = resp.read(STREAM_CHUNK_SIZE)
+                last = not block
+                if transform is not None:
+                    block = transform.flush() if last else transform.feed(block)
+                if block:
+                    if chunked:
+                        handler.wfile.write(b"%x\r\n%s\r\n" % (len(block), block))
+                    else:
+                        handler.wfile.write(block)
+                if last:
+                    break
+            if chunked:
+                handler.wfile.write(b"0\r\n\r\n")
+        except Exception:
+            # Cliente desconectou ou backend caiu no meio do corpo: descarta as duas pontas.
+            handler.close_connection = True
+            self.upstream.release(inst.backend_url, conn, None)
+            return
+        finally:
+            # Leitura do backend, rewrite e escrita no cliente intercalados bloco a bloco.
+            handler.timer.lap("stream")
+        self.upstream.release(inst.backend_url, conn, resp)
 
     def warm_up_enabled_backends(self) -> None:
-        cfg = self.settings.load()
-        for inst in cfg.instances:
+        snap = self.settings.snapshot()
+        for inst in snap.instances:
             if not inst.enabled:
                 continue
             ok = self._ensure_backend_online(inst)
             self._diag(f"[Warmup] {inst.display_name}: {'OK' if ok else 'FALHA'}")
 
+    def _route_table(self, snap: ConfigSnapshot) -> RouteTable:
+        routes = self._routes
+        if routes.version == snap.version:
+            return routes
+        with self._routes_lock:
+            routes = self._routes
+            if routes.version != snap.version:
+                routes = RouteTable(version=snap.version, instances=snap.instances)
+                # Troca atomica: leitores concorrentes veem a tabela antiga ou a nova.
+                self._routes = routes
+            return routes
+
+    def _home_page(self, snap: ConfigSnapshot) -> Precompressed:
+        # Renderizada e comprimida uma vez por versao da config.
+        home = self._home
+        if home is not None and home[0] == snap.version:
+            return home[1]
+        with self._home_lock:
+            home = self._home
+            if home is None or home[0] != snap.version:
+                raw = _render_home_html(snap.instances, self.stylesheet_path, snap.config.home_font_css_url)
+                home = (snap.version, precompress("text/html; charset=utf-8", raw.encode("utf-8")))
+                self._home = home
+            return home[1]
+
+    def _hub_static(self, path: str) -> Precompressed | None:
+        return self._stylesheet if path == self.stylesheet_path else None
+
+    def _backend_up_metric(self) -> dict[tuple, float]:
+        return {(i.instance_id,): float(self.health.is_up(i.instance_id)) for i in self.settings.snapshot().instances}
+
+    def _backend_process_metric(self) -> dict[tuple, float]:
+        with self._proc_lock:
+            procs = dict(self._procs)
+        return {
+            (i.instance_id,): float(i.instance_id in procs and procs[i.instance_id].poll() is None)
+            for i in self.settings.snapshot().instances
+        }
+
+    def _active_handlers_metric(self) -> float:
+        return float(self.workers.stats()["busy"]) if self.workers is not None else 0.0
+
     @staticmethod
-    def _instances_by_prefix(instances: list[InstanceConfig]) -> dict[str, InstanceConfig]:
-        out: dict[str, InstanceConfig] = {}
-        for inst in instances:
-            p = inst.route_prefix.strip("/")
-            if p and p not in out:
-                out[p] = inst
+    def _observe_request(route: str, status: int, seconds: float, bytes_in: int, bytes_out: int) -> None:
+        status_label = str(status or 0)
+        metrics.HTTP_REQUESTS.inc(route, status_label)
+        metrics.HTTP_DURATION.observe(seconds, route, status_label)
+        metrics.HTTP_BYTES_IN.inc(route, amount=bytes_in)
+        metrics.HTTP_BYTES_OUT.inc(route, amount=bytes_out)
+
+    def _finish_timing(self, timer: RequestTimer, method: str, target: str, status: int, route: str) -> None:
+        if not timer.is_slow():
+            return
+        self.slowlog.log(f"{method} {target} {status} {timer.total() * 1000:.1f}ms route={route} {timer.summary()}")
+
+    def _instance_item(self, snap: dict) -> dict:
+        # Copia: o snapshot do worker e compartilhado entre leituras.
+        return dict(
+            snap,
+            health=self.health.snapshot(snap["instance_id"]),
+            breaker=self.breakers.snapshot(snap["instance_id"]),
+        )
+
+    def _instances_payload(self) -> dict:
+        # Versao lida antes dos snapshots: uma mudanca concorrente aparece no proximo delta.
+        version = self.runtime.feed.version
+        return {"version": version, "items": [self._instance_item(s) for s in self.runtime.list()]}
+
+    @staticmethod
+    def _feed_params(query: str) -> tuple[int | None, float]:
+        params = parse_qs(query)
+        try:
+            since = int(params["since"][0]) if "since" in params else None
+        except ValueError:
+            since = None
+        try:
+            wait = float(params["wait"][0]) if "wait" in params else FEED_DEFAULT_WAIT
+        except ValueError:
+            wait = FEED_DEFAULT_WAIT
+        return since, max(0.0, min(FEED_MAX_WAIT, wait))
+
+    def _feed_json(self, since: int) -> tuple[int, bool, bytes]:
+        # (versao, completo, JSON). since=0 ou de outro processo (maior que a versao atual)
+        # recebe tudo; senao so as instancias que mudaram depois de `since`.
+        feed = self.runtime.feed
+        cached = self._feed_cache.get((since, feed.version))
+        if cached is not None:
+            return feed.version, cached[0], cached[1]
+        version, changed = feed.changed_since(since)
+        full = since <= 0 or since > version
+        if full:
+            items = [self._instance_item(s) for s in self.runtime.list()]
+        else:
+            items = [self._instance_item(s) for s in map(self.runtime.snapshot, changed) if s is not None]
+        raw = json.dumps({"version": version, "full": full, "items": items}, ensure_ascii=False).encode("utf-8")
+        if len(self._feed_cache) >= 64:
+            self._feed_cache.clear()
+        self._feed_cache[(since, version)] = (full, raw)
+        return version, full, raw
+
+    @staticmethod
+    def _sse_event(version: int, full: bool, raw: bytes) -> bytes:
+        return b"id: %d\nevent: %s\ndata: %s\n\n" % (version, b"snapshot" if full else b"update", raw)
+
+    def _feed_stream(self, handler: BaseHTTPRequestHandler, since: int) -> None:
+        handler.close_connection = True
+        handler.send_response(200)
+        handler.send_header("Content-Type", "text/event-stream; charset=utf-8")
+        handler.send_header("Cache-Control", "no-cache")
+        handler.end_headers()
+        if handler.command == "HEAD":
+            return
+        feed = self.runtime.feed
+        deadline = time.monotonic() + FEED_STREAM_MAX_SECONDS
+        try:
+            handler.wfile.write(b"retry: 3000\n\n")
+            while time.monotonic() < deadline:
+                if since <= 0 or feed.version != since:
+                    since, full, raw = self._feed_json(since)
+                    handler.wfile.write(self._sse_event(since, full, raw))
+                    handler.wfile.flush()
+                    continue
+                beat = time.monotonic() + FEED_HEARTBEAT
+                while feed.version == since and time.monotonic() < beat:
+                    # Fatias curtas: libera o worker se houver conexoes esperando na fila.
+                    if handler.server.pool.saturated():
+                        return
+                    feed.wait(since, 1.0)
+                if feed.version == since:
+                    handler.wfile.write(b": ping\n\n")
+                    handler.wfile.flush()
+        except OSError:
+            return
+
+    def _feed_poll(self, handler: BaseHTTPRequestHandler, since: int, wait: float) -> None:
+        feed = self.runtime.feed
+        deadline = time.monotonic() + wait
+        while feed.version == since and time.monotonic() < deadline and not handler.server.pool.saturated():
+            feed.wait(since, min(1.0, deadline - time.monotonic()))
+        _, _, raw = self._feed_json(since)
+        _body_response(handler, 200, "application/json; charset=utf-8", raw, [("Cache-Control", "no-cache")])
+
+    def _logs_instance(self, path: str) -> str | None:
+        # /hub/api/instances/<id>/logs -> <id>, se a instancia existir.
+        inner = path[len("/hub/api/instances/"):-len("/logs")]
+        if not inner or "/" in inner:
+            return None
+        if not any(inst.instance_id == inner for inst in self.settings.snapshot().instances):
+            return None
+        return inner
+
+    @staticmethod
+    def _log_params(query: str, last_event_id: str = "") -> tuple[int, int, bool]:
+        params = parse_qs(query)
+        try:
+            limit = int(params["lines"][0]) if "lines" in params else LOG_TAIL_DEFAULT_LINES
+        except ValueError:
+            limit = LOG_TAIL_DEFAULT_LINES
+        try:
+            since = int(params["since"][0]) if "since" in params else 0
+        except ValueError:
+            since = 0
+        if last_event_id.isdigit():
+            since = int(last_event_id)
+        follow = (params.get("follow") or ["0"])[0].lower() in {"1", "true", "yes"}
+        return max(0, limit), max(0, since), follow
+
+    @staticmethod
+    def _log_item(item: tuple[int, str, str]) -> dict:
+        return {"seq": item[0], "stream": item[1], "text": item[2]}
+
+    def _logs_json(self, instance_id: str, since: int, limit: int) -> bytes:
+        tail = self.output.tail(instance_id)
+        version = tail.version
+        items = [self._log_item(item) for item in tail.lines(since, limit)]
+        payload = {"instance_id": instance_id, "seq": version, "lines": items}
+        return json.dumps(payload, ensure_ascii=False).encode("utf-8")
+
+    def _log_events(self, tail: LogTail, since: int, limit: int = 0) -> tuple[int, bytes]:
+        # Tudo o que chegou depois de `since` num unico write; id = seq para o Last-Event-ID.
+        out = []
+        for item in tail.lines(since, limit):
+            since = item[0]
+            data = json.dumps(self._log_item(item), ensure_ascii=False).encode("utf-8")
+            out.append(b"id: %d\nevent: line\ndata: %s\n\n" % (since, data))
+        return since, b"".join(out)
+
+    def _logs_stream(self, handler: BaseHTTPRequestHandler, instance_id: str, since: int, limit: int) -> None:
+        handler.close_connection = True
+        handler.send_response(200)
+        handler.send_header("Content-Type", "text/event-stream; charset=utf-8")
+        handler.send_header("Cache-Control", "no-cache")
+        handler.end_headers()
+        if handler.command == "HEAD":
+            return
+        tail = self.output.tail(instance_id)
+        deadline = time.monotonic() + FEED_STREAM_MAX_SECONDS
+        try:
+            handler.wfile.write(b"retry: 3000\n\n")
+            # Primeira leva: as ultimas `limit` linhas (ou as perdidas desde o Last-Event-ID).
+            since, raw = self._log_events(tail, since, limit)
+            while time.monotonic() < deadline:
+                if raw:
+                    handler.wfile.write(raw)
+                    handler.wfile.flush()
+                beat = time.monotonic() + FEED_HEARTBEAT
+                while tail.version == since and time.monotonic() < beat:
+                    if handler.server.pool.saturated():
+                        return
+                    tail.wait(since, 1.0)
+                if tail.version == since:
+                    raw = b": ping\n\n"
+                else:
+                    since, raw = self._log_events(tail, since)
+        except OSError:
+            return
+
+    def _stats_payload(self) -> dict:
+        out = {
+            "upstream_pool": self.upstream.stats(),
+            "rewrite_cache": self.rewrite_cache.stats(),
+            "coalescing": self.coalescer.stats(),
+            "asset_cache": self.assets.stats(),
+            "diag_log": self.diaglog.stats(),
+            "slow_log": self.slowlog.stats(),
+            "backend_output": self.output.stats(),
+            "scheduler": self.runtime.scheduler.stats(),
+            "cycles": self.runtime.executor.stats(),
+            "instance_updater": self._instance_update_stats(),
+        }
+        if self.workers is not None:
+            out["workers"] = self.workers.stats()
+        if self.httpd is not None:
+            out["keepalive"] = self.httpd.parker.stats()
         return out
 
+    def _instance_update_stats(self) -> dict:
+        with self._inst_update_lock:
+            return {iid: dict(item) for iid, item in self._inst_update_results.items()}
+
     def start(self) -> None:
-        runtime = self.runtime
         settings_store = self.settings
+        cfg = settings_store.snapshot().config
+        max_requests = int(cfg.http_max_requests_per_connection)
+        keepalive_timeout = int(cfg.http_keepalive_timeout_seconds)
 
         class Handler(BaseHTTPRequestHandler):
+            # HTTP/1.1: conexoes persistentes com o navegador; toda resposta precisa de
+            # Content-Length, chunked ou Connection: close.
+            protocol_version = "HTTP/1.1"
+            # Timeout de socket = tempo maximo ocioso entre requisicoes na mesma conexao.
+            timeout = keepalive_timeout
+            # Cabecalhos e corpo saem em writes separados; com Nagle + delayed ACK do cliente
+            # cada resposta em conexao keep-alive esperava ~40ms pelo segundo segmento.
+            disable_nagle_algorithm = True
+
+            def setup(self):
+                super().setup()
+                self.requests_served = 0
+                self.body_consumed = False
+                # Bytes por requisicao = diferenca desde a anterior (inclui a linha e os cabecalhos).
+                self.rfile = CountingReader(self.rfile)
+                self.wfile = CountingWriter(self.wfile)
+                self.metric_read = 0
+                self.metric_sent = 0
+                self.timer: RequestTimer | None = None
+
+            def send_response(self, code, message=None):
+                self.metric_status = code
+                super().send_response(code, message)
+
             def log_message(self, fmt, *args):
                 return
 
+            def _has_request_body(self) -> bool:
+                if "chunked" in self.headers.get("Transfer-Encoding", "").lower():
+                    return True
+                try:
+                    return int(self.headers.get("Content-Length", "0") or 0) > 0
+                except ValueError:
+                    return True
+
+            def end_headers(self):
+                if not self.close_connection and self._has_request_body() and not self.body_consumed:
+                    # Corpo nao lido ficaria no socket e seria lido como proxima requisicao.
+                    self.close_connection = True
+                if self.timer is not None and self.timer.server_timing:
+                    self.send_header("Server-Timing", self.timer.header())
+                if self.close_connection:
+                    self.send_header("Connection", "close")
+                elif self.request_version == "HTTP/1.0":
+                    self.send_header("Connection", "keep-alive")
+                    self.send_header("Keep-Alive", f"timeout={keepalive_timeout}")
+                super().end_headers()
+
+            def handle(self):
+                # Loop do BaseHTTPRequestHandler sem esperar a proxima requisicao no worker:
+                # sem nada ja recebido, a conexao fica estacionada no servidor (parked) e so
+                # volta a ocupar um worker quando o socket ficar legivel.
+                self.parked = False
+                self.close_connection = True
+                self.handle_one_request()
+                while not self.close_connection:
+                    if not self._input_pending():
+                        self.parked = True
+                        return
+                    self.handle_one_request()
+
+            def finish(self):
+                # Estacionada: rfile/wfile seguem em uso quando a conexao voltar.
+                if not self.parked:
+                    super().finish()
+
+            def _input_pending(self) -> bool:
+                # Pipelining: a proxima requisicao pode ja estar no buffer do rfile.
+                self.connection.settimeout(0)
+                try:
+                    return bool(self.rfile.peek(1))
+                except OSError:
+                    return False
+                finally:
+                    self.connection.settimeout(self.timeout)
+
             def _route(self):
-                cfg = settings_store.load()
+                timer = self.timer = RequestTimer()
+                self.metric_route = "hub"
+                self.metric_status = 0
+                try:
+                    return self._route_request()
+                finally:
+                    # O que sobra depois da ultima fase e a escrita da resposta ao cliente.
+                    timer.lap("send")
+                    self.timer = None
+                    hub = self.server.hub_ref
+                    read, sent = self.rfile.count, self.wfile.count
+                    hub._observe_request(
+                        self.metric_route,
+                        self.metric_status,
+                        timer.total(),
+                        read - self.metric_read,
+                        sent - self.metric_sent,
+                    )
+                    self.metric_read, self.metric_sent = read, sent
+                    hub._finish_timing(timer, self.command, self.path, self.metric_status, self.metric_route)
+
+            def _route_request(self):
+                hub = self.server.hub_ref
+                self.body_consumed = False
+                self.requests_served += 1
+                if max_requests and self.requests_served >= max_requests:
+                    self.close_connection = True
+                snap = settings_store.snapshot()
+                self.timer.configure(snap.config)
+                self.timer.lap("cfg")
                 path = urlparse(self.path).path
-                by_prefix = self.server.hub_ref._instances_by_prefix(cfg.instances)
 
+                accept = self.headers.get("Accept-Encoding", "")
                 if path == "/":
-                    return _html_response(self, 200, _render_home_html(cfg.instances))
+                    out_headers, body = _precompressed_reply(
+                        hub._home_page(snap), accept, [("Cache-Control", HOME_CACHE_CONTROL)]
+                    )
+                    return hub._send_buffered(self, 200, out_headers, body)
+
+                if path.startswith(HUB_STATIC_PREFIX):
+                    static = hub._hub_static(path)
+                    if static is None:
+                        return _json_response(self, 404, {"ok": False, "error": "Nao encontrado"})
+                    out_headers, body = _precompressed_reply(static, accept, [("Cache-Control", STATIC_CACHE_CONTROL)])
+                    return hub._send_buffered(self, 200, out_headers, body)
+
+                if path == "/hub/api/stats":
+                    return _json_response(self, 200, hub._stats_payload())
+
+                if path == "/hub/metrics":
+                    return _body_response(self, 200, metrics.CONTENT_TYPE, metrics.REGISTRY.render().encode("utf-8"))
 
                 if path == "/hub/api/instances":
-                    return _json_response(self, 200, {"items": runtime.list()})
-
-                for prefix, inst in by_prefix.items():
-                    base = f"/{prefix}"
-                    if path == base:
-                        return _redirect_response(self, f"{base}/")
-                    if path.startswith(f"{base}/"):
-                        ok = self.server.hub_ref._ensure_backend_online(inst, quiet_if_online=True)
-                        if not ok:
-                            return _html_response(
-                                self,
-                                503,
-                                f"<h1>{inst.display_name} indisponivel</h1>"
-                                "<p>Nao foi possivel iniciar ou alcancar o backend configurado</p>",
-                            )
-                        return self.server.hub_ref._proxy(self, inst)
-
-                return _json_response(self, 404, {"ok": False, "error": "Nao encontrado"})
+                    since, wait = hub._feed_params(urlparse(self.path).query)
+                    if since is None:
+                        return _json_response(self, 200, hub._instances_payload())
+                    self.timer.long_lived = True
+                    return hub._feed_poll(self, since, wait)
+
+                if path.startswith("/hub/api/instances/") and path.endswith("/logs"):
+                    instance_id = hub._logs_instance(path)
+                    if instance_id is None:
+                        return _json_response(self, 404, {"ok": False, "error": "Instancia nao encontrada"})
+                    limit, since, follow = hub._log_params(
+                        urlparse(self.path).query, self.headers.get("Last-Event-ID", "")
+                    )
+                    if follow:
+                        self.timer.long_lived = True
+                        return hub._logs_stream(self, instance_id, since, limit)
+                    raw = hub._logs_json(instance_id, since, limit)
+                    return _body_response(self, 200, "application/json; charset=utf-8", raw, [("Cache-Control", "no-cache")])
+
+                if path == "/hub/api/instances/stream":
+                    since, _ = hub._feed_params(urlparse(self.path).query)
+                    last_id = self.headers.get("Last-Event-ID", "")
+                    self.timer.long_lived = True
+                    return hub._feed_stream(self, int(last_id) if last_id.isdigit() else since or 0)
+
+                match = hub._route_table(snap).match(path)
+                if match is None:
+                    self.metric_route = "unmatched"
+                    return _json_response(self, 404, {"ok": False, "error": "Nao encontrado"})
+                self.metric_route = match.prefix
+                self.timer.lap("route")
+                inst = match.instance
+                if match.exact:
+                    return _redirect_response(self, f"/{match.prefix}/")
+                permit = hub.breakers.allow(inst.instance_id)
+                if permit is None:
+                    return _html_response(self, 503, *hub._unavailable_page(inst, breaker_open=True))
+                try:
+                    # Estado em memoria do monitor de saude; so tenta subir o backend se nao estiver "up".
+                    ok = hub.health.is_up(inst.instance_id) or hub._ensure_backend_online(inst, quiet_if_online=True)
+                    self.timer.lap("backend")
+                    if not ok:
+                        hub.breakers.record_failure(inst.instance_id, "backend nao ficou online")
+                        return _html_response(self, 503, *hub._unavailable_page(inst, breaker_open=False))
+                    return hub._proxy(self, inst)
+                finally:
+                    hub.breakers.release(inst.instance_id, permit)
 
             def do_GET(self):
                 return self._route()
 
+            def do_HEAD(self):
+                return self._route()
+
             def do_POST(self):
                 return self._route()
 
@@ -594,10 +1514,14 @@ class HubHttpServer:
             def do_DELETE(self):
                 return self._route()
 
-        self.httpd = ThreadingHTTPServer((self.host, self.port), Handler)
+        self.workers = BoundedWorkerPool(cfg.http_worker_threads, cfg.http_accept_queue)
+        self.workers.start()
+        metrics.ACTIVE_HANDLERS.set_function(self._active_handlers_metric)
+        self.httpd = PooledHTTPServer((self.host, self.port), Handler, self.workers)
         self.httpd.hub_ref = self
         self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True, name="hub-http")
         self._thread.start()
+        self.health.start()
 
     def join_forever(self):
         if self._thread:
@@ -605,9 +1529,13 @@ class HubHttpServer:
 
     def stop(self):
         self._inst_updater_stop.set()
+        self.health.stop()
+        self.upstream.close_all()
         if self.httpd:
             self.httpd.shutdown()
             self.httpd.server_close()
+        if self.workers:
+            self.workers.shutdown()
         with self._proc_lock:
             for proc in self._procs.values():
                 if proc and proc.poll() is None:
@@ -620,14 +1548,16 @@ class HubHttpServer:
                         except Exception:
                             pass
             self._procs.clear()
+        self.output.close()
+        self.slowlog.stop()
+        self.diaglog.stop()
 
 
 def _base_styles() -> str:
     return """
-    @import url('https://fonts.googleapis.com/css2?family=Lexend:wght@400;600;700;900&display=swap');
-    :root{--bg:#eff0f2;--ink:#131313;--hub:#176fe5;--hub-center:#9cdaf8}
-    body{font-family:'Lexend',sans-serif;background:var(--bg);margin:0;padding:16px;color:var(--ink)}
-    *{font-family:'Lexend',sans-serif}
+    :root{--bg:#eff0f2;--ink:#131313;--hub:#176fe5;--hub-center:#9cdaf8;--font:'Lexend',system-ui,-apple-system,'Segoe UI',Roboto,sans-serif}
+    body{font-family:var(--font);background:var(--bg);margin:0;padding:16px;color:var(--ink)}
+    *{font-family:var(--font)}
     .container{max-width:900px;margin:0 auto;text-align:center}
     .title-wrap{display:inline-block;position:relative;margin-top:4px}
     .title-wrap::after{content:"";position:absolute;left:-8px;right:-8px;height:14px;bottom:6px;background:#c8f1ff;z-index:0}
@@ -659,7 +1589,11 @@ def _base_styles() -> str:
     """
 
 
-def _render_home_html(instances: list[InstanceConfig]) -> str:
+def _render_home_html(
+    instances: tuple[InstanceConfig, ...] | list[InstanceConfig],
+    stylesheet_href: str,
+    font_css_url: str = "",
+) -> str:
     colors = ["#e08dc8", "#45c2ad", "#b4d15a", "#f1ad77", "#b98be2", "#5e8ad8"]
     slot_angles = [-90, -30, 30, 90, 150, 210]
     # fill to 6 spokes with placeholders for future modules
@@ -707,15 +1641,17 @@ def _render_home_html(instances: list[InstanceConfig]) -> str:
       {spoke_close}
 """
         )
+    # Fonte externa opcional, carregada sem bloquear a renderizacao.
+    font_link = ""
+    if font_css_url:
+        font_link = f'\n  <link rel="stylesheet" href="{html.escape(font_css_url)}" media="print" onload="this.media=\'all\'" />'
     return """<!doctype html>
 <html lang="pt-BR">
 <head>
   <meta charset="utf-8" />
   <meta name="viewport" content="width=device-width,initial-scale=1" />
   <title>Hub MVA</title>
-  <style>
-""" + _base_styles() + """
-  </style>
+  """ + f'<link rel="stylesheet" href="{stylesheet_href}" />' + font_link + """
 </head>
 <body>
   <div class="container">
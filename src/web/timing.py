@@ -0,0 +1,42 @@
+from __future__ import annotations
+
+import time
+
+
+class RequestTimer:
+    # Quebra do tempo de uma requisicao em fases. lap(nome) atribui a `nome` o tempo desde a
+    # marca anterior; fases repetidas somam. A soma das fases e sempre o tempo total.
+    __slots__ = ("started", "phases", "long_lived", "server_timing", "slow_seconds", "_mark")
+
+    def __init__(self):
+        self.started = self._mark = time.perf_counter()
+        self.phases: dict[str, float] = {}
+        # Long-poll/SSE: duracao longa e esperada, fica fora do log de requisicoes lentas.
+        self.long_lived = False
+        # Lidos do snapshot de config da propria requisicao (configure).
+        self.server_timing = False
+        self.slow_seconds = 0.0
+
+    def configure(self, config) -> None:
+        self.server_timing = bool(config.server_timing_enabled)
+        self.slow_seconds = max(0, int(config.slow_request_ms)) / 1000.0
+
+    def lap(self, name: str) -> None:
+        now = time.perf_counter()
+        self.phases[name] = self.phases.get(name, 0.0) + (now - self._mark)
+        self._mark = now
+
+    def total(self) -> float:
+        return time.perf_counter() - self.started
+
+    def is_slow(self) -> bool:
+        return not self.long_lived and self.slow_seconds > 0 and self.total() >= self.slow_seconds
+
+    def header(self) -> str:
+        # Server-Timing sai junto com os cabecalhos: cobre o que aconteceu ate ali.
+        parts = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in self.phases.items()]
+        parts.append(f"total;dur={self.total() * 1000:.1f}")
+        return ", ".join(parts)
+
+    def summary(self) -> str:
+        return " ".join(f"{name}={seconds * 1000:.1f}ms" for name, seconds in self.phases.items())
@@ -0,0 +1,223 @@
+from __future__ import annotations
+
+import http.client
+import select
+import threading
+import time
+from urllib.parse import urlparse
+
+from core import metrics
+from web.bodies import MalformedChunkedBody, parse_chunk_size
+
+
+# Headers hop-by-hop (RFC 7230 6.1): nunca repassados entre cliente, hub e backend.
+HOP_BY_HOP = {
+    "connection",
+    "keep-alive",
+    "proxy-authenticate",
+    "proxy-authorization",
+    "proxy-connection",
+    "te",
+    "trailer",
+    "transfer-encoding",
+    "upgrade",
+}
+
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE", "TRACE"}
+
+# Falhas tipicas de uma conexao keep-alive que o backend fechou enquanto estava ociosa.
+_STALE_ERRORS = (
+    http.client.RemoteDisconnected,
+    http.client.BadStatusLine,
+    ConnectionResetError,
+    ConnectionAbortedError,
+    BrokenPipeError,
+)
+
+
+def connection_tokens(headers) -> set[str]:
+    out = set()
+    for value in headers.get_all("Connection") or []:
+        for token in str(value or "").split(","):
+            token = token.strip().lower()
+            if token:
+                out.add(token)
+    return out
+
+
+class _UpstreamResponse(http.client.HTTPResponse):
+    # Mesmo parse estrito de tamanho de chunk usado no corpo vindo do cliente.
+    def _read_next_chunk_size(self):
+        line = self.fp.readline(http.client._MAXLINE + 1)
+        if len(line) > http.client._MAXLINE:
+            raise http.client.LineTooLong("chunk size")
+        try:
+            return parse_chunk_size(line)
+        except MalformedChunkedBody as exc:
+            # http.client converte ValueError em IncompleteRead; a conexao nao e reaproveitada.
+            self._close_conn()
+            raise ValueError(str(exc)) from exc
+
+
+class UpstreamPool:
+    # Pool de conexoes http.client persistentes por backend (scheme, host, port).
+    # Conexoes ociosas ficam em pilha LIFO; as mais antigas expiram por idle_timeout.
+    def __init__(self, max_idle_per_backend: int = 8, idle_timeout: float = 30.0, timeout: float = 45.0):
+        self.max_idle_per_backend = max(0, int(max_idle_per_backend))
+        self.idle_timeout = float(idle_timeout)
+        self.timeout = float(timeout)
+        self._idle: dict[tuple[str, str, int], list[tuple[float, http.client.HTTPConnection]]] = {}
+        self._lock = threading.Lock()
+        self._counters = {
+            "hits": 0,
+            "misses": 0,
+            "stale_discarded": 0,
+            "idle_evicted": 0,
+            "retries": 0,
+            "released": 0,
+            "closed": 0,
+        }
+
+    @staticmethod
+    def _key(base_url: str) -> tuple[str, str, int]:
+        parsed = urlparse(base_url)
+        scheme = (parsed.scheme or "http").lower()
+        port = parsed.port or (443 if scheme == "https" else 80)
+        return scheme, parsed.hostname or "127.0.0.1", port
+
+    def _count(self, name: str, amount: int = 1) -> None:
+        with self._lock:
+            self._counters[name] += amount
+
+    def _new_connection(self, key: tuple[str, str, int]) -> http.client.HTTPConnection:
+        scheme, host, port = key
+        if scheme == "https":
+            conn = http.client.HTTPSConnection(host, port, timeout=self.timeout)
+        else:
+            conn = http.client.HTTPConnection(host, port, timeout=self.timeout)
+        conn.response_class = _UpstreamResponse
+        return conn
+
+    @staticmethod
+    def _is_stale(conn: http.client.HTTPConnection) -> bool:
+        sock = conn.sock
+        if sock is None:
+            return True
+        try:
+            # Socket ocioso legivel = FIN/RST do backend (ou lixo): nao da para reusar.
+            readable, _, _ = select.select([sock], [], [], 0)
+        except (OSError, ValueError):
+            return True
+        return bool(readable)
+
+    def _evict_expired_locked(self, now: float) -> list[http.client.HTTPConnection]:
+        expired = []
+        for key, stack in self._idle.items():
+            keep = []
+            for idle_since, conn in stack:
+                if now - idle_since > self.idle_timeout:
+                    expired.append(conn)
+                else:
+                    keep.append((idle_since, conn))
+            self._idle[key] = keep
+        self._counters["idle_evicted"] += len(expired)
+        return expired
+
+    def acquire(self, base_url: str, fresh: bool = False) -> tuple[http.client.HTTPConnection, bool]:
+        key = self._key(base_url)
+        now = time.monotonic()
+        reused = None
+        discard: list[http.client.HTTPConnection] = []
+        with self._lock:
+            discard.extend(self._evict_expired_locked(now))
+            stack = self._idle.get(key) or []
+            while not fresh and stack:
+                _, conn = stack.pop()
+                if self._is_stale(conn):
+                    self._counters["stale_discarded"] += 1
+                    discard.append(conn)
+                    continue
+                reused = conn
+                break
+            if reused is not None:
+                self._counters["hits"] += 1
+            else:
+                self._counters["misses"] += 1
+        for conn in discard:
+            conn.close()
+        if reused is not None:
+            return reused, True
+        return self._new_connection(key), False
+
+    def release(self, base_url: str, conn: http.client.HTTPConnection, resp: http.client.HTTPResponse | None) -> None:
+        # Volta para o pool apenas se a resposta foi lida ate o fim e o backend manteve a conexao.
+        sent_at = getattr(conn, "hub_sent_at", None)
+        if resp is not None and sent_at is not None and resp.isclosed():
+            metrics.UPSTREAM_TOTAL.observe(time.perf_counter() - sent_at, conn.hub_backend)
+        if resp is None or not resp.isclosed() or resp.will_close or conn.sock is None:
+            conn.close()
+            self._count("closed")
+            return
+        key = self._key(base_url)
+        with self._lock:
+            stack = self._idle.setdefault(key, [])
+            if len(stack) < self.max_idle_per_backend:
+                stack.append((time.monotonic(), conn))
+                self._counters["released"] += 1
+                return
+            self._counters["closed"] += 1
+        conn.close()
+
+    def request(
+        self,
+        base_url: str,
+        method: str,
+        path: str,
+        headers: dict[str, str],
+        body=None,
+        replayable: bool = True,
+    ) -> tuple[http.client.HTTPConnection, http.client.HTTPResponse]:
+        _, host, port = self._key(base_url)
+        backend = f"{host}:{port}"
+        fresh = False
+        while True:
+            conn, reused = self.acquire(base_url, fresh=fresh)
+            try:
+                if conn.sock is None:
+                    # Conexao explicita (request() abriria sozinho) para medir o connect a parte.
+                    started = time.perf_counter()
+                    conn.connect()
+                    metrics.UPSTREAM_CONNECT.observe(time.perf_counter() - started, backend)
+                sent_at = time.perf_counter()
+                conn.request(method, path, body=body, headers=headers)
+                resp = conn.getresponse()
+                metrics.UPSTREAM_TTFB.observe(time.perf_counter() - sent_at, backend)
+                conn.hub_sent_at, conn.hub_backend = sent_at, backend
+                return conn, resp
+            except _STALE_ERRORS:
+                conn.close()
+                # Conexao reaproveitada que morreu: repete uma vez em conexao nova se for seguro.
+                if reused and replayable and method.upper() in IDEMPOTENT_METHODS:
+                    self._count("retries")
+                    fresh = True
+                    continue
+                raise
+            except BaseException:
+                conn.close()
+                raise
+
+    def stats(self) -> dict:
+        with self._lock:
+            out = dict(self._counters)
+            out["idle_connections"] = sum(len(stack) for stack in self._idle.values())
+        lookups = out["hits"] + out["misses"]
+        out["reuse_ratio"] = round(out["hits"] / lookups, 4) if lookups else 0.0
+        return out
+
+    def close_all(self) -> None:
+        with self._lock:
+            stacks = list(self._idle.values())
+            self._idle.clear()
+        for stack in stacks:
+            for _, conn in stack:
+                conn.close()
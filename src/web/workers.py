@@ -0,0 +1,287 @@
+from __future__ import annotations
+
+import queue
+import selectors
+import socket
+import threading
+import time
+from collections import deque
+from http.server import HTTPServer
+
+
+# Resposta pronta enviada quando a fila de admissao esta cheia: sem parse, sem thread.
+RETRY_AFTER_SECONDS = 2
+_OVERLOAD_BODY = b"<h1>Hub sobrecarregado</h1><p>Tente novamente em instantes</p>"
+_OVERLOAD_RESPONSE = (
+    b"HTTP/1.1 503 Service Unavailable\r\n"
+    b"Content-Type: text/html; charset=utf-8\r\n"
+    b"Retry-After: " + str(RETRY_AFTER_SECONDS).encode() + b"\r\n"
+    b"Content-Length: " + str(len(_OVERLOAD_BODY)).encode() + b"\r\n"
+    b"Connection: close\r\n\r\n" + _OVERLOAD_BODY
+)
+
+
+class BoundedWorkerPool:
+    # Numero fixo de threads consumindo uma fila limitada. submit() nunca bloqueia:
+    # fila cheia = False e o chamador decide como recusar.
+    def __init__(self, workers: int, queue_size: int, name: str = "hub-worker"):
+        self.workers = max(1, int(workers))
+        # queue.Queue(0) seria ilimitada.
+        self.queue_size = max(1, int(queue_size))
+        self._queue: queue.Queue = queue.Queue(self.queue_size)
+        self._name = name
+        self._threads: list[threading.Thread] = []
+        self._lock = threading.Lock()
+        self._busy = 0
+        self._counters = {"accepted": 0, "rejected": 0, "completed": 0, "failed": 0}
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._wait_count = 0
+
+    def start(self) -> None:
+        for i in range(self.workers):
+            t = threading.Thread(target=self._run, daemon=True, name=f"{self._name}-{i}")
+            t.start()
+            self._threads.append(t)
+
+    def submit(self, fn, *args) -> bool:
+        try:
+            self._queue.put_nowait((time.monotonic(), fn, args))
+        except queue.Full:
+            with self._lock:
+                self._counters["rejected"] += 1
+            return False
+        with self._lock:
+            self._counters["accepted"] += 1
+        return True
+
+    def saturated(self) -> bool:
+        # Ha trabalho esperando: streams/long-poll devem liberar o worker.
+        return not self._queue.empty()
+
+    def _run(self) -> None:
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            enqueued_at, fn, args = item
+            waited = time.monotonic() - enqueued_at
+            with self._lock:
+                self._busy += 1
+                self._wait_total += waited
+                self._wait_count += 1
+                if waited > self._wait_max:
+                    self._wait_max = waited
+            ok = True
+            try:
+                fn(*args)
+            except Exception:
+                ok = False
+            finally:
+                with self._lock:
+                    self._busy -= 1
+                    self._counters["completed" if ok else "failed"] += 1
+
+    def shutdown(self) -> None:
+        for _ in self._threads:
+            self._queue.put(None)
+        self._threads.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(
+                self._counters,
+                workers=self.workers,
+                busy=self._busy,
+                queue_depth=self._queue.qsize(),
+                queue_size=self.queue_size,
+                wait_avg_ms=round(self._wait_total / self._wait_count * 1000, 2) if self._wait_count else 0.0,
+                wait_max_ms=round(self._wait_max * 1000, 2),
+            )
+
+
+class KeepAliveParker:
+    # Conexoes keep-alive ociosas ficam num selector, sem worker. Quando o socket fica
+    # legivel (proxima requisicao ou EOF) a conexao volta para o pool via on_ready; ociosa
+    # alem do prazo, vai para on_expired (fechar).
+    def __init__(self, on_ready, on_expired, name: str = "hub-keepalive"):
+        self._on_ready = on_ready
+        self._on_expired = on_expired
+        self._name = name
+        self._selector = selectors.DefaultSelector()
+        self._wake_r, self._wake_w = socket.socketpair()
+        self._wake_r.setblocking(False)
+        self._wake_w.setblocking(False)
+        self._selector.register(self._wake_r, selectors.EVENT_READ)
+        # Registro feito so pela thread do selector; os workers entregam por esta fila.
+        self._incoming: deque = deque()
+        self._parked: dict[socket.socket, tuple[object, float]] = {}
+        self._lock = threading.Lock()
+        self._thread: threading.Thread | None = None
+        self._closed = False
+        self._counters = {"parked": 0, "resumed": 0, "expired": 0}
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, daemon=True, name=self._name)
+        self._thread.start()
+
+    def park(self, sock: socket.socket, handler, idle_timeout: float) -> None:
+        with self._lock:
+            if self._closed:
+                closed = True
+            else:
+                closed = False
+                self._incoming.append((sock, handler, time.monotonic() + max(0.1, float(idle_timeout))))
+                self._counters["parked"] += 1
+        if closed:
+            self._on_expired(sock, handler)
+            return
+        self._wake()
+
+    def close(self) -> None:
+        with self._lock:
+            self._closed = True
+        self._wake()
+        if self._thread is not None:
+            self._thread.join(5)
+            self._thread = None
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self._counters, idle=len(self._parked) + len(self._incoming))
+
+    def _wake(self) -> None:
+        try:
+            self._wake_w.send(b"\0")
+        except OSError:
+            pass
+
+    def _run(self) -> None:
+        try:
+            while True:
+                with self._lock:
+                    closed = self._closed
+                    incoming = list(self._incoming)
+                    self._incoming.clear()
+                for sock, handler, deadline in incoming:
+                    try:
+                        self._selector.register(sock, selectors.EVENT_READ, handler)
+                    except (ValueError, OSError):
+                        self._on_expired(sock, handler)
+                        continue
+                    self._parked[sock] = (handler, deadline)
+                if closed:
+                    return
+                now = time.monotonic()
+                timeout = min([d for _, d in self._parked.values()], default=now + 1.0) - now
+                for key, _ in self._selector.select(max(0.0, min(1.0, timeout))):
+                    if key.fileobj is self._wake_r:
+                        try:
+                            while self._wake_r.recv(4096):
+                                pass
+                        except (BlockingIOError, InterruptedError):
+                            pass
+                        continue
+                    sock = key.fileobj
+                    self._selector.unregister(sock)
+                    handler, _ = self._parked.pop(sock)
+                    self._count("resumed")
+                    self._on_ready(sock, handler)
+                now = time.monotonic()
+                for sock in [s for s, (_, d) in self._parked.items() if d <= now]:
+                    self._selector.unregister(sock)
+                    handler, _ = self._parked.pop(sock)
+                    self._count("expired")
+                    self._on_expired(sock, handler)
+        finally:
+            for sock, (handler, _) in list(self._parked.items()):
+                self._on_expired(sock, handler)
+            self._parked.clear()
+            self._selector.close()
+            self._wake_r.close()
+            self._wake_w.close()
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._counters[name] += 1
+
+
+class PooledHTTPServer(HTTPServer):
+    # Substitui ThreadingHTTPServer: cada conexao aceita vai para o pool limitado
+    # em vez de ganhar uma thread propria; excedente recebe 503 + Retry-After.
+    # Entre requisicoes a conexao keep-alive fica no KeepAliveParker, sem ocupar worker.
+    request_queue_size = 128
+
+    def __init__(self, server_address, handler_class, pool: BoundedWorkerPool):
+        self.pool = pool
+        self.parker = KeepAliveParker(self._resume, self._close_parked)
+        super().__init__(server_address, handler_class)
+        self.parker.start()
+
+    def process_request(self, request, client_address):
+        if not self.pool.submit(self._process_in_worker, request, client_address):
+            self._reject(request)
+
+    def finish_request(self, request, client_address):
+        return self.RequestHandlerClass(request, client_address, self)
+
+    def _process_in_worker(self, request, client_address):
+        handler = None
+        try:
+            handler = self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        self._after_handle(request, handler)
+
+    def _resume(self, request, handler) -> None:
+        # Chamado pela thread do parker: a proxima requisicao ja chegou (ou o cliente fechou).
+        if not self.pool.submit(self._resume_in_worker, request, handler):
+            self._finish_handler(handler)
+            self._reject(request)
+
+    def _resume_in_worker(self, request, handler) -> None:
+        try:
+            handler.handle()
+        except Exception:
+            handler.parked = False
+            self.handle_error(request, handler.client_address)
+        if not handler.parked:
+            self._finish_handler(handler)
+        self._after_handle(request, handler)
+
+    def _close_parked(self, request, handler) -> None:
+        self._finish_handler(handler)
+        self.shutdown_request(request)
+
+    @staticmethod
+    def _finish_handler(handler) -> None:
+        handler.parked = False
+        try:
+            handler.finish()
+        except Exception:
+            pass
+
+    def _after_handle(self, request, handler) -> None:
+        if handler is not None and getattr(handler, "parked", False):
+            self.parker.park(request, handler, handler.timeout or 0)
+        else:
+            self.shutdown_request(request)
+
+    def server_close(self):
+        self.parker.close()
+        super().server_close()
+
+    def _reject(self, request: socket.socket) -> None:
+        try:
+            # Descarta o que ja chegou da requisicao: fechar com dados nao lidos gera RST
+            # e o cliente poderia perder o 503.
+            request.setblocking(False)
+            try:
+                request.recv(65536)
+            except (BlockingIOError, InterruptedError):
+                pass
+            request.settimeout(0.5)
+            request.sendall(_OVERLOAD_RESPONSE)
+        except OSError:
+            pass
+        self.shutdown_request(request)
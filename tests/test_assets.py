@@ -0,0 +1,55 @@
+from http.client import HTTPMessage
+
+from web.assets import AssetCache, cache_policy, refresh_policy
+
+
+def _headers(**items) -> HTTPMessage:
+    msg = HTTPMessage()
+    for k, v in items.items():
+        msg[k.replace("_", "-")] = v
+    return msg
+
+
+def test_no_cache_asset_stays_revalidating_after_304(tmp_path):
+    cache = AssetCache(tmp_path, 1024 * 1024, 0)
+    key = ("inst", "/static/app.js", "")
+    stored = _headers(Cache_Control="no-cache", ETag='"v1"', Content_Type="text/javascript")
+    entry = cache.put(key, 200, stored, b"x" * 10, *cache_policy(200, stored, 300.0))
+    assert entry is not None and not entry.fresh()
+
+    # 304 tipico: so validador e Date, sem Cache-Control.
+    not_modified = _headers(ETag='"v1"', Date="Sat, 17 Oct 2026 08:00:00 GMT")
+    policy = refresh_policy(entry, not_modified, 300.0)
+    assert policy == (0.0, True)
+    refreshed = cache.refresh(key, entry, not_modified, *policy)
+    assert not refreshed.fresh()
+    assert refreshed.header("Cache-Control") == "no-cache"
+
+
+def test_304_with_new_cache_control_replaces_stored_one(tmp_path):
+    cache = AssetCache(tmp_path, 1024 * 1024, 0)
+    key = ("inst", "/static/app.css", "")
+    stored = _headers(Cache_Control="max-age=0", ETag='"v1"')
+    entry = cache.put(key, 200, stored, b"body", *cache_policy(200, stored, 300.0))
+
+    ttl, must_revalidate = refresh_policy(entry, _headers(Cache_Control="max-age=60"), 300.0)
+    # Quem ja exigia revalidacao continua exigindo.
+    assert ttl == 60.0 and must_revalidate
+
+
+def test_disk_cache_keeps_odd_instance_ids_inside_root(tmp_path):
+    root = tmp_path / "assets"
+    cache = AssetCache(root, 0, 1024 * 1024)
+    headers = _headers(Cache_Control="max-age=60")
+    for instance_id in ("../escape", "a/b", "a_b", "con:1"):
+        cache.put((instance_id, "/static/x.js", ""), 200, headers, instance_id.encode(), 60.0, False)
+    assert not (tmp_path / "escape").exists()
+    assert all(p.parent.parent == root for p in root.glob("*/*.json"))
+    assert len(list(root.glob("*/*.json"))) == 4
+
+    reloaded = AssetCache(root, 0, 1024 * 1024)
+    assert reloaded.get(("a/b", "/static/x.js", "")).body == b"a/b"
+    assert reloaded.get(("a_b", "/static/x.js", "")).body == b"a_b"
+    assert reloaded.invalidate_instance("a/b") == 1
+    assert reloaded.get(("a/b", "/static/x.js", "")) is None
+    assert reloaded.get(("a_b", "/static/x.js", "")) is not None
@@ -0,0 +1,25 @@
+import io
+
+import pytest
+
+from web.bodies import MalformedChunkedBody, iter_chunked_body
+
+
+def _read(data: bytes, max_bytes: int = 0) -> bytes:
+    return b"".join(iter_chunked_body(io.BufferedReader(io.BytesIO(data)), max_bytes))
+
+
+def test_chunked_body_with_extension():
+    assert _read(b"10;ext=1\r\n" + b"A" * 16 + b"\r\n0\r\n\r\n") == b"A" * 16
+
+
+@pytest.mark.parametrize("size", [b"-100", b"0x10", b"1_0", b"+10", b""])
+def test_chunk_size_accepts_only_hex_digits(size):
+    with pytest.raises(MalformedChunkedBody):
+        _read(size + b"\r\n" + b"A" * 16 + b"\r\n0\r\n\r\n", max_bytes=8)
+
+
+def test_negative_chunk_cannot_bypass_limit():
+    data = b"-100\r\n\r\n100\r\n" + b"A" * 256 + b"\r\n0\r\n\r\n"
+    with pytest.raises(MalformedChunkedBody):
+        _read(data, max_bytes=8)
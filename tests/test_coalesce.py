@@ -0,0 +1,43 @@
+import asyncio
+
+import pytest
+
+from web.coalesce import SingleFlight
+
+
+def test_cancelled_leader_hands_call_to_a_follower():
+    async def scenario():
+        flight = SingleFlight()
+        calls = []
+
+        async def fetch():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return len(calls)
+
+        leader = asyncio.create_task(flight.do_async("k", fetch))
+        await asyncio.sleep(0.01)
+        followers = [asyncio.create_task(flight.do_async("k", fetch)) for _ in range(3)]
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return await asyncio.gather(*followers), flight.stats()
+
+    results, stats = asyncio.run(scenario())
+    assert [value for value, _ in results] == [2, 2, 2]
+    assert sorted(shared for _, shared in results) == [False, True, True]
+    assert stats["upstream_calls"] == 2 and stats["errors"] == 0 and stats["in_flight"] == 0
+
+
+def test_leader_error_is_shared_with_followers():
+    async def scenario():
+        flight = SingleFlight()
+
+        async def boom():
+            await asyncio.sleep(0.02)
+            raise ValueError("backend")
+
+        return await asyncio.gather(*[flight.do_async("k", boom) for _ in range(3)], return_exceptions=True)
+
+    assert all(isinstance(r, ValueError) for r in asyncio.run(scenario()))